@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+
+def default_cache_path(api_base):
+    """One cache file per server, under ~/.impact_chat (or IMPACT_CHAT_CACHE_DIR)."""
+    root = Path(os.environ.get("IMPACT_CHAT_CACHE_DIR") or Path.home() / ".impact_chat")
+    server = hashlib.sha1(api_base.encode()).hexdigest()[:12]
+    return root / f"history-{server}.db"
+
+
+class HistoryCache:
+    """Per-room history kept on disk between launches; thread-safe. Only a
+    sync moves the cursors, so events missed while offline still arrive."""
+
+    def __init__(self, path, keep_messages=2000):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.keep_messages = keep_messages
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._db.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS messages (
+                room_id TEXT, id INTEGER, data TEXT, PRIMARY KEY (room_id, id)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS attachments (
+                room_id TEXT, id INTEGER, data TEXT, PRIMARY KEY (room_id, id)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS cursors (
+                room_id TEXT PRIMARY KEY, since_id INTEGER, attachments_since_id INTEGER
+            );
+            """
+        )
+
+    def load(self, room_id, limit=200):
+        """Newest ``limit`` cached messages and all cached attachments,
+        oldest first."""
+        with self._lock:
+            messages = self._db.execute(
+                "SELECT data FROM messages WHERE room_id = ? ORDER BY id DESC LIMIT ?",
+                (room_id, limit),
+            ).fetchall()
+            attachments = self._db.execute(
+                "SELECT data FROM attachments WHERE room_id = ? ORDER BY id", (room_id,)
+            ).fetchall()
+        return (
+            [json.loads(d) for (d,) in reversed(messages)],
+            [json.loads(d) for (d,) in attachments],
+        )
+
+    def cursors(self, room_id):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT since_id, attachments_since_id FROM cursors WHERE room_id = ?", (room_id,)
+            ).fetchone()
+        return row or (None, None)
+
+    def add_message(self, msg):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO messages (room_id, id, data) VALUES (?, ?, ?)",
+                (msg["room_id"], msg["id"], json.dumps(msg)),
+            )
+
+    def add_attachments(self, items):
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO attachments (room_id, id, data) VALUES (?, ?, ?)",
+                [(a["room_id"], a["id"], json.dumps(a)) for a in items],
+            )
+
+    def apply_sync(self, room_id, delta):
+        """Store one ``/chat/sync`` response and advance the cursors."""
+        with self._lock:
+            db = self._db
+            db.execute("BEGIN")
+            try:
+                db.executemany(
+                    "INSERT OR REPLACE INTO messages (room_id, id, data) VALUES (?, ?, ?)",
+                    [(room_id, m["id"], json.dumps(m)) for m in delta["messages"]],
+                )
+                db.executemany(
+                    "INSERT OR REPLACE INTO attachments (room_id, id, data) VALUES (?, ?, ?)",
+                    [(room_id, a["id"], json.dumps(a)) for a in delta["attachments"]],
+                )
+                # Attachments expire on the server; drop the ones it no longer has
+                min_id = delta.get("attachments_min_id")
+                if min_id is None:
+                    db.execute("DELETE FROM attachments WHERE room_id = ?", (room_id,))
+                else:
+                    db.execute(
+                        "DELETE FROM attachments WHERE room_id = ? AND id < ?", (room_id, min_id)
+                    )
+                db.execute(
+                    "DELETE FROM messages WHERE room_id = ? AND id <= ("
+                    "SELECT id FROM messages WHERE room_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                    (room_id, room_id, self.keep_messages),
+                )
+                db.execute(
+                    "INSERT OR REPLACE INTO cursors (room_id, since_id, attachments_since_id) "
+                    "VALUES (?, ?, ?)",
+                    (room_id, delta["since_id"], delta["attachments_since_id"]),
+                )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    def forget(self, room_id):
+        """Drop a room's cache, e.g. for a room the user no longer follows."""
+        with self._lock:
+            for table in ("messages", "attachments", "cursors"):
+                self._db.execute(f"DELETE FROM {table} WHERE room_id = ?", (room_id,))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
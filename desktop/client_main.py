@@ -1,24 +1,111 @@
+import logging
 import os
 import sys
 import threading
+import bisect
+import time
 import mimetypes
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import requests
 import socketio
 from PySide6 import QtCore, QtGui, QtWidgets
+from requests.adapters import HTTPAdapter
 from client_config import API_BASE, SOCKET_URL
+from client_cache import HistoryCache, default_cache_path
+
+
+# Concurrent requests; also the keep-alive connections kept per host
+IO_WORKERS = 4
+# /chat/sync calls before a far-behind cache is dropped for the newest page
+SYNC_MAX_ROUNDS = 20
+
+logger = logging.getLogger(__name__)
+
+
+class Worker(QtCore.QObject):
+    """Runs blocking Api calls on a thread pool; ``done`` / ``failed`` are
+    called on the thread that created the worker."""
+
+    _finished = QtCore.Signal(object, object, object)
+
+    def __init__(self, workers=IO_WORKERS):
+        super().__init__()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api")
+        # Emitted from pool threads, so Qt queues the slot onto our thread
+        self._finished.connect(self._deliver, QtCore.Qt.QueuedConnection)
+
+    def submit(self, fn, *args, done=None, failed=None):
+        future = self._pool.submit(fn, *args)
+        future.add_done_callback(lambda f: self._finished.emit(f, done, failed))
+        return future
+
+    def gather(self, calls, done=None, failed=None):
+        """Run independent ``(fn, *args)`` calls side by side; ``done`` gets
+        the list of results once all are in, or ``failed`` the first error."""
+        results = [None] * len(calls)
+        pending = set(range(len(calls)))
+
+        def finish(i, value):
+            if not pending:  # an earlier call failed
+                return
+            results[i] = value
+            pending.discard(i)
+            if not pending and done is not None:
+                done(results)
+
+        def fail(ex):
+            if pending:
+                pending.clear()
+                if failed is not None:
+                    failed(ex)
+
+        if not calls and done is not None:
+            done(results)
+        for i, (fn, *args) in enumerate(calls):
+            self.submit(fn, *args, done=lambda value, i=i: finish(i, value), failed=fail)
+
+    @QtCore.Slot(object, object, object)
+    def _deliver(self, future, done, failed):
+        if future.cancelled():
+            return
+        ex = future.exception()
+        if ex is None:
+            if done is not None:
+                done(future.result())
+        elif failed is not None:
+            failed(ex)
+        else:
+            sys.excepthook(type(ex), ex, ex.__traceback__)
+
+    def shutdown(self):
+        """Drop queued calls and don't wait for running ones (e.g. an
+        upload) on exit."""
+        self._pool.shutdown(wait=False, cancel_futures=True)
 
 
 class Api:
+    """Blocking calls to the server. The UI runs them through
+    ``self.worker``; they share one keep-alive session, which is safe to
+    use from the worker threads."""
+
     def __init__(self):
         self.base = API_BASE.rstrip("/")
         self.token = None
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=IO_WORKERS)
+        self.http.mount("http://", adapter)
+        self.http.mount("https://", adapter)
+        self.worker = Worker()
+        # socketio.Client, set once the chat window's socket is connected
+        self.sio = None
+        self.cache = HistoryCache(default_cache_path(self.base))
 
     def _auth(self):
         return {"Authorization": f"Bearer {self.token}"} if self.token else {}
 
     def register(self, email, password, name, gender="unspecified"):
-        r = requests.post(
+        r = self.http.post(
             f"{self.base}/auth/register",
             json={"email": email, "password": password, "name": name, "gender": gender},
         )
@@ -27,7 +114,7 @@ class Api:
         return r.json()
 
     def login(self, email, password):
-        r = requests.post(
+        r = self.http.post(
             f"{self.base}/auth/login",
             json={"email": email, "password": password},
         )
@@ -36,17 +123,17 @@ class Api:
         return r.json()
 
     def countries(self):
-        r = requests.get(f"{self.base}/rooms/countries")
+        r = self.http.get(f"{self.base}/rooms/countries")
         r.raise_for_status()
         return r.json()
 
     def rooms(self, code):
-        r = requests.get(f"{self.base}/rooms", params={"code": code})
+        r = self.http.get(f"{self.base}/rooms", params={"code": code})
         r.raise_for_status()
         return r.json()
 
     def create_room(self, code, name):
-        r = requests.post(
+        r = self.http.post(
             f"{self.base}/rooms/create",
             params={"code": code, "name": name},
             headers=self._auth(),
@@ -55,24 +142,106 @@ class Api:
             raise requests.HTTPError(r.json().get("detail"))
         return r.json()
 
-    def list_messages(self, room_id, limit=50):
-        r = requests.get(
+    def list_messages(self, room_id, limit=50, before_id=None, after_id=None):
+        r = self.http.get(
             f"{self.base}/chat/messages",
-            params={"room_id": room_id, "limit": limit},
+            params={
+                "room_id": room_id,
+                "limit": limit,
+                "before_id": before_id,
+                "after_id": after_id,
+            },
         )
         r.raise_for_status()
         return r.json()
 
-    def list_attachments(self, room_id, limit=50):
-        r = requests.get(
+    def list_attachments(self, room_id, limit=50, before_id=None, after_id=None):
+        r = self.http.get(
             f"{self.base}/chat/attachments",
-            params={"room_id": room_id, "limit": limit},
+            params={
+                "room_id": room_id,
+                "limit": limit,
+                "before_id": before_id,
+                "after_id": after_id,
+            },
         )
         r.raise_for_status()
         return r.json()
 
+    def sync(self, room_id, since_id=None, attachments_since_id=None, limit=200):
+        r = self.http.get(
+            f"{self.base}/chat/sync",
+            params={
+                "room_id": room_id,
+                "since_id": since_id,
+                "attachments_since_id": attachments_since_id,
+                "limit": limit,
+            },
+        )
+        r.raise_for_status()
+        return r.json()
+
+    def open_room(self, room_id):
+        """Cached (messages, attachments) to render before any request."""
+        return self.cache.load(room_id)
+
+    def sync_room(self, room_id):
+        """Fetch only what the cache is missing for a room, store it, and
+        return ``(messages, attachments, fresh)``. A cache too far behind
+        is dropped for the room's newest page, with ``fresh`` set."""
+        since_id, attachments_since_id = self.cache.cursors(room_id)
+        messages, attachments = [], []
+        for _ in range(SYNC_MAX_ROUNDS):
+            delta = self.sync(room_id, since_id, attachments_since_id)
+            self.cache.apply_sync(room_id, delta)
+            messages += delta["messages"]
+            attachments += delta["attachments"]
+            if not delta["has_more"]:
+                return messages, attachments, False
+            since_id, attachments_since_id = delta["since_id"], delta["attachments_since_id"]
+
+        # Older history pages in on scroll like for a room never opened
+        self.cache.forget(room_id)
+        delta = self.sync(room_id)
+        self.cache.apply_sync(room_id, delta)
+        return delta["messages"], delta["attachments"], True
+
+    def load_older(self, room_id, before_id, attachments_before_id, done, failed=None):
+        """Fetch the pages before the oldest loaded message and attachment
+        side by side; ``done`` gets the two page bodies."""
+        self.worker.gather(
+            [
+                (self.list_messages, room_id, 50, before_id),
+                (self.list_attachments, room_id, 50, attachments_before_id),
+            ],
+            done=lambda pages: done(*pages),
+            failed=failed,
+        )
+
+    def load_newer(self, room_id, after_id, attachments_after_id, done, failed=None):
+        """Counterpart of :meth:`load_older` for coming back down to the
+        present after the timeline let go of its newest rows."""
+        self.worker.gather(
+            [
+                (self.list_messages, room_id, 50, None, after_id),
+                (self.list_attachments, room_id, 50, None, attachments_after_id),
+            ],
+            done=lambda pages: done(*pages),
+            failed=failed,
+        )
+
     def send_message(self, room_id, text):
-        r = requests.post(
+        # Over the already-authenticated socket when we have one: no new
+        # request, form parsing or auth, and the ack carries the stored id
+        if self.sio is not None and self.sio.connected:
+            ack = self.sio.call(
+                "send_message", {"room_id": room_id, "text": text}, timeout=10
+            )
+            if not ack or not ack.get("ok"):
+                raise requests.HTTPError((ack or {}).get("error", "send failed"))
+            return ack["message"]
+
+        r = self.http.post(
             f"{self.base}/chat/message",
             data={"room_id": room_id, "text": text},
             headers=self._auth(),
@@ -82,32 +251,77 @@ class Api:
         return r.json()
 
     def upload_files(self, room_id, paths):
-        files = [
-            (
-                "files",
-                (
-                    Path(p).name,
-                    open(p, "rb"),
-                    mimetypes.guess_type(p)[0] or "application/octet-stream",
-                ),
-            )
-            for p in paths
-        ]
-        try:
-            r = requests.post(
-                f"{self.base}/chat/upload",
-                headers=self._auth(),
-                files=files,
-                data={"room_id": room_id},
-            )
-        finally:
-            for _, f in files:
-                f[1].close()
+        """Upload several files and finish them with one call, so the room
+        gets a single ``files_uploaded`` event for the whole drop."""
+        ids = [self._send_file(room_id, p) for p in paths]
+        r = self.http.post(
+            f"{self.base}/chat/uploads/complete", headers=self._auth(), data={"ids": ids}
+        )
+        if r.status_code >= 400:
+            raise requests.HTTPError(r.text)
+        return r.json()
 
+    def upload_file(self, room_id, path):
+        url = f"{self.base}/chat/uploads/{self._send_file(room_id, path)}"
+        r = self.http.post(f"{url}/complete", headers=self._auth())
         if r.status_code >= 400:
             raise requests.HTTPError(r.text)
         return r.json()
 
+    def _send_file(self, room_id, path, retries=5):
+        """Send a file through the resumable upload API; returns the upload id."""
+        size = os.path.getsize(path)
+        r = self.http.post(
+            f"{self.base}/chat/uploads",
+            headers=self._auth(),
+            data={
+                "room_id": room_id,
+                "filename": Path(path).name,
+                "size_bytes": size,
+                "mime_type": mimetypes.guess_type(path)[0] or "application/octet-stream",
+            },
+        )
+        if r.status_code >= 400:
+            raise requests.HTTPError(r.text)
+        status = r.json()
+        url = f"{self.base}/chat/uploads/{status['id']}"
+        offset, chunk_size = status["offset"], status["chunk_size"]
+        failures = 0
+
+        with open(path, "rb") as f:
+            while offset < size:
+                f.seek(offset)
+                chunk = f.read(chunk_size)
+                try:
+                    r = self.http.put(
+                        url,
+                        params={"offset": offset},
+                        headers=self._auth(),
+                        data=chunk,
+                        timeout=(10, 120),
+                    )
+                except (requests.ConnectionError, requests.Timeout):
+                    failures += 1
+                    if failures > retries:
+                        raise
+                    time.sleep(min(2 ** failures, 30))
+                    r = self.http.get(url, headers=self._auth(), timeout=10)
+                    if r.status_code >= 400:
+                        raise requests.HTTPError(r.text)
+                    offset = r.json()["offset"]
+                    continue
+
+                if r.status_code == 409:
+                    # Server has a different offset (e.g. a partial chunk landed)
+                    offset = r.json()["detail"]["offset"]
+                    continue
+                if r.status_code >= 400:
+                    raise requests.HTTPError(r.text)
+                offset = r.json()["offset"]
+                failures = 0
+
+        return status["id"]
+
 
 class LoginDialog(QtWidgets.QDialog):
     def __init__(self, api: Api):
@@ -134,6 +348,7 @@ class LoginDialog(QtWidgets.QDialog):
         bR = QtWidgets.QPushButton("Register")
         bL.clicked.connect(self.login)
         bR.clicked.connect(self.register)
+        self.buttons = (bL, bR)
 
         f = QtWidgets.QFormLayout()
         f.addRow("Email", self.e)
@@ -150,26 +365,43 @@ class LoginDialog(QtWidgets.QDialog):
         v.addLayout(h)
         v.addWidget(self.s)
 
+    def _busy(self, busy):
+        for b in self.buttons:
+            b.setEnabled(not busy)
+
+    def _done(self, d):
+        self._busy(False)
+        self.username = d["user"]["name"]
+        self.accept()
+
+    def _failed(self, what):
+        def show(ex):
+            self._busy(False)
+            self.s.setText(f"{what} failed: {ex}")
+
+        return show
+
     def login(self):
-        try:
-            d = self.api.login(self.e.text().strip(), self.p.text())
-            self.username = d["user"]["name"]
-            self.accept()
-        except Exception as ex:
-            self.s.setText(f"Login failed: {ex}")
+        self._busy(True)
+        self.api.worker.submit(
+            self.api.login,
+            self.e.text().strip(),
+            self.p.text(),
+            done=self._done,
+            failed=self._failed("Login"),
+        )
 
     def register(self):
-        try:
-            d = self.api.register(
-                self.e.text().strip(),
-                self.p.text(),
-                self.n.text().strip(),
-                self.g.currentText(),
-            )
-            self.username = d["user"]["name"]
-            self.accept()
-        except Exception as ex:
-            self.s.setText(f"Register failed: {ex}")
+        self._busy(True)
+        self.api.worker.submit(
+            self.api.register,
+            self.e.text().strip(),
+            self.p.text(),
+            self.n.text().strip(),
+            self.g.currentText(),
+            done=self._done,
+            failed=self._failed("Register"),
+        )
 
 
 class JoinDialog(QtWidgets.QDialog):
@@ -207,6 +439,544 @@ class JoinDialog(QtWidgets.QDialog):
         self.c.currentIndexChanged.connect(self.refresh)
         self.load()
 
+    def _error(self, ex):
+        self.s.setText(str(ex))
+
+    def load(self):
+        self.api.worker.submit(self.api.countries, done=self._countries, failed=self._error)
+
+    def _countries(self, countries):
+        self.c.clear()
+        for country in countries:
+            self.c.addItem(country["name"], country["code"])
+
+    def refresh(self):
+        code = self.c.currentData()
+        if not code:
+            return
+        self.api.worker.submit(
+            self.api.rooms, code, done=lambda rooms: self._rooms(code, rooms), failed=self._error
+        )
+
+    def _rooms(self, code, rooms, select=None):
+        # Answers for a country the user has already moved away from
+        if code != self.c.currentData():
+            return
+        self.r.clear()
+        for room in rooms:
+            self.r.addItem(room["name"], room["id"])
+        if select is not None:
+            self.r.setCurrentIndex(self.r.findData(select))
+
+    def create(self):
+        code, name = self.c.currentData(), self.new.text().strip()
+        if not code or not name:
+            return
+
+        def created(room):
+            self.new.clear()
+            self.s.setText(f"Created {room['name']}")
+            self.api.worker.submit(
+                self.api.rooms,
+                code,
+                done=lambda rooms: self._rooms(code, rooms, select=room["id"]),
+                failed=self._error,
+            )
+
+        self.api.worker.submit(self.api.create_room, code, name, done=created, failed=self._error)
+
+
+KINDS = ("message", "attachment")
+
+
+class TimelineModel(QtCore.QAbstractListModel):
+    """A room's messages and attachments in time order, at most ``max_rows``
+    at a time; the far end is let go and paged back in on scroll."""
+
+    ItemRole = QtCore.Qt.UserRole + 1
+    KindRole = QtCore.Qt.UserRole + 2
+
+    _arrived = QtCore.Signal(str, object)
+    # Human-readable load errors, for the window's status bar
+    failed = QtCore.Signal(str)
+
+    def __init__(self, api: Api, max_rows=3000, parent=None):
+        super().__init__(parent)
+        self.api = api
+        self.max_rows = max_rows
+        self.room_id = None
+        self._clear()
+        self._frame = QtCore.QTimer(self, singleShot=True, interval=16)
+        self._frame.timeout.connect(self._flush)
+        self._arrived.connect(self._queue)
+
+    def _clear(self):
+        self._rows = []  # (kind, item)
+        self._keys = []  # parallel sort keys
+        self._ids = set()
+        # Fetched rows beyond what the window reaches yet, by (kind, id)
+        self._held_older = {}
+        self._held_newer = {}
+        # Per kind: ids just outside the window, and whether more is there
+        self._before = dict.fromkeys(KINDS)
+        self._after = dict.fromkeys(KINDS)
+        self._more_older = dict.fromkeys(KINDS, True)
+        self._more_newer = dict.fromkeys(KINDS, False)
+        self._loading = False
+        self._pending = []
+
+    @property
+    def _has_newer(self):
+        return any(self._more_newer.values())
+
+    # -- Qt model API ---------------------------------------------------
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        kind, item = self._rows[index.row()]
+        if role == QtCore.Qt.DisplayRole:
+            if kind == "message":
+                return f"{item['username']}: {item['text']}"
+            size_kb = max(1, round(item["size_bytes"] / 1024))
+            return f"{item['username']} shared {item['original_name']} ({size_kb} KB)"
+        if role == QtCore.Qt.ToolTipRole:
+            return item["created_at"]
+        if role == self.ItemRole:
+            return item
+        if role == self.KindRole:
+            return kind
+        return None
+
+    def canFetchMore(self, parent=QtCore.QModelIndex()):
+        return not parent.isValid() and self._has_newer and not self._loading
+
+    def fetchMore(self, parent=QtCore.QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        self._loading = True
+        room_id = self.room_id
+        self.api.load_newer(
+            room_id,
+            self._edge("message", oldest=False),
+            self._edge("attachment", oldest=False),
+            done=lambda messages, attachments: self._newer_loaded(room_id, messages, attachments),
+            failed=self._load_failed,
+        )
+
+    # -- loading --------------------------------------------------------
+
+    def open(self, room_id):
+        """Show a room: cached history at once, then whatever /chat/sync
+        adds."""
+        messages, attachments = self.api.open_room(room_id)
+        self.beginResetModel()
+        self.room_id = room_id
+        self._clear()
+        self.endResetModel()
+        self._add(_rows(messages, attachments))
+        self.api.worker.submit(
+            self.api.sync_room,
+            room_id,
+            done=lambda items: self._synced(room_id, *items),
+            failed=self._load_failed,
+        )
+
+    def can_fetch_older(self):
+        return self.room_id is not None and not self._loading and any(self._more_older.values())
+
+    def fetch_older(self):
+        if not self.can_fetch_older():
+            return
+        self._loading = True
+        room_id = self.room_id
+        self.api.load_older(
+            room_id,
+            self._edge("message", oldest=True),
+            self._edge("attachment", oldest=True),
+            done=lambda messages, attachments: self._older_loaded(room_id, messages, attachments),
+            failed=self._load_failed,
+        )
+
+    def _edge(self, kind, oldest):
+        # Paging cursor: the furthest id of a kind fetched in that direction
+        held = self._held_older if oldest else self._held_newer
+        ids = [item["id"] for k, item in held.values() if k == kind]
+        if ids:
+            return min(ids) if oldest else max(ids)
+        for k, item in self._rows if oldest else reversed(self._rows):
+            if k == kind:
+                return item["id"]
+        return self._before[kind] if oldest else self._after[kind]
+
+    def _synced(self, room_id, messages, attachments, fresh):
+        if room_id != self.room_id:
+            return
+        if fresh:
+            # The cached rows shown so far don't join up with these
+            self.beginResetModel()
+            self._clear()
+            self.endResetModel()
+        if not self._has_newer:
+            self._add(_rows(messages, attachments))
+
+    def _older_loaded(self, room_id, messages, attachments):
+        if room_id != self.room_id:
+            return
+        self._loading = False
+        self._more_older = {"message": messages["has_more"], "attachment": attachments["has_more"]}
+        added = self._add(_rows(messages["items"], attachments["items"]), keep_newest=False)
+        # Everything went to the held rows; the view is still at the top
+        if not added:
+            self.fetch_older()
+
+    def _newer_loaded(self, room_id, messages, attachments):
+        if room_id != self.room_id:
+            return
+        self._loading = False
+        self._more_newer = {"message": messages["has_more"], "attachment": attachments["has_more"]}
+        if not self._add(_rows(messages["items"], attachments["items"])):
+            self.fetchMore()
+
+    def _load_failed(self, ex):
+        self._loading = False
+        logger.warning("Loading history failed: %s", ex)
+        self.failed.emit(f"Loading history failed: {ex}")
+
+    # -- live events ----------------------------------------------------
+
+    def queue_live(self, kind, item):
+        """Add a ``chat_message`` / ``file_uploaded`` payload; safe to call
+        from the socket thread. Also stored in the history cache."""
+        if kind == "message":
+            self.api.cache.add_message(item)
+        else:
+            self.api.cache.add_attachments([item])
+        self._arrived.emit(kind, item)
+
+    @QtCore.Slot(str, object)
+    def _queue(self, kind, item):
+        if item.get("room_id") != self.room_id:
+            return
+        self._pending.append((kind, item))
+        if not self._frame.isActive():
+            self._frame.start()
+
+    def _flush(self):
+        pending, self._pending = self._pending, []
+        # Scrolled back into history: these come with the next fetchMore
+        if not self._has_newer:
+            self._add(pending)
+
+    # -- row bookkeeping ------------------------------------------------
+
+    def _add(self, rows, keep_newest=True):
+        """Insert rows not loaded yet; returns how many went in."""
+        incoming = {(kind, item["id"]): (kind, item) for kind, item in rows}
+        incoming.update(self._held_older)
+        incoming.update(self._held_newer)
+        self._held_older, self._held_newer = {}, {}
+        floor = self._bound(incoming.values(), oldest=True)
+        ceiling = self._bound(incoming.values(), oldest=False)
+        rows = []
+        for key, row in incoming.items():
+            if key in self._ids:
+                continue
+            if floor is not None and self._key(row) < floor:
+                self._held_older[key] = row
+            elif ceiling is not None and self._key(row) > ceiling:
+                self._held_newer[key] = row
+            else:
+                rows.append(row)
+        rows.sort(key=self._key)
+
+        # Mostly one block at either end
+        i = 0
+        while i < len(rows):
+            pos = bisect.bisect(self._keys, self._key(rows[i]))
+            j = i + 1
+            while j < len(rows) and (pos == len(self._keys) or self._key(rows[j]) < self._keys[pos]):
+                j += 1
+            block = rows[i:j]
+            self.beginInsertRows(QtCore.QModelIndex(), pos, pos + len(block) - 1)
+            self._rows[pos:pos] = block
+            self._keys[pos:pos] = [self._key(r) for r in block]
+            self._ids.update((kind, item["id"]) for kind, item in block)
+            self.endInsertRows()
+            i = j
+
+        excess = len(self._rows) - self.max_rows
+        if excess > 0:
+            self._evict(excess, newest=not keep_newest)
+        return len(rows)
+
+    def _bound(self, incoming, oldest):
+        # Each kind pages through time at its own pace. Rows past the point
+        # every unfinished kind has reached would sit next to a stretch of
+        # the other kind that isn't loaded yet, so they wait
+        more = self._more_older if oldest else self._more_newer
+        bound = None
+        for kind in KINDS:
+            if not more[kind]:
+                continue
+            keys = [self._key(row) for row in incoming if row[0] == kind]
+            resident = next((k for k in (self._keys if oldest else reversed(self._keys)) if k[1] == kind), None)
+            if resident is not None:
+                keys.append(resident)
+            if not keys:
+                continue
+            if oldest:
+                bound = max(bound, min(keys)) if bound is not None else min(keys)
+            else:
+                bound = min(bound, max(keys)) if bound is not None else max(keys)
+        return bound
+
+    def _evict(self, count, newest):
+        start = len(self._rows) - count if newest else 0
+        gone = self._rows[start : start + count]
+        self.beginRemoveRows(QtCore.QModelIndex(), start, start + count - 1)
+        del self._rows[start : start + count]
+        del self._keys[start : start + count]
+        self._ids.difference_update((kind, item["id"]) for kind, item in gone)
+        self.endRemoveRows()
+
+        # Rows held beyond the evicted end go too; page back in from just
+        # past what is still loaded
+        held = self._held_newer if newest else self._held_older
+        gone += held.values()
+        held.clear()
+        for kind in KINDS:
+            ids = [item["id"] for k, item in gone if k == kind]
+            if not ids:
+                continue
+            if newest:
+                self._after[kind] = min(ids) - 1
+                self._more_newer[kind] = True
+            else:
+                self._before[kind] = max(ids) + 1
+                self._more_older[kind] = True
+
+    @staticmethod
+    def _key(row):
+        kind, item = row
+        return (item["created_at"], kind, item["id"])
+
+
+def _rows(messages, attachments):
+    return [("message", m) for m in messages] + [("attachment", a) for a in attachments]
+
+
+class TimelineView(QtWidgets.QListView):
+    """List view for a :class:`TimelineModel` that pages on scroll without jumping."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWordWrap(True)
+        self.setVerticalScrollMode(QtWidgets.QAbstractItemView.ScrollPerPixel)
+        # Lay rows out a screenful at a time rather than all up front
+        self.setLayoutMode(QtWidgets.QListView.Batched)
+        self.setBatchSize(100)
+        self.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self._anchor = None
+        self._follow = True
+        self.verticalScrollBar().valueChanged.connect(self._scrolled)
+
+    def setModel(self, model):
+        super().setModel(model)
+        model.rowsAboutToBeInserted.connect(self._before_insert)
+        model.rowsInserted.connect(self._after_insert)
+        model.modelReset.connect(self._reset)
+
+    def _scrolled(self, value):
+        bar = self.verticalScrollBar()
+        self._follow = value >= bar.maximum() - 4
+        model = self.model()
+        if value == bar.minimum() and model.can_fetch_older():
+            model.fetch_older()
+        elif value == bar.maximum() and model.canFetchMore():
+            model.fetchMore()
+
+    def _reset(self):
+        self._follow = True
+
+    def _before_insert(self, parent, first, last):
+        top = self.indexAt(QtCore.QPoint(0, 0))
+        self._anchor = top.row() if top.isValid() and first <= top.row() else None
+
+    def _after_insert(self, parent, first, last):
+        if self._anchor is not None:
+            # Rows went in above what the user is reading: keep it in place
+            self.scrollTo(
+                self.model().index(self._anchor + last - first + 1),
+                QtWidgets.QAbstractItemView.PositionAtTop,
+            )
+            self._anchor = None
+        elif self._follow:
+            self.scrollToBottom()
+
+
+class ChatWindow(QtWidgets.QMainWindow):
+    """One room: the timeline, an input line and the room's socket."""
+
+    # Socket.IO handlers run on the client's thread; these hop to ours
+    _connected = QtCore.Signal()
+    _typing = QtCore.Signal(list)
+
+    def __init__(self, api: Api, room_id, room_name, username):
+        super().__init__()
+        self.api = api
+        self.room_id = room_id
+        self.username = username
+        self.setWindowTitle(f"Impact Chat — {room_name}")
+        self.resize(720, 640)
+
+        self.model = TimelineModel(api, parent=self)
+        self.view = TimelineView()
+        self.view.setModel(self.model)
+        self.model.failed.connect(self.statusBar().showMessage)
+
+        self.typists = QtWidgets.QLabel()
+        self.input = QtWidgets.QLineEdit()
+        self.input.setPlaceholderText("message")
+        self.input.returnPressed.connect(self.send)
+        self.input.textEdited.connect(self._typed)
+        bS = QtWidgets.QPushButton("Send")
+        bA = QtWidgets.QPushButton("Attach…")
+        bS.clicked.connect(self.send)
+        bA.clicked.connect(self.attach)
+
+        h = QtWidgets.QHBoxLayout()
+        h.addWidget(self.input)
+        h.addWidget(bS)
+        h.addWidget(bA)
+
+        body = QtWidgets.QWidget()
+        v = QtWidgets.QVBoxLayout(body)
+        v.addWidget(self.view)
+        v.addWidget(self.typists)
+        v.addLayout(h)
+        self.setCentralWidget(body)
+
+        # Typing notices at most every 2 s while the user keeps typing
+        self._typing_sent = QtCore.QElapsedTimer()
+        self._connected.connect(self._joined)
+        self._typing.connect(self._show_typists)
+        self._first_connect = True
+        self.sio = self._socket()
+        self.model.open(room_id)
+
+    def _socket(self):
+        sio = socketio.Client(reconnection=True)
+
+        @sio.event
+        def connect():
+            sio.emit("join_room", {"room_id": self.room_id})
+            self._connected.emit()
+
+        @sio.on("chat_message")
+        def chat_message(data):
+            self.model.queue_live("message", data)
+
+        @sio.on("file_uploaded")
+        def file_uploaded(data):
+            self.model.queue_live("attachment", data)
+
+        @sio.on("files_uploaded")
+        def files_uploaded(data):
+            for item in data["items"]:
+                self.model.queue_live("attachment", item)
+
+        @sio.on("typing_batch")
+        def typing_batch(data):
+            if data.get("room") == self.room_id:
+                self._typing.emit(data["users"])
+
+        self.api.worker.submit(
+            lambda: sio.connect(
+                SOCKET_URL, auth={"token": self.api.token}, transports=["websocket"]
+            ),
+            done=lambda _: setattr(self.api, "sio", sio),
+            failed=lambda ex: self.statusBar().showMessage(f"Live updates unavailable: {ex}"),
+        )
+        return sio
+
+    def _joined(self):
+        if self._first_connect:
+            self._first_connect = False
+            return
+        # Back after a drop or a slow-consumer resync: fetch what we missed
+        self.statusBar().showMessage("Reconnected", 3000)
+        self.model.open(self.room_id)
+
+    def _show_typists(self, users):
+        others = [u for u in users if u != self.username]
+        self.typists.setText(f"{', '.join(others)} typing…" if others else "")
+
+    def _typed(self, _text):
+        if not self.sio.connected:
+            return
+        if self._typing_sent.isValid() and self._typing_sent.elapsed() < 2000:
+            return
+        self._typing_sent.start()
+        self.api.worker.submit(self.sio.emit, "typing", {"room_id": self.room_id})
+
+    def send(self):
+        text = self.input.text().strip()
+        if not text:
+            return
+        self.input.clear()
+        self.api.worker.submit(
+            self.api.send_message,
+            self.room_id,
+            text,
+            # The broadcast brings it too; the timeline skips the duplicate
+            done=lambda m: self.model.queue_live("message", m),
+            failed=lambda ex: self.statusBar().showMessage(f"Send failed: {ex}"),
+        )
+
+    def attach(self):
+        paths, _ = QtWidgets.QFileDialog.getOpenFileNames(self, "Attach files")
+        if not paths:
+            return
+        if len(paths) > 1:
+            call = (self.api.upload_files, self.room_id, paths)
+        else:
+            call = (self.api.upload_file, self.room_id, paths[0])
+        self.statusBar().showMessage(f"Uploading {len(paths)} file(s)…")
+        self.api.worker.submit(
+            *call,
+            done=lambda _: self.statusBar().showMessage("Uploaded", 3000),
+            failed=lambda ex: self.statusBar().showMessage(f"Upload failed: {ex}"),
+        )
+
+    def closeEvent(self, event):
+        self.api.sio = None
+        if self.sio.connected:
+            self.sio.disconnect()
+        super().closeEvent(event)
+
+
+class App(QtWidgets.QApplication):
+    def run(self):
+        api = Api()
+        try:
+            login = LoginDialog(api)
+            if login.exec() != QtWidgets.QDialog.Accepted:
+                return 0
+            join = JoinDialog(api)
+            if join.exec() != QtWidgets.QDialog.Accepted or join.r.currentData() is None:
+                return 0
+            window = ChatWindow(api, join.r.currentData(), join.r.currentText(), login.username)
+            window.show()
+            return self.exec()
+        finally:
+            api.worker.shutdown()
+            api.cache.close()
+
 
+logging.basicConfig(level=logging.INFO)
 app = App(sys.argv)
 sys.exit(app.run())
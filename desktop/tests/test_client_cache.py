@@ -0,0 +1,88 @@
+import pytest
+from client_cache import HistoryCache, default_cache_path
+
+
+@pytest.fixture
+def cache(tmp_path):
+    c = HistoryCache(tmp_path / "history.db", keep_messages=3)
+    yield c
+    c.close()
+
+
+def _msg(i, room="r1"):
+    return {"id": i, "room_id": room, "text": f"m{i}"}
+
+
+def _att(i, room="r1"):
+    return {"id": i, "room_id": room, "original_name": f"f{i}.txt"}
+
+
+def _delta(messages=(), attachments=(), since_id=None, attachments_since_id=None, min_id=None):
+    return {
+        "messages": list(messages),
+        "attachments": list(attachments),
+        "since_id": since_id,
+        "attachments_since_id": attachments_since_id,
+        "attachments_min_id": min_id,
+    }
+
+
+def test_sync_merges_and_moves_the_cursors(cache):
+    assert cache.cursors("r1") == (None, None)
+    cache.apply_sync("r1", _delta([_msg(1), _msg(2)], [_att(1)], 2, 1, min_id=1))
+    # A live event and then a sync that repeats it: stored once, newest copy
+    cache.add_message(_msg(3))
+    edited = dict(_msg(3), text="edited")
+    cache.apply_sync("r1", _delta([edited], [_att(2)], 3, 2, min_id=1))
+
+    messages, attachments = cache.load("r1")
+    assert messages == [_msg(1), _msg(2), edited]
+    assert [a["id"] for a in attachments] == [1, 2]
+    assert cache.cursors("r1") == (3, 2)
+
+
+def test_live_events_do_not_move_the_cursors(cache):
+    cache.apply_sync("r1", _delta([_msg(1)], since_id=1))
+    cache.add_message(_msg(2))
+    cache.add_attachments([_att(5)])
+    assert cache.cursors("r1") == (1, None)
+    assert [m["id"] for m in cache.load("r1")[0]] == [1, 2]
+
+
+def test_only_the_newest_messages_are_kept(cache):
+    cache.apply_sync("r1", _delta([_msg(i) for i in range(1, 6)], since_id=5))
+    assert [m["id"] for m in cache.load("r1")[0]] == [3, 4, 5]
+    assert [m["id"] for m in cache.load("r1", limit=2)[0]] == [4, 5]
+
+
+def test_expired_attachments_are_dropped(cache):
+    cache.apply_sync("r1", _delta(attachments=[_att(i) for i in (1, 2, 3)], min_id=1))
+    cache.apply_sync("r1", _delta(attachments_since_id=3, min_id=3))
+    assert [a["id"] for a in cache.load("r1")[1]] == [3]
+    # None: the room has no attachments left on the server
+    cache.apply_sync("r1", _delta(attachments_since_id=3))
+    assert cache.load("r1")[1] == []
+
+
+def test_rooms_are_kept_apart(cache):
+    cache.apply_sync("r1", _delta([_msg(i) for i in range(1, 5)], [_att(1)], 4, 1, min_id=1))
+    cache.apply_sync("r2", _delta([_msg(9, "r2")], since_id=9))
+    assert [m["id"] for m in cache.load("r1")[0]] == [2, 3, 4]
+
+    cache.forget("r1")
+    assert cache.load("r1") == ([], []) and cache.cursors("r1") == (None, None)
+    assert cache.load("r2")[0] == [_msg(9, "r2")]
+
+
+def test_a_failed_sync_changes_nothing(cache):
+    cache.apply_sync("r1", _delta([_msg(1)], since_id=1))
+    with pytest.raises(KeyError):
+        cache.apply_sync("r1", {"messages": [_msg(2)], "attachments": []})
+    assert cache.load("r1")[0] == [_msg(1)] and cache.cursors("r1") == (1, None)
+
+
+def test_cache_file_per_server(monkeypatch, tmp_path):
+    monkeypatch.setenv("IMPACT_CHAT_CACHE_DIR", str(tmp_path))
+    a = default_cache_path("http://a:8000")
+    assert a.parent == tmp_path and a != default_cache_path("http://b:8000")
+    assert a == default_cache_path("http://a:8000")
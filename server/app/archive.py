@@ -0,0 +1,390 @@
+import asyncio
+import bisect
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import orjson
+from sqlalchemy import delete, select
+from .config import settings
+from .db import SessionLocal
+from . import models
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-worker dev setups only
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+# One record per compressed block: first_id, last_id, segment, offset,
+# length, count. Sparse: a block holds ~block_size messages.
+_INDEX = struct.Struct("<QQIQII")
+_INDEX_FILE = "index.idx"
+# Ids per DELETE ... IN (...) once a batch has been archived
+_DELETE_CHUNK = 500
+
+
+def _segment_name(n: int) -> str:
+    return f"{n:06d}.seg"
+
+
+class _RoomArchive:
+    """The archive of one room: append-only zlib blocks of JSON rows spread
+    over numbered segment files, plus ``index.idx`` locating each block."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.first_ids: List[int] = []
+        self.entries: List[Tuple[int, int, int, int, int, int]] = []
+        self._index_size = 0
+        self._maps: Dict[int, mmap.mmap] = {}
+        self.reload()
+
+    def reload(self):
+        """Pick up blocks appended since the last look (by this or another
+        process). A trailing partial record from a crashed writer is ignored."""
+        index_path = os.path.join(self.path, _INDEX_FILE)
+        try:
+            size = os.path.getsize(index_path)
+        except OSError:
+            return
+        size -= size % _INDEX.size
+        if size == self._index_size:
+            return
+        with open(index_path, "rb") as f:
+            f.seek(self._index_size)
+            data = f.read(size - self._index_size)
+        for rec in _INDEX.iter_unpack(data):
+            self.entries.append(rec)
+            self.first_ids.append(rec[0])
+        self._index_size = size
+
+    @property
+    def last_id(self) -> int:
+        return self.entries[-1][1] if self.entries else 0
+
+    def _map(self, segment: int, end: int) -> mmap.mmap:
+        m = self._maps.get(segment)
+        if m is None or len(m) < end:
+            if m is not None:
+                m.close()
+            with open(os.path.join(self.path, _segment_name(segment)), "rb") as f:
+                m = self._maps[segment] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return m
+
+    def read_block(self, i: int) -> List[list]:
+        _, _, segment, offset, length, _ = self.entries[i]
+        m = self._map(segment, offset + length)
+        return orjson.loads(zlib.decompress(m[offset : offset + length]))
+
+    def block_for(self, message_id: int) -> int:
+        """Index of the block that holds ``message_id`` or would precede it."""
+        return bisect.bisect_right(self.first_ids, message_id) - 1
+
+    def close(self):
+        for m in self._maps.values():
+            m.close()
+        self._maps.clear()
+
+
+class MessageArchive:
+    """Cold message history in per-room compressed segment files, read back
+    through mmap and merged with the database rows by id."""
+
+    def __init__(self, root: str, block_size: int, segment_bytes: int, max_open_rooms: int = 256):
+        self.root = root
+        self.block_size = block_size
+        self.segment_bytes = segment_bytes
+        self.max_open_rooms = max_open_rooms
+        self._rooms: "OrderedDict[str, _RoomArchive]" = OrderedDict()
+        self._blocks: "OrderedDict[Tuple[str, int], List[list]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return settings.archive_after_days > 0 or os.path.isdir(self.root)
+
+    def _room(self, room_id: str) -> Optional[_RoomArchive]:
+        room = self._rooms.get(room_id)
+        if room is None:
+            path = os.path.join(self.root, room_id)
+            if not os.path.isfile(os.path.join(path, _INDEX_FILE)):
+                return None
+            room = self._rooms[room_id] = _RoomArchive(path)
+            while len(self._rooms) > self.max_open_rooms:
+                self._rooms.popitem(last=False)[1].close()
+        else:
+            self._rooms.move_to_end(room_id)
+            room.reload()
+        return room
+
+    def _block(self, room_id: str, room: _RoomArchive, i: int) -> List[list]:
+        key = (room_id, i)
+        rows = self._blocks.get(key)
+        if rows is None:
+            rows = self._blocks[key] = room.read_block(i)
+            if len(self._blocks) > 64:
+                self._blocks.popitem(last=False)
+        else:
+            self._blocks.move_to_end(key)
+        return rows
+
+    @staticmethod
+    def _payload(room_id: str, row: list) -> dict:
+        return {
+            "id": row[0],
+            "room_id": room_id,
+            "username": row[2],
+            "text": row[3],
+            # Older segments hold naive timestamps
+            "created_at": models.utc_isoformat(datetime.fromisoformat(row[4])),
+        }
+
+    def last_id(self, room_id: str) -> int:
+        with self._lock:
+            room = self._room(room_id)
+            return room.last_id if room else 0
+
+    def archived_ids(self, room_id: str, ids: Iterable[int]) -> Set[int]:
+        """The subset of ``ids`` the room's archive holds."""
+        wanted = set(ids)
+        with self._lock:
+            room = self._room(room_id)
+            if room is None or not wanted:
+                return set()
+            found: Set[int] = set()
+            for i in sorted({room.block_for(n) for n in wanted} - {-1}):
+                found.update(row[0] for row in self._block(room_id, room, i) if row[0] in wanted)
+            return found
+
+    def max_last_id(self) -> int:
+        """Highest id archived in any room."""
+        top = 0
+        if not os.path.isdir(self.root):
+            return top
+        for room_id in os.listdir(self.root):
+            index_path = os.path.join(self.root, room_id, _INDEX_FILE)
+            try:
+                size = os.path.getsize(index_path)
+            except OSError:
+                continue
+            size -= size % _INDEX.size
+            if size:
+                with open(index_path, "rb") as f:
+                    f.seek(size - _INDEX.size)
+                    top = max(top, _INDEX.unpack(f.read(_INDEX.size))[1])
+        return top
+
+    def before(
+        self, room_id: str, before_id: Optional[int], limit: int, after_id: Optional[int] = None
+    ) -> Tuple[List[dict], bool]:
+        """Newest ``limit`` archived messages below ``before_id`` (and above
+        ``after_id``), oldest first, and whether older ones remain."""
+        with self._lock:
+            room = self._room(room_id)
+            if room is None or not room.entries:
+                return [], False
+            floor = after_id or 0
+            i = len(room.entries) - 1 if before_id is None else room.block_for(before_id - 1)
+            out: List[list] = []
+            while i >= 0 and len(out) <= limit:
+                for row in reversed(self._block(room_id, room, i)):
+                    if (before_id is None or row[0] < before_id) and row[0] > floor:
+                        out.append(row)
+                        if len(out) > limit:
+                            break
+                if room.entries[i][0] <= floor:
+                    break
+                i -= 1
+            has_more = len(out) > limit
+            page = out[:limit]
+            page.reverse()
+            return [self._payload(room_id, r) for r in page], has_more
+
+    def after(self, room_id: str, after_id: int, limit: int) -> Tuple[List[dict], bool]:
+        """Oldest ``limit`` archived messages above ``after_id``, and whether
+        more archived ones follow."""
+        with self._lock:
+            room = self._room(room_id)
+            if room is None or not room.entries:
+                return [], False
+            i = max(room.block_for(after_id + 1), 0)
+            out: List[list] = []
+            while i < len(room.entries) and len(out) <= limit:
+                for row in self._block(room_id, room, i):
+                    if row[0] > after_id:
+                        out.append(row)
+                        if len(out) > limit:
+                            break
+                i += 1
+            return [self._payload(room_id, r) for r in out[:limit]], len(out) > limit
+
+    def append(self, room_id: str, rows: List[models.Message]):
+        """Append messages (ascending ids, above ``last_id``) as compressed
+        blocks. Segment data is fsynced before the index records that point
+        at it, so a crash leaves at most unreferenced bytes behind."""
+        path = os.path.join(self.root, room_id)
+        os.makedirs(path, exist_ok=True)
+        index_path = os.path.join(path, _INDEX_FILE)
+
+        with self._lock:
+            room = self._room(room_id) or _RoomArchive(path)
+            if room.entries:
+                _, _, segment, offset, length, _ = room.entries[-1]
+                end = offset + length
+            else:
+                segment, end = 0, 0
+        if end >= self.segment_bytes:
+            segment, end = segment + 1, 0
+
+        seg_path = os.path.join(path, _segment_name(segment))
+        records = []
+        with open(seg_path, "ab") as seg:
+            # Drop bytes a crashed run wrote past the last indexed block
+            seg.truncate(end)
+            for start in range(0, len(rows), self.block_size):
+                block = rows[start : start + self.block_size]
+                data = zlib.compress(
+                    orjson.dumps(
+                        [
+                            [m.id, m.user_id, m.username, m.text, models.utc_isoformat(m.created_at)]
+                            for m in block
+                        ]
+                    ),
+                    6,
+                )
+                seg.write(data)
+                records.append(
+                    _INDEX.pack(block[0].id, block[-1].id, segment, end, len(data), len(block))
+                )
+                end += len(data)
+            seg.flush()
+            os.fsync(seg.fileno())
+
+        with open(index_path, "ab") as idx:
+            # Likewise a partial record from a crashed index write
+            idx.truncate(idx.tell() - idx.tell() % _INDEX.size)
+            idx.write(b"".join(records))
+            idx.flush()
+            os.fsync(idx.fileno())
+
+
+message_archive = MessageArchive(
+    root=settings.archive_dir,
+    block_size=settings.archive_block_messages,
+    segment_bytes=settings.archive_segment_mb * 1024 * 1024,
+)
+
+
+def _aware(ts: datetime) -> datetime:
+    # SQLite hands back naive UTC timestamps
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+def _delete_ids(db, room_id: str, ids: List[int]):
+    for start in range(0, len(ids), _DELETE_CHUNK):
+        db.execute(
+            delete(models.Message).where(
+                models.Message.room_id == room_id,
+                models.Message.id.in_(ids[start : start + _DELETE_CHUNK]),
+            )
+        )
+
+
+def _archive_room(room_id: str, cutoff: datetime, batch: int) -> int:
+    moved = 0
+    last = message_archive.last_id(room_id)
+    db = SessionLocal()
+    try:
+        if last:
+            # Rows a previous run archived but didn't get to delete. Only the
+            # ids the archive holds: a row committed late may sit below
+            # last_id without ever having been archived
+            below = db.scalars(
+                select(models.Message.id).where(
+                    models.Message.room_id == room_id, models.Message.id <= last
+                )
+            ).all()
+            done = message_archive.archived_ids(room_id, below)
+            if done:
+                _delete_ids(db, room_id, sorted(done))
+                db.commit()
+
+        while True:
+            rows = db.scalars(
+                select(models.Message)
+                .where(models.Message.room_id == room_id, models.Message.id > last)
+                .order_by(models.Message.id)
+                .limit(batch)
+            ).all()
+            old = []
+            for m in rows:
+                if _aware(m.created_at) >= cutoff:
+                    break
+                old.append(m)
+            if not old:
+                break
+
+            message_archive.append(room_id, old)
+            last = old[-1].id
+            _delete_ids(db, room_id, [m.id for m in old])
+            db.commit()
+            moved += len(old)
+            if len(old) < len(rows) or len(rows) < batch:
+                break
+    finally:
+        db.close()
+    return moved
+
+
+def archive_old_messages() -> int:
+    """Move messages older than ``ARCHIVE_AFTER_DAYS`` into the archive.
+    Blocking; one process at a time (flock on the archive directory)."""
+    started = time.perf_counter()
+    os.makedirs(settings.archive_dir, exist_ok=True)
+    cutoff = datetime.now(timezone.utc) - timedelta(days=settings.archive_after_days)
+
+    with open(os.path.join(settings.archive_dir, ".lock"), "w") as lock:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0
+
+        db = SessionLocal()
+        try:
+            room_ids = db.scalars(select(models.Room.id)).all()
+        finally:
+            db.close()
+
+        moved = sum(
+            _archive_room(room_id, cutoff, settings.archive_batch_size) for room_id in room_ids
+        )
+
+    if moved:
+        logger.info(
+            "Archived %d messages in %.3fs", moved, time.perf_counter() - started
+        )
+    return moved
+
+
+async def archive_loop():
+    while True:
+        await asyncio.sleep(settings.archive_interval_seconds)
+        try:
+            await asyncio.to_thread(archive_old_messages)
+        except Exception:
+            logger.exception("Message archival failed")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(f"Archived {archive_old_messages()} messages")
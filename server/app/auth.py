@@ -1,12 +1,22 @@
+import asyncio
 import datetime as dt
+import multiprocessing
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, NamedTuple, Set
 import jwt
 from passlib.hash import bcrypt
 from fastapi import HTTPException, Depends
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel, EmailStr
+from .broker import on_remote_emit
 from .config import settings
-from .db import get_db
+from .db import get_async_db
+from .metrics import password_hash_seconds
 from . import models
 
 
@@ -22,6 +32,11 @@ class LoginIn(BaseModel):
     password: str
 
 
+class ProfileIn(BaseModel):
+    name: str | None = None
+    gender: str | None = None
+
+
 def hash_password(pw: str) -> str:
     return bcrypt.hash(pw)
 
@@ -30,6 +45,87 @@ def verify_password(pw: str, h: str) -> bool:
     return bcrypt.verify(pw, h)
 
 
+class PasswordHasher:
+    """bcrypt in a process pool; 503 once ``max_pending`` jobs are queued."""
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._pool: ProcessPoolExecutor | None = None
+        self._pending = 0
+        self.rejected = 0
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a process that already runs an event loop and
+            # DB pool threads isn't safe
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def start(self):
+        # Pay the worker start-up cost at boot instead of on the first login
+        pool = self._executor()
+        for _ in range(self.workers):
+            pool.submit(int)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def resize(self, workers: int, max_pending: int | None = None):
+        self.shutdown()
+        self.workers = workers
+        if max_pending is not None:
+            self.max_pending = max_pending
+
+    async def _run(self, fn, *args):
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Too many logins in progress, retry shortly",
+                headers={"Retry-After": "1"},
+            )
+        self._pending += 1
+        started = time.perf_counter()
+        pool = self._executor()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+        except BrokenProcessPool:
+            # A worker died (OOM killer, crash); the pool refuses every job
+            # from now on, so start a fresh one on the next call
+            if self._pool is pool:
+                self._pool = None
+                pool.shutdown(wait=False, cancel_futures=True)
+            raise HTTPException(
+                status_code=503,
+                detail="Password check failed, retry shortly",
+                headers={"Retry-After": "1"},
+            )
+        finally:
+            self._pending -= 1
+            password_hash_seconds.observe(time.perf_counter() - started, fn.__name__)
+
+    async def hash(self, pw: str) -> str:
+        return await self._run(hash_password, pw)
+
+    async def verify(self, pw: str, h: str) -> bool:
+        return await self._run(verify_password, pw, h)
+
+
+password_hasher = PasswordHasher(
+    workers=settings.password_hash_workers,
+    max_pending=settings.password_hash_max_pending,
+)
+
+
 def create_token(user_id: int) -> str:
     payload = {
         "sub": str(user_id),
@@ -39,21 +135,101 @@ def create_token(user_id: int) -> str:
     return jwt.encode(payload, settings.jwt_secret, algorithm="HS256")
 
 
-def get_current_user(
-    creds: HTTPAuthorizationCredentials = Depends(HTTPBearer(auto_error=False)),
-    db: Session = Depends(get_db),
-):
-    if not creds:
-        raise HTTPException(status_code=401, detail="No token")
+class CurrentUser(NamedTuple):
+    id: int
+    name: str
+
+
+class UserCache:
+    """TTL + LRU map of bearer token -> ``CurrentUser``; see :meth:`invalidate_user`."""
+
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple[float, CurrentUser]]" = OrderedDict()
+        self._tokens_by_user: Dict[int, Set[str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _drop(self, token: str):
+        _, user = self._entries.pop(token)
+        tokens = self._tokens_by_user.get(user.id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[user.id]
+
+    def get(self, token: str) -> CurrentUser | None:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[0] <= time.time():
+                if entry is not None:
+                    self._drop(token)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, token: str, user: CurrentUser, token_exp: float):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if token in self._entries:
+                self._drop(token)
+            expires = min(time.time() + self.ttl_seconds, token_exp)
+            self._entries[token] = (expires, user)
+            self._tokens_by_user.setdefault(user.id, set()).add(token)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            for token in list(self._tokens_by_user.get(user_id, ())):
+                self._drop(token)
+
+
+user_cache = UserCache(
+    max_entries=settings.user_cache_max_entries,
+    ttl_seconds=settings.user_cache_ttl_seconds,
+)
+
+# Worker-to-worker notice that a user row changed
+USER_CHANGED_EVENT = "user_changed"
+
+
+@on_remote_emit(USER_CHANGED_EVENT)
+def _invalidate_remote_user(payload: dict):
+    # A user changed through another worker
+    user_cache.invalidate_user(payload["id"])
+
+
+async def user_from_token(token: str, db: AsyncSession) -> CurrentUser:
+    user = user_cache.get(token)
+    if user is not None:
+        return user
 
     try:
-        data = jwt.decode(creds.credentials, settings.jwt_secret, algorithms=["HS256"])
+        data = jwt.decode(token, settings.jwt_secret, algorithms=["HS256"])
         user_id = int(data["sub"])
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-    user = db.get(models.User, user_id)
-    if not user:
+    row = await db.get(models.User, user_id)
+    if not row:
         raise HTTPException(status_code=401, detail="User not found")
 
+    user = CurrentUser(id=row.id, name=row.name)
+    user_cache.put(token, user, data.get("exp", time.time()))
     return user
+
+
+async def get_current_user(
+    creds: HTTPAuthorizationCredentials = Depends(HTTPBearer(auto_error=False)),
+    db: AsyncSession = Depends(get_async_db),
+) -> CurrentUser:
+    if not creds:
+        raise HTTPException(status_code=401, detail="No token")
+
+    return await user_from_token(creds.credentials, db)
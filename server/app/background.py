@@ -0,0 +1,15 @@
+import asyncio
+from typing import Coroutine, Optional, Set
+
+
+_tasks: Set[asyncio.Task] = set()
+
+
+def spawn(coro: Coroutine, tasks: Optional[Set[asyncio.Task]] = None) -> asyncio.Task:
+    """Run ``coro`` as a task, holding a reference until it finishes (the
+    loop only keeps weak ones). Pass ``tasks`` to track them in your own set."""
+    held = _tasks if tasks is None else tasks
+    task = asyncio.create_task(coro)
+    held.add(task)
+    task.add_done_callback(held.discard)
+    return task
@@ -0,0 +1,269 @@
+import asyncio
+import os
+import socket
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Set
+from urllib.parse import urlparse
+import orjson
+import socketio
+from engineio import packet as eio_packet
+from engineio.exceptions import EngineIOError
+from socketio import packet
+from socketio.async_pubsub_manager import AsyncPubSubManager
+from .metrics import sio_emit_recipients, sio_emit_seconds
+
+
+# event name -> callbacks run when another worker emits that event; lets
+# per-process state (e.g. the history cache) follow writes made elsewhere
+_remote_emit_hooks: Dict[str, List[Callable[[dict], None]]] = defaultdict(list)
+
+
+def on_remote_emit(event: str):
+    def register(fn: Callable[[dict], None]):
+        _remote_emit_hooks[event].append(fn)
+        return fn
+
+    return register
+
+
+# Target of worker-to-worker notices (see publish_internal); no socket
+# ever joins it
+_INTERNAL_ROOM = "__workers__"
+
+
+class _Broadcast:
+    """Room broadcasts queued in a plain loop, not a task per recipient."""
+
+    async def _broadcast(self, event, data, namespace, room=None, skip_sid=None):
+        if namespace not in self.rooms:
+            return
+        started = time.perf_counter()
+        if isinstance(data, tuple):
+            data = list(data)
+        elif data is not None:
+            data = [data]
+        else:
+            data = []
+        if not isinstance(skip_sid, list):
+            skip_sid = [skip_sid]
+
+        encoded = self.server.packet_class(
+            packet.EVENT, namespace=namespace, data=[event] + data
+        ).encode()
+        if not isinstance(encoded, list):
+            encoded = [encoded]
+        eio_pkts = [eio_packet.Packet(eio_packet.MESSAGE, p) for p in encoded]
+        send = self.server.eio.send_packet
+        sent = 0
+        for sid, eio_sid in self.get_participants(namespace, room):
+            if sid in skip_sid:
+                continue
+            sent += 1
+            try:
+                for p in eio_pkts:
+                    await send(eio_sid, p)
+            except EngineIOError:
+                # Closed while we were sending; disconnect cleans it up
+                pass
+        sio_emit_recipients.observe(sent, event)
+        sio_emit_seconds.observe(time.perf_counter() - started, event)
+
+    async def emit_local(self, event: str, data, room: str, namespace: str = "/"):
+        """Emit to this worker's sockets in ``room`` only."""
+        await self._broadcast(event, data, namespace, room)
+
+    async def publish_internal(self, event: str, data):
+        """Run the other workers' ``on_remote_emit`` hooks for ``event``
+        without sending anything to clients. Nothing to do in one process."""
+
+
+class InProcessManager(_Broadcast, socketio.AsyncManager):
+    """Default single-process manager with the task-free broadcast."""
+
+    async def emit(self, event, data, namespace, room=None, skip_sid=None, callback=None, **kwargs):
+        if callback is not None:
+            return await super().emit(
+                event, data, namespace, room=room, skip_sid=skip_sid, callback=callback, **kwargs
+            )
+        await self._broadcast(event, data, namespace, room, skip_sid)
+
+
+class _RemoteEmitHooks(_Broadcast):
+    async def publish_internal(self, event: str, data):
+        await self._publish(
+            {
+                "method": "emit",
+                "event": event,
+                "data": data,
+                "namespace": "/",
+                "room": _INTERNAL_ROOM,
+                "skip_sid": None,
+                "callback": None,
+                "host_id": self.host_id,
+            }
+        )
+
+    async def _handle_emit(self, message):
+        if message.get("host_id") != self.host_id:
+            for hook in _remote_emit_hooks.get(message.get("event"), ()):
+                hook(message.get("data"))
+        if message.get("room") == _INTERNAL_ROOM:
+            return
+        if message.get("callback") is not None:
+            await super()._handle_emit(message)
+            return
+        await self._broadcast(
+            message["event"],
+            message["data"],
+            message.get("namespace") or "/",
+            message.get("room"),
+            message.get("skip_sid"),
+        )
+
+
+class RedisManager(_RemoteEmitHooks, socketio.AsyncRedisManager):
+    pass
+
+
+class AioPikaManager(_RemoteEmitHooks, socketio.AsyncAioPikaManager):
+    pass
+
+
+# Unix datagrams top out around the default socket buffer size
+_MAX_DATAGRAM = 208 * 1024
+_PEER_REFRESH_S = 1.0
+# How long a publish waits on a peer whose queue is full before dropping
+# the message for it
+_PEER_SEND_TIMEOUT_S = 0.5
+
+
+class LocalSocketManager(_RemoteEmitHooks, AsyncPubSubManager):
+    """Single-host pub/sub over Unix datagram sockets, no broker process.
+    JSON messages; the socket directory must be private to the workers' user."""
+
+    name = "local"
+
+    def __init__(self, path: str, channel="socketio", write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.path = path
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        st = os.stat(path)
+        if st.st_uid != os.getuid():
+            raise RuntimeError(f"SIO_MESSAGE_QUEUE directory {path} belongs to another user")
+        if st.st_mode & 0o077:
+            # Anyone who can reach the sockets can inject emits
+            os.chmod(path, 0o700)
+        self._own = os.path.join(path, f"{channel}-{self.host_id[:12]}.sock")
+        self._peers: Dict[str, socket.socket] = {}
+        self._stalled: Set[str] = set()
+        self._peers_at = 0.0
+
+    def _refresh_peers(self):
+        prefix = f"{self.channel}-"
+        found = {
+            os.path.join(self.path, n)
+            for n in os.listdir(self.path)
+            if n.startswith(prefix) and n.endswith(".sock")
+        }
+        found.discard(self._own)
+        for gone in set(self._peers) - found:
+            self._drop_peer(gone)
+        for new in found - set(self._peers):
+            s = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            s.setblocking(False)
+            try:
+                s.connect(new)
+            except OSError:
+                # Left behind by a worker that died; nobody will read it
+                s.close()
+                try:
+                    os.unlink(new)
+                except OSError:
+                    pass
+                continue
+            self._peers[new] = s
+        self._peers_at = time.monotonic()
+
+    def _drop_peer(self, path: str):
+        s = self._peers.pop(path, None)
+        if s is not None:
+            s.close()
+        self._stalled.discard(path)
+
+    async def _send(self, path: str, s: socket.socket, payload: bytes):
+        try:
+            if path in self._stalled:
+                # It timed out before: don't wait on it again, just drop
+                # messages until its queue has room
+                try:
+                    s.send(payload)
+                except BlockingIOError:
+                    return
+                self._stalled.discard(path)
+                return
+            # Connected datagram sockets wait for room in the peer's queue
+            # instead of blocking the loop or dropping
+            await asyncio.wait_for(
+                asyncio.get_running_loop().sock_sendall(s, payload), _PEER_SEND_TIMEOUT_S
+            )
+        except asyncio.TimeoutError:
+            self._stalled.add(path)
+            self._get_logger().warning("local pubsub: %s is not reading, dropping messages", path)
+        except OSError:
+            self._drop_peer(path)
+
+    async def _publish(self, data):
+        if time.monotonic() - self._peers_at > _PEER_REFRESH_S:
+            self._refresh_peers()
+
+        payload = orjson.dumps(data)
+        if len(payload) > _MAX_DATAGRAM:
+            self._get_logger().error("local pubsub: %d byte message dropped", len(payload))
+            return
+
+        # Concurrently, so one hung peer costs at most the timeout
+        await asyncio.gather(
+            *(self._send(path, s, payload) for path, s in list(self._peers.items()))
+        )
+
+    async def _listen(self):
+        loop = asyncio.get_running_loop()
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        s.setblocking(False)
+        try:
+            os.unlink(self._own)
+        except FileNotFoundError:
+            pass
+        s.bind(self._own)
+        try:
+            while True:
+                raw = await loop.sock_recv(s, _MAX_DATAGRAM)
+                try:
+                    # Handed on as a dict, so the base class never unpickles
+                    message = orjson.loads(raw)
+                except orjson.JSONDecodeError:
+                    self._get_logger().error("local pubsub: undecodable message dropped")
+                    continue
+                if isinstance(message, dict):
+                    yield message
+        finally:
+            s.close()
+            try:
+                os.unlink(self._own)
+            except OSError:
+                pass
+
+
+def make_client_manager(url: str) -> socketio.AsyncManager:
+    """Client manager for ``SIO_MESSAGE_QUEUE``: in-process, redis, amqp or unix."""
+    if not url:
+        return InProcessManager()
+    scheme = urlparse(url).scheme
+    if scheme in ("redis", "rediss"):
+        return RedisManager(url)
+    if scheme == "amqp":
+        return AioPikaManager(url)
+    if scheme == "unix":
+        return LocalSocketManager(urlparse(url).path)
+    raise ValueError(f"Unsupported SIO_MESSAGE_QUEUE scheme: {scheme}")
@@ -0,0 +1,129 @@
+import asyncio
+import time
+from typing import Dict, List, Set
+from .background import spawn
+from .broker import on_remote_emit
+
+# Worker-to-worker notice carrying one typing / presence update
+_REMOTE_EVENT = "coalescer_update"
+
+
+class RoomEventCoalescer:
+    """Per-room ``typing_batch`` / ``presence_batch`` frames, merged across
+    workers. A window of 0 keeps the per-event frames."""
+
+    def __init__(
+        self, sio, store, typing_window_ms: int, typing_ttl_ms: int, presence_window_ms: int
+    ):
+        self.sio = sio
+        self.store = store
+        self.typing_window = typing_window_ms / 1000
+        self.typing_ttl = typing_ttl_ms / 1000
+        self.presence_window = presence_window_ms / 1000
+        # room -> user key -> [name, expires, last shared with other workers]
+        self._typing: Dict[str, Dict[str, list]] = {}
+        # room -> user key -> [name, joins minus leaves]
+        self._presence: Dict[str, Dict[str, list]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        on_remote_emit(_REMOTE_EVENT)(self._remote)
+
+    def _remote(self, data: dict):
+        if data["kind"] == "typing":
+            self._add_typist(data["room"], data["key"], data["name"], shared=True)
+        else:
+            self._add_presence(data["room"], data["key"], data["name"], data["joined"])
+
+    def _add_typist(self, room_id: str, key: str, name: str, shared: bool) -> bool:
+        """Refresh a typist; True if the other workers should hear about it."""
+        now = time.monotonic()
+        typists = self._typing.get(room_id)
+        if typists is None:
+            typists = self._typing[room_id] = {}
+            spawn(self._typing_loop(room_id, typists), self._tasks)
+        entry = typists.get(key)
+        if entry is None:
+            entry = typists[key] = [name, 0.0, now if shared else 0.0]
+        entry[0] = name
+        entry[1] = now + self.typing_ttl
+        if shared:
+            entry[2] = now
+            return False
+        # Their copy only needs refreshing before it would expire
+        if now - entry[2] < self.typing_ttl / 2:
+            return False
+        entry[2] = now
+        return True
+
+    async def typing(self, sid: str, room_id: str, key: str, username: str):
+        if not self.typing_window:
+            await self.sio.emit("typing", {"username": username}, to=room_id, skip_sid=sid)
+            return
+
+        if self._add_typist(room_id, key, username, shared=False):
+            await self.sio.manager.publish_internal(
+                _REMOTE_EVENT, {"kind": "typing", "room": room_id, "key": key, "name": username}
+            )
+
+    async def _typing_loop(self, room_id: str, typists: Dict[str, list]):
+        last: List[str] = []
+        try:
+            while True:
+                await asyncio.sleep(self.typing_window)
+                now = time.monotonic()
+                for key, (_, expires, _) in list(typists.items()):
+                    if expires <= now:
+                        del typists[key]
+
+                users = sorted(name for name, _, _ in typists.values())
+                if users != last:
+                    await self.sio.manager.emit_local(
+                        "typing_batch", {"room": room_id, "users": users}, room_id
+                    )
+                    last = users
+                if not typists:
+                    return
+        finally:
+            self._typing.pop(room_id, None)
+
+    def _add_presence(self, room_id: str, key: str, name: str, joined: bool):
+        pending = self._presence.get(room_id)
+        if pending is None:
+            pending = self._presence[room_id] = {}
+            spawn(self._presence_flush(room_id), self._tasks)
+        entry = pending.setdefault(key, [name, 0])
+        entry[0] = name
+        # A join and a leave by the same user inside one window cancel out
+        entry[1] += 1 if joined else -1
+
+    async def presence(self, room_id: str, key: str, username: str, joined: bool, online: int):
+        if not self.presence_window:
+            await self.sio.emit(
+                "user_joined" if joined else "user_left",
+                {"username": username, "room": room_id, "online": online},
+                to=room_id,
+            )
+            return
+
+        self._add_presence(room_id, key, username, joined)
+        await self.sio.manager.publish_internal(
+            _REMOTE_EVENT,
+            {"kind": "presence", "room": room_id, "key": key, "name": username, "joined": joined},
+        )
+
+    async def _presence_flush(self, room_id: str):
+        await asyncio.sleep(self.presence_window)
+        pending = self._presence.pop(room_id)
+        joined = [name for name, delta in pending.values() if delta > 0]
+        left = [name for name, delta in pending.values() if delta < 0]
+        if not joined and not left:
+            return
+        await self.sio.manager.emit_local(
+            "presence_batch",
+            {
+                "room": room_id,
+                "joined": joined,
+                "left": left,
+                "online": await self.store.count(room_id),
+            },
+            room_id,
+        )
@@ -1,3 +1,4 @@
+import os
 from pydantic_settings import BaseSettings
 from pydantic import Field, field_validator
 from typing import List
@@ -11,11 +12,101 @@ class Settings(BaseSettings):
     allowed_origins: List[str] = Field(default_factory=lambda: ["*"], alias="ALLOWED_ORIGINS")
     sio_cors_origins: List[str] = Field(default_factory=lambda: ["*"], alias="SIO_CORS_ORIGINS")
 
+    # Cross-worker Socket.IO fan-out: "" (single process), redis://, amqp://
+    # or unix:///dir (single host, no broker)
+    sio_message_queue: str = Field(default="", alias="SIO_MESSAGE_QUEUE")
+    # Socket session / presence store: memory://, redis://, sqlite:///file
+    session_store_url: str = Field(default="memory://", alias="SESSION_STORE_URL")
+    # Shared session / presence entries of a worker that stops refreshing
+    # them (e.g. crashed) expire after this long
+    session_ttl_seconds: int = Field(default=120, alias="SESSION_TTL_SECONDS")
+
+    # Per-socket send queue limits: past half of either, typing / presence
+    # events are skipped for that socket; at the limit it is disconnected
+    # with a resync hint. Handlers' fire-and-forget broadcasts are capped
+    # at SIO_MAX_INFLIGHT_BROADCASTS (callers wait beyond that)
+    sio_outbound_max_packets: int = Field(default=1000, alias="SIO_OUTBOUND_MAX_PACKETS")
+    sio_outbound_max_kb: int = Field(default=1024, alias="SIO_OUTBOUND_MAX_KB")
+    sio_max_inflight_broadcasts: int = Field(default=1000, alias="SIO_MAX_INFLIGHT_BROADCASTS")
+
+    # Token-bucket rate limits as "count/seconds" ("" = unlimited): login and
+    # register per client IP, message (HTTP and socket) and upload per user,
+    # typing and join_room per socket. RATE_LIMIT_STORE_URL takes the same
+    # schemes as SESSION_STORE_URL; use a shared one with several workers
+    rate_limit_enabled: bool = Field(default=True, alias="RATE_LIMIT_ENABLED")
+    rate_limit_store_url: str = Field(default="memory://", alias="RATE_LIMIT_STORE_URL")
+    rate_limit_login: str = Field(default="10/60", alias="RATE_LIMIT_LOGIN")
+    rate_limit_register: str = Field(default="5/600", alias="RATE_LIMIT_REGISTER")
+    rate_limit_message: str = Field(default="30/10", alias="RATE_LIMIT_MESSAGE")
+    rate_limit_upload: str = Field(default="20/60", alias="RATE_LIMIT_UPLOAD")
+    rate_limit_typing: str = Field(default="20/2", alias="RATE_LIMIT_TYPING")
+    rate_limit_join_room: str = Field(default="20/10", alias="RATE_LIMIT_JOIN_ROOM")
+
+    # Typing / presence coalescing windows; 0 sends every event individually
+    typing_window_ms: int = Field(default=500, alias="TYPING_WINDOW_MS")
+    typing_ttl_ms: int = Field(default=3000, alias="TYPING_TTL_MS")
+    presence_window_ms: int = Field(default=1000, alias="PRESENCE_WINDOW_MS")
+
     upload_dir: str = Field(default="uploads", alias="UPLOAD_DIR")
     max_upload_mb: int = Field(default=50, alias="MAX_UPLOAD_MB")
+    # Resumable uploads: suggested PUT size, and idle sessions are dropped
+    upload_chunk_mb: int = Field(default=8, alias="UPLOAD_CHUNK_MB")
+    upload_session_ttl_minutes: int = Field(default=24 * 60, alias="UPLOAD_SESSION_TTL_MINUTES")
+    # Internal nginx location mapped to UPLOAD_DIR; when set, /files hands
+    # the transfer to the proxy via X-Accel-Redirect
+    files_accel_redirect: str = Field(default="", alias="FILES_ACCEL_REDIRECT")
+
+    # Attachment expiry sweeper
+    attachment_ttl_minutes: int = Field(default=30, alias="ATTACHMENT_TTL_MINUTES")
+    cleanup_interval_seconds: int = Field(default=60, alias="CLEANUP_INTERVAL_SECONDS")
+    cleanup_batch_size: int = Field(default=500, alias="CLEANUP_BATCH_SIZE")
+    cleanup_file_workers: int = Field(default=8, alias="CLEANUP_FILE_WORKERS")
+
+    # Country / room listings cache; invalidated on room creation, the TTL
+    # only bounds staleness if a cross-worker invalidation is lost
+    directory_cache_ttl_seconds: int = Field(default=300, alias="DIRECTORY_CACHE_TTL_SECONDS")
+
+    # Postgres text search configuration for /chat/search ("simple" does no
+    # stemming, which suits mixed-language rooms)
+    search_ts_config: str = Field(default="simple", alias="SEARCH_TS_CONFIG")
+
+    # Prometheus text at GET /metrics, per worker. Off by default; with it on,
+    # set METRICS_TOKEN (sent by the scraper as a bearer token) unless the
+    # app is only reachable from an internal network
+    metrics_enabled: bool = Field(default=False, alias="METRICS_ENABLED")
+    metrics_token: str = Field(default="", alias="METRICS_TOKEN")
 
     jwt_secret: str = Field(default="devsecret", alias="JWT_SECRET")
     jwt_expire_minutes: int = Field(default=60 * 24 * 30, alias="JWT_EXPIRE_MINUTES")
+    user_cache_ttl_seconds: int = Field(default=300, alias="USER_CACHE_TTL_SECONDS")
+    user_cache_max_entries: int = Field(default=50000, alias="USER_CACHE_MAX_ENTRIES")
+
+    # bcrypt process pool; jobs beyond max_pending are rejected with 503
+    password_hash_workers: int = Field(
+        default_factory=lambda: os.cpu_count() or 1, alias="PASSWORD_HASH_WORKERS"
+    )
+    password_hash_max_pending: int = Field(default=64, alias="PASSWORD_HASH_MAX_PENDING")
+
+    # Recent-message ring buffer per room; 0 disables it
+    history_cache_room_size: int = Field(default=200, alias="HISTORY_CACHE_ROOM_SIZE")
+    history_cache_max_mb: int = Field(default=64, alias="HISTORY_CACHE_MAX_MB")
+    history_cache_max_rooms: int = Field(default=10000, alias="HISTORY_CACHE_MAX_ROOMS")
+
+    # Cold-history archival: messages older than this many days move from the
+    # messages table into compressed per-room segment files; 0 disables
+    archive_after_days: int = Field(default=0, alias="ARCHIVE_AFTER_DAYS")
+    archive_dir: str = Field(default="archive", alias="ARCHIVE_DIR")
+    archive_interval_seconds: int = Field(default=3600, alias="ARCHIVE_INTERVAL_SECONDS")
+    archive_batch_size: int = Field(default=5000, alias="ARCHIVE_BATCH_SIZE")
+    archive_block_messages: int = Field(default=256, alias="ARCHIVE_BLOCK_MESSAGES")
+    archive_segment_mb: int = Field(default=64, alias="ARCHIVE_SEGMENT_MB")
+
+    # Write-behind message persistence: broadcast first, batch-insert later
+    message_write_behind: bool = Field(default=False, alias="MESSAGE_WRITE_BEHIND")
+    write_behind_batch_size: int = Field(default=500, alias="WRITE_BEHIND_BATCH_SIZE")
+    write_behind_flush_ms: int = Field(default=10, alias="WRITE_BEHIND_FLUSH_MS")
+    write_behind_queue_size: int = Field(default=20000, alias="WRITE_BEHIND_QUEUE_SIZE")
+    write_behind_enqueue_timeout_ms: int = Field(default=1000, alias="WRITE_BEHIND_ENQUEUE_TIMEOUT_MS")
 
     @field_validator("allowed_origins", "sio_cors_origins", mode="before")
     @classmethod
@@ -1,4 +1,6 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
 from sqlalchemy.pool import StaticPool
 from .config import settings
@@ -8,17 +10,36 @@ class Base(DeclarativeBase):
     pass
 
 
+# Async drivers for the backends we support; DATABASE_URL keeps naming the
+# sync driver (used for schema creation and background jobs)
+_ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+
+def async_url(url: str):
+    u = make_url(url)
+    driver = _ASYNC_DRIVERS.get(u.get_backend_name())
+    return u.set(drivername=driver) if driver else u
+
+
 if settings.database_url.startswith("sqlite"):
     engine = create_engine(
         settings.database_url,
         connect_args={"check_same_thread": False},
         poolclass=StaticPool if settings.database_url.endswith(":memory:") else None
     )
+    async_engine = create_async_engine(
+        async_url(settings.database_url),
+        poolclass=StaticPool if settings.database_url.endswith(":memory:") else None
+    )
 else:
     engine = create_engine(settings.database_url, pool_pre_ping=True)
+    async_engine = create_async_engine(async_url(settings.database_url), pool_pre_ping=True)
 
 
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
 
 
 def get_db():
@@ -27,3 +48,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,80 @@
+import hashlib
+import json
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from sqlalchemy import func, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from .broker import on_remote_emit
+from .config import settings
+from . import models
+
+
+COUNTRIES = [
+    ("ID", "Indonesia"),
+    ("US", "United States"),
+    ("MY", "Malaysia"),
+    ("SG", "Singapore"),
+]
+
+
+def seed_countries(engine: Engine):
+    """Insert the default countries into an empty table. Runs at startup."""
+    with Session(engine) as db:
+        if db.scalar(select(func.count()).select_from(models.Country)):
+            return
+        db.add_all(models.Country(code=code, name=name) for code, name in COUNTRIES)
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another worker seeded it first
+            db.rollback()
+
+
+class DirectoryCache:
+    """Serialized country and room listings with their ETags. A fill that
+    started before an invalidation is not stored."""
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl = ttl_seconds
+        self.version = 0
+        self._entries: Dict[str, Tuple[float, bytes, str]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(
+        self, key: str, load: Callable[[], Awaitable[List[dict]]]
+    ) -> Tuple[bytes, str]:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1], entry[2]
+
+        self.misses += 1
+        version = self.version
+        body = json.dumps(await load(), separators=(",", ":")).encode()
+        etag = f'"{hashlib.sha1(body).hexdigest()[:20]}"'
+        if version == self.version:
+            self._entries[key] = (time.monotonic() + self.ttl, body, etag)
+        return body, etag
+
+    def invalidate(self, key: Optional[str] = None):
+        self.version += 1
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+
+directory_cache = DirectoryCache(ttl_seconds=settings.directory_cache_ttl_seconds)
+
+
+def rooms_key(country_code: str) -> str:
+    return f"rooms:{country_code}"
+
+
+@on_remote_emit("room_created")
+def _invalidate_remote_room(payload: dict):
+    # A room created through another worker
+    directory_cache.invalidate(rooms_key(payload["country_code"]))
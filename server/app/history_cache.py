@@ -0,0 +1,173 @@
+import threading
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+from .config import settings
+
+
+# Rough per-entry cost of a payload dict (dict, keys, ints, timestamps)
+# on top of the variable-length strings it holds
+_ENTRY_OVERHEAD = 400
+# Per-room cost of an empty buffer, so rooms without messages count too
+_ROOM_OVERHEAD = 600
+
+
+def _payload_size(p: dict) -> int:
+    return _ENTRY_OVERHEAD + len(p["text"]) + len(p["username"]) + len(p["room_id"])
+
+
+class _RoomBuffer:
+    __slots__ = ("items", "warm", "complete", "size")
+
+    def __init__(self, maxlen: int):
+        self.items: Deque[dict] = deque(maxlen=maxlen)
+        # warm: holds the newest contiguous window of the room's history
+        # complete: additionally holds everything the room ever had
+        self.warm = False
+        self.complete = False
+        self.size = 0
+
+
+class RoomHistoryCache:
+    """LRU ring buffers of each room's newest message payloads, capped by room
+    count and bytes. Reads are served only once filled from the database."""
+
+    def __init__(self, room_size: int, max_bytes: int, max_rooms: int):
+        self.room_size = room_size
+        self.max_bytes = max_bytes
+        self.max_rooms = max_rooms
+        self._rooms: "OrderedDict[str, _RoomBuffer]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.room_size > 0 and self.max_bytes > 0
+
+    def _room(self, room_id: str) -> _RoomBuffer:
+        buf = self._rooms.get(room_id)
+        if buf is None:
+            buf = self._new_room(room_id)
+        else:
+            self._rooms.move_to_end(room_id)
+        return buf
+
+    def _new_room(self, room_id: str) -> _RoomBuffer:
+        buf = self._rooms[room_id] = _RoomBuffer(self.room_size)
+        self._account(buf, _ROOM_OVERHEAD)
+        return buf
+
+    def _account(self, buf: _RoomBuffer, delta: int):
+        buf.size += delta
+        self._bytes += delta
+
+    def _insert(self, buf: _RoomBuffer, payload: dict):
+        items = buf.items
+        # Concurrent commits can finish out of id order, so walk back from
+        # the newest entry to find the slot instead of blindly appending
+        pos = len(items)
+        while pos > 0 and items[pos - 1]["id"] >= payload["id"]:
+            if items[pos - 1]["id"] == payload["id"]:
+                return
+            pos -= 1
+        if pos == 0 and items and buf.warm and not buf.complete:
+            # Older than the whole window; it belongs to uncached history
+            return
+        if len(items) == items.maxlen:
+            if pos == 0:
+                return
+            dropped = items.popleft()
+            pos -= 1
+            self._account(buf, -_payload_size(dropped))
+            buf.complete = False
+        items.insert(pos, payload)
+        self._account(buf, _payload_size(payload))
+
+    def _evict(self, keep: str):
+        while (
+            self._bytes > self.max_bytes or len(self._rooms) > self.max_rooms
+        ) and len(self._rooms) > 1:
+            room_id, buf = next(iter(self._rooms.items()))
+            if room_id == keep:
+                self._rooms.move_to_end(room_id)
+                continue
+            del self._rooms[room_id]
+            self._bytes -= buf.size
+            self.evictions += 1
+
+    def append(self, room_id: str, payload: dict):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._insert(self._room(room_id), payload)
+            self._evict(keep=room_id)
+
+    def fill(self, room_id: str, payloads: List[dict], complete: bool):
+        """Install the newest window read from the database (oldest first)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            buf = self._room(room_id)
+            pending = list(buf.items)
+            buf.items.clear()
+            self._account(buf, _ROOM_OVERHEAD - buf.size)
+            buf.warm = False
+            buf.complete = complete
+            for p in payloads:
+                self._insert(buf, p)
+            for p in pending:
+                self._insert(buf, p)
+            buf.warm = True
+            self._evict(keep=room_id)
+
+    def page(
+        self, room_id: str, limit: int, after_id: Optional[int] = None
+    ) -> Optional[Tuple[List[dict], bool]]:
+        """Return ``(items, has_more)`` for the newest page, or rows after
+        ``after_id``, if the buffer can answer it; ``None`` on a miss."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            buf = self._rooms.get(room_id)
+            if buf is None or not buf.warm:
+                # Writes racing the caller's fill() create the buffer
+                # themselves, and fill() merges them
+                self.misses += 1
+                return None
+            self._rooms.move_to_end(room_id)
+            items = buf.items
+
+            if after_id is None:
+                if len(items) < limit and not buf.complete:
+                    self.misses += 1
+                    return None
+                self.hits += 1
+                start = max(len(items) - limit, 0)
+                page = [items[i] for i in range(start, len(items))]
+                return page, start > 0 or not buf.complete
+
+            if not buf.complete and (not items or items[0]["id"] > after_id):
+                self.misses += 1
+                return None
+            self.hits += 1
+            newer = [p for p in items if p["id"] > after_id]
+            return newer[:limit], len(newer) > limit
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "rooms": len(self._rooms),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+history_cache = RoomHistoryCache(
+    room_size=settings.history_cache_room_size,
+    max_bytes=settings.history_cache_max_mb * 1024 * 1024,
+    max_rooms=settings.history_cache_max_rooms,
+)
@@ -1,24 +1,126 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.staticfiles import StaticFiles
+from fastapi.responses import ORJSONResponse
 import socketio
 import os
-import asyncio
 from .config import settings
-from .db import engine, Base
+from sqlalchemy import inspect, text
+from .db import engine, async_engine, Base
+from . import models
 from .routes_auth import router as auth_router
 from .routes_rooms import router as rooms_router
 from .routes_chat import router as chat_router
-from .socketio_app import sio
+from .routes_files import router as files_router
+from .routes_uploads import router as uploads_router
+from .routes_metrics import router as metrics_router
+from .metrics import HTTPMetricsMiddleware, instrument_engine, instrument_sessions
+from .socketio_app import session_refresh_loop, sio
+from .directory import seed_countries
+from .search import setup_search_index
+from .archive import archive_loop, message_archive
 from .tasks import cleanup_loop
+from .write_behind import message_writer
+from .auth import password_hasher
+from .background import spawn
+
+
+def _drop_unique_stored_path():
+    """Attachments used to own their file, so stored_path was UNIQUE; with
+    deduplicated blobs several rows share a path. Drop the old constraint."""
+    insp = inspect(engine)
+    if not insp.has_table("attachments"):
+        return
+    if not any(
+        u["column_names"] == ["stored_path"] for u in insp.get_unique_constraints("attachments")
+    ):
+        return
+
+    with engine.begin() as conn:
+        if engine.dialect.name == "postgresql":
+            for u in insp.get_unique_constraints("attachments"):
+                if u["column_names"] == ["stored_path"]:
+                    conn.execute(text(f'ALTER TABLE attachments DROP CONSTRAINT "{u["name"]}"'))
+            return
+
+        # SQLite can't drop a table constraint; rebuild the table instead
+        cols = ", ".join(c["name"] for c in insp.get_columns("attachments"))
+        indexes = [i["name"] for i in insp.get_indexes("attachments")]
+        conn.execute(text("ALTER TABLE attachments RENAME TO attachments_legacy"))
+        for name in indexes:
+            conn.execute(text(f'DROP INDEX IF EXISTS "{name}"'))
+        models.Attachment.__table__.create(bind=conn)
+        conn.execute(
+            text(f"INSERT INTO attachments ({cols}) SELECT {cols} FROM attachments_legacy")
+        )
+        conn.execute(text("DROP TABLE attachments_legacy"))
+
+
+def _autoincrement_message_ids():
+    """Without AUTOINCREMENT SQLite reuses MAX(id) + 1, which can be the id
+    of an archived message. Rebuild an older messages table with it."""
+    if engine.dialect.name != "sqlite" or not inspect(engine).has_table("messages"):
+        return
+    with engine.begin() as conn:
+        ddl = conn.scalar(
+            text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'messages'")
+        )
+        if "AUTOINCREMENT" in ddl.upper():
+            return
+
+        cols = ", ".join(c["name"] for c in inspect(conn).get_columns("messages"))
+        indexes = [i["name"] for i in inspect(conn).get_indexes("messages")]
+        conn.execute(text("ALTER TABLE messages RENAME TO messages_legacy"))
+        for name in indexes:
+            conn.execute(text(f'DROP INDEX IF EXISTS "{name}"'))
+        models.Message.__table__.create(bind=conn)
+        conn.execute(text(f"INSERT INTO messages ({cols}) SELECT {cols} FROM messages_legacy"))
+        # The search triggers moved with the renamed table; setup_search_index
+        # recreates them below
+        conn.execute(text("DROP TABLE messages_legacy"))
+
+        top = max(
+            conn.scalar(text("SELECT COALESCE(MAX(id), 0) FROM messages")),
+            message_archive.max_last_id(),
+        )
+        conn.execute(text("DELETE FROM sqlite_sequence WHERE name = 'messages'"))
+        conn.execute(
+            text("INSERT INTO sqlite_sequence (name, seq) VALUES ('messages', :seq)"), {"seq": top}
+        )
+
+
+def _widen_usernames():
+    """Message and attachment rows capped usernames at 64 characters while
+    account names allow 80. SQLite doesn't enforce VARCHAR lengths."""
+    if engine.dialect.name != "postgresql":
+        return
+    insp = inspect(engine)
+    with engine.begin() as conn:
+        for table in ("messages", "attachments"):
+            if not insp.has_table(table):
+                continue
+            col = next(c for c in insp.get_columns(table) if c["name"] == "username")
+            if col["type"].length < 80:
+                conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN username TYPE VARCHAR(80)"))
 
 
 # Create database tables
+_drop_unique_stored_path()
+_widen_usernames()
+_autoincrement_message_ids()
 Base.metadata.create_all(bind=engine)
 
+# create_all skips tables that already exist, so add any indexes introduced
+# since the database was first created
+for _table in Base.metadata.sorted_tables:
+    for _index in _table.indexes:
+        _index.create(bind=engine, checkfirst=True)
+
+setup_search_index(engine)
+seed_countries(engine)
+
 
 # Initialize FastAPI app
-fastapi_app = FastAPI(title=settings.app_name)
+fastapi_app = FastAPI(title=settings.app_name, default_response_class=ORJSONResponse)
 
 # Configure CORS middleware
 fastapi_app.add_middleware(
@@ -29,20 +131,42 @@ fastapi_app.add_middleware(
     allow_headers=["*"],
 )
 
+if settings.metrics_enabled:
+    fastapi_app.add_middleware(HTTPMetricsMiddleware)
+    instrument_engine(engine, "sync")
+    instrument_engine(async_engine.sync_engine, "async")
+    instrument_sessions()
+
 # Include routers
 fastapi_app.include_router(auth_router)
 fastapi_app.include_router(rooms_router)
 fastapi_app.include_router(chat_router)
+fastapi_app.include_router(uploads_router)
+fastapi_app.include_router(files_router)
+if settings.metrics_enabled:
+    fastapi_app.include_router(metrics_router)
 
-# Serve static files for uploads
 os.makedirs(settings.upload_dir, exist_ok=True)
-fastapi_app.mount("/files", StaticFiles(directory=settings.upload_dir), name="files")
 
 
-# Background cleanup task on startup
+# Background tasks and worker pools on startup
 @fastapi_app.on_event("startup")
 async def _startup():
-    asyncio.create_task(cleanup_loop())
+    loops = [cleanup_loop(), session_refresh_loop()]
+    if settings.archive_after_days > 0:
+        loops.append(archive_loop())
+    for loop in loops:
+        spawn(loop)
+    password_hasher.start()
+    if settings.message_write_behind:
+        await message_writer.start()
+
+
+# Persist queued write-behind messages and stop the bcrypt workers
+@fastapi_app.on_event("shutdown")
+async def _shutdown():
+    await message_writer.stop()
+    password_hasher.shutdown()
 
 
 # Combine FastAPI and Socket.IO ASGI apps
@@ -0,0 +1,72 @@
+from typing import Set
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import models
+from .broker import on_remote_emit
+from .history_cache import history_cache
+from .write_behind import message_writer
+
+
+def message_payload(m: models.Message) -> dict:
+    return {
+        "id": m.id,
+        "room_id": m.room_id,
+        "username": m.username,
+        "text": m.text,
+        "created_at": models.utc_isoformat(m.created_at),
+    }
+
+
+def attachment_payload(a: models.Attachment) -> dict:
+    return {
+        "id": a.id,
+        "room_id": a.room_id,
+        "username": a.username,
+        "original_name": a.original_name,
+        "mime_type": a.mime_type,
+        "size_bytes": a.size_bytes,
+        "url": f"/files/{a.stored_path}",
+        "created_at": models.utc_isoformat(a.created_at),
+    }
+
+
+# Rooms are never deleted, so one that exists once can be remembered
+_known_rooms: Set[str] = set()
+
+
+async def _validate(db: AsyncSession, room_id: str, username: str, text: str):
+    # Write-behind acks before the INSERT; anything the DB would reject
+    # has to be turned away here, not dropped after the broadcast
+    if len(text) > models.Message.text.type.length:
+        raise HTTPException(status_code=400, detail="Message too long")
+    if len(username) > models.Message.username.type.length:
+        raise HTTPException(status_code=400, detail="Name too long")
+    if room_id not in _known_rooms:
+        if await db.get(models.Room, room_id) is None:
+            raise HTTPException(status_code=404, detail="Room not found")
+        _known_rooms.add(room_id)
+
+
+async def store_message(
+    db: AsyncSession, room_id: str, user_id: int, username: str, text: str
+) -> dict:
+    """Persist a chat message (directly or via write-behind) and return the
+    payload to broadcast. Shared by the HTTP route and the socket event."""
+    await _validate(db, room_id, username, text)
+    if message_writer.enabled:
+        msg = await message_writer.submit(room_id, user_id, username, text)
+    else:
+        msg = models.Message(room_id=room_id, user_id=user_id, username=username, text=text)
+        db.add(msg)
+        await db.commit()
+        await db.refresh(msg)
+
+    payload = message_payload(msg)
+    history_cache.append(room_id, payload)
+    return payload
+
+
+@on_remote_emit("chat_message")
+def _cache_remote_message(payload: dict):
+    # Messages posted through other workers still belong in our ring buffer
+    history_cache.append(payload["room_id"], payload)
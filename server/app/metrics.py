@@ -0,0 +1,263 @@
+import bisect
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+import socketio
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+
+# Seconds; spans a fast SELECT to a slow bcrypt round or a large upload
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+SIZE_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _num(v: float) -> str:
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _HistogramChild:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, n: int):
+        self.counts = [0] * (n + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    """Fixed-bucket histogram. ``observe`` is a bisect and three increments
+    under an uncontended lock (DB events also fire on worker threads);
+    cumulative bucket counts are only computed at scrape time."""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._children: Dict[Tuple[str, ...], _HistogramChild] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            child = self._children.get(labels)
+            if child is None:
+                child = self._children[labels] = _HistogramChild(len(self.buckets))
+            child.counts[i] += 1
+            child.sum += value
+            child.count += 1
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            children = [
+                (labels, list(c.counts), c.sum, c.count) for labels, c in self._children.items()
+            ]
+        for labels, counts, total, count in sorted(children):
+            running = 0
+            for bound, n in zip(self.buckets, counts):
+                running += n
+                le = _labels(self.label_names, labels, f'le="{_num(bound)}"')
+                yield f"{self.name}_bucket{le} {running}"
+            le = _labels(self.label_names, labels, 'le="+Inf"')
+            yield f"{self.name}_bucket{le} {count}"
+            yield f"{self.name}_sum{_labels(self.label_names, labels)} {total!r}"
+            yield f"{self.name}_count{_labels(self.label_names, labels)} {count}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, v in values:
+            yield f"{self.name}{_labels(self.label_names, labels)} {_num(v)}"
+
+
+# A collector returns (name, type, help, [(labels dict, value), ...]) for
+# values read at scrape time: pool sizes, queue depths, stats counters
+Sample = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List = []
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        h = Histogram(*args, **kwargs)
+        self._metrics.append(h)
+        return h
+
+    def counter(self, *args, **kwargs) -> Counter:
+        c = Counter(*args, **kwargs)
+        self._metrics.append(c)
+        return c
+
+    def collector(self, fn: Callable[[], Iterable[Sample]]):
+        self._collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics:
+            lines.extend(m.render())
+        for collect in self._collectors:
+            for name, kind, help, samples in collect():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_labels(list(labels), list(labels.values()))} {_num(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_seconds = registry.histogram(
+    "chat_http_request_seconds",
+    "HTTP request latency by route template, until the last body byte is sent",
+    labels=("method", "route", "status"),
+)
+sio_event_seconds = registry.histogram(
+    "chat_sio_event_seconds", "Socket.IO event handler time", labels=("event",)
+)
+sio_emit_recipients = registry.histogram(
+    "chat_sio_emit_recipients",
+    "Sockets a broadcast was queued to",
+    labels=("event",),
+    buckets=SIZE_BUCKETS,
+)
+sio_emit_seconds = registry.histogram(
+    "chat_sio_emit_seconds", "Time to encode a broadcast and queue it to every recipient",
+    labels=("event",),
+)
+db_query_seconds = registry.histogram(
+    "chat_db_query_seconds", "SQL statement execution time", labels=("engine", "statement")
+)
+db_commit_seconds = registry.histogram(
+    "chat_db_commit_seconds", "ORM session commit time, including the final flush"
+)
+password_hash_seconds = registry.histogram(
+    "chat_password_hash_seconds",
+    "bcrypt job time in the process pool, including queueing",
+    labels=("op",),
+)
+
+
+class HTTPMetricsMiddleware:
+    """Times every HTTP request under its route template (``/files/{path:path}``,
+    not the concrete path), so the label set stays bounded."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = "500"
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # The router stores the matched route in the shared scope
+            route = scope.get("route")
+            http_request_seconds.observe(
+                time.perf_counter() - started,
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                status,
+            )
+
+
+class InstrumentedAsyncServer(socketio.AsyncServer):
+    """AsyncServer that times each event handler."""
+
+    async def _trigger_event(self, event, namespace, *args):
+        started = time.perf_counter()
+        ret = await super()._trigger_event(event, namespace, *args)
+        # Clients pick event names; don't let unknown ones become labels
+        sio_event_seconds.observe(
+            time.perf_counter() - started, event if ret is not self.not_handled else "unhandled"
+        )
+        return ret
+
+
+_VERBS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "BEGIN", "COMMIT", "ROLLBACK"}
+
+
+def _verb(statement: str) -> str:
+    head = statement[:16].split(None, 1)
+    verb = head[0].upper() if head else ""
+    return verb if verb in _VERBS else "OTHER"
+
+
+def instrument_engine(engine: Engine, name: str):
+    """Time statements on ``engine``; pass ``async_engine.sync_engine`` for
+    the async one."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["metrics_started"].pop()
+        db_query_seconds.observe(time.perf_counter() - started, name, _verb(statement))
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        # after_cursor_execute doesn't run for a failed statement
+        stack = context.connection.info.get("metrics_started") if context.connection else None
+        if stack:
+            stack.pop()
+
+
+def instrument_sessions():
+    """Time commits of every ORM session, sync and async alike (an
+    AsyncSession commits through a sync Session)."""
+
+    @event.listens_for(Session, "before_commit")
+    def _before(session):
+        session.info["metrics_commit_started"] = time.perf_counter()
+
+    @event.listens_for(Session, "after_commit")
+    def _after(session):
+        started = session.info.pop("metrics_commit_started", None)
+        if started is not None:
+            db_commit_seconds.observe(time.perf_counter() - started)
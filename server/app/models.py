@@ -1,8 +1,16 @@
-from sqlalchemy import String, Integer, DateTime, func, BigInteger, ForeignKey, UniqueConstraint
+from datetime import datetime, timezone
+from sqlalchemy import String, Integer, DateTime, func, BigInteger, ForeignKey, UniqueConstraint, Index
 from sqlalchemy.orm import Mapped, mapped_column
 from .db import Base
 
 
+def utc_isoformat(ts: datetime) -> str:
+    # SQLite hands back naive UTC, Postgres the session's zone; clients
+    # sort on the string, so always send one fixed-width UTC form
+    ts = ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts.astimezone(timezone.utc)
+    return ts.isoformat(timespec="microseconds")
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -37,22 +45,41 @@ class Message(Base):
     __tablename__ = "messages"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    room_id: Mapped[str] = mapped_column(String(36), ForeignKey("rooms.id"), index=True)
+    room_id: Mapped[str] = mapped_column(String(36), ForeignKey("rooms.id"))
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"))
-    username: Mapped[str] = mapped_column(String(64))
+    username: Mapped[str] = mapped_column(String(80))
     text: Mapped[str] = mapped_column(String(4096))
     created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now())
 
+    # Keyset pagination walks (room_id, id) in both directions. SQLite
+    # AUTOINCREMENT: ids of archived (deleted) rows must never come back
+    __table_args__ = (
+        Index("ix_messages_room_id_id", "room_id", "id"),
+        {"sqlite_autoincrement": True},
+    )
+
+
+class Blob(Base):
+    """A stored upload, shared by every attachment with the same content."""
+
+    __tablename__ = "blobs"
+
+    path: Mapped[str] = mapped_column(String(1024), primary_key=True)
+    size_bytes: Mapped[int] = mapped_column(BigInteger)
+    refcount: Mapped[int] = mapped_column(Integer, default=1)
+    created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
 
 class Attachment(Base):
     __tablename__ = "attachments"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    room_id: Mapped[str] = mapped_column(String(36), ForeignKey("rooms.id"), index=True)
+    room_id: Mapped[str] = mapped_column(String(36), ForeignKey("rooms.id"))
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"))
-    username: Mapped[str] = mapped_column(String(64))
+    username: Mapped[str] = mapped_column(String(80))
     original_name: Mapped[str] = mapped_column(String(512))
-    stored_path: Mapped[str] = mapped_column(String(1024), unique=True)
+    # Content-addressed blob path; attachments of identical files share it
+    stored_path: Mapped[str] = mapped_column(String(1024))
     mime_type: Mapped[str] = mapped_column(String(128))
     size_bytes: Mapped[int] = mapped_column(BigInteger)
     created_at: Mapped[DateTime] = mapped_column(
@@ -60,3 +87,23 @@ class Attachment(Base):
         server_default=func.now(),
         index=True
     )
+
+    __table_args__ = (Index("ix_attachments_room_id_id", "room_id", "id"),)
+
+
+class UploadSession(Base):
+    """A resumable upload in progress; the bytes so far are in .incoming/<id>."""
+
+    __tablename__ = "upload_sessions"
+
+    id: Mapped[str] = mapped_column(String(36), primary_key=True)  # uuid
+    room_id: Mapped[str] = mapped_column(String(36), ForeignKey("rooms.id"))
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"))
+    filename: Mapped[str] = mapped_column(String(512))
+    mime_type: Mapped[str] = mapped_column(String(128))
+    size_bytes: Mapped[int] = mapped_column(BigInteger)
+    received_bytes: Mapped[int] = mapped_column(BigInteger, default=0)
+    created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    updated_at: Mapped[DateTime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), index=True
+    )
@@ -0,0 +1,163 @@
+import asyncio
+import logging
+from typing import Set
+import engineio
+from engineio import packet as eio_packet
+from socketio import packet
+from .background import spawn
+from .config import settings
+from .metrics import registry
+
+
+logger = logging.getLogger(__name__)
+
+# Ephemeral events a lagging client can do without; the next batch
+# supersedes them anyway
+DROPPABLE_EVENTS = frozenset({"typing", "typing_batch", "presence_batch", "user_joined", "user_left"})
+
+sio_outbound_dropped = registry.counter(
+    "chat_sio_outbound_dropped_total", "Events skipped for sockets that fell behind", labels=("event",)
+)
+sio_slow_consumer_evictions = registry.counter(
+    "chat_sio_slow_consumer_evictions_total", "Sockets disconnected for falling behind"
+)
+
+
+def _packet_bytes(pkt) -> int:
+    data = getattr(pkt, "data", None)
+    return len(data) if isinstance(data, (str, bytes)) else 0
+
+
+def _event_name(data) -> str:
+    # Encoded Socket.IO event: '2["name",...' with an optional namespace
+    # and ack id before the array; binary events (5...) count as "binary"
+    if not isinstance(data, str):
+        return "binary"
+    if data[:1] != "2":
+        return "binary" if data[:1] == "5" else "other"
+    start = data.find('["')
+    end = data.find('"', start + 2)
+    return data[start + 2 : end] if start >= 0 and end >= 0 else "other"
+
+
+class OutboundQueue(asyncio.Queue):
+    """Engine.IO send queue with a byte count; :meth:`admit` gates each message."""
+
+    def __init__(self, server=None, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.server = server
+        self.bytes = 0
+        self.evicting = False
+
+    def put_nowait(self, item):
+        # Control packets (ping, noop, close) and the writer's None always go
+        if (
+            self.server is not None
+            and not self.evicting
+            and getattr(item, "packet_type", None) == eio_packet.MESSAGE
+        ):
+            event = _event_name(item.data)
+            verdict = self.admit(_packet_bytes(item), event in DROPPABLE_EVENTS)
+            if verdict != "send":
+                if verdict == "evict":
+                    evict(self)
+                sio_outbound_dropped.inc(event)
+                return
+        super().put_nowait(item)
+
+    def _put(self, item):
+        self.bytes += _packet_bytes(item)
+        super()._put(item)
+
+    def _get(self):
+        item = super()._get()
+        self.bytes -= _packet_bytes(item)
+        return item
+
+    def admit(self, size: int, droppable: bool) -> str:
+        """``"send"``, ``"drop"`` or ``"evict"`` for a packet of ``size`` bytes."""
+        packets = self.qsize()
+        max_packets = settings.sio_outbound_max_packets
+        max_bytes = settings.sio_outbound_max_kb * 1024
+        if packets >= max_packets or self.bytes + size > max_bytes:
+            return "evict"
+        if droppable and (packets >= max_packets // 2 or self.bytes + size > max_bytes // 2):
+            return "drop"
+        return "send"
+
+    def clear(self):
+        while True:
+            try:
+                self.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            self.task_done()
+
+
+class BoundedEngineIOServer(engineio.AsyncServer):
+    def create_queue(self, *args, **kwargs):
+        return OutboundQueue(self, *args, **kwargs)
+
+
+_RESYNC = packet.Packet(
+    packet.EVENT, namespace="/", data=["resync", {"reason": "slow_consumer"}]
+).encode()
+
+
+async def _evict(queue: OutboundQueue):
+    server = queue.server
+    eio_sid = next((sid for sid, s in server.sockets.items() if s.queue is queue), None)
+    if eio_sid is None:
+        return
+    socket = server.sockets[eio_sid]
+    logger.warning("Evicting slow Socket.IO client %s", eio_sid)
+    # The backlog is moot: the client has to refetch history anyway. Leave
+    # it just the hint, then close without waiting for the queue to drain,
+    # which a stalled client never would
+    queue.clear()
+    await socket.send(eio_packet.Packet(eio_packet.MESSAGE, _RESYNC))
+    await socket.close(wait=False)
+    server.sockets.pop(eio_sid, None)
+
+
+def evict(queue: OutboundQueue):
+    """Disconnect the client behind a full send queue. It reconnects and,
+    on the ``resync`` event it gets first, reloads history with ``after_id``."""
+    if queue.evicting:
+        return
+    queue.evicting = True
+    sio_slow_consumer_evictions.inc()
+
+    async def run():
+        try:
+            await _evict(queue)
+        except Exception:
+            logger.exception("Evicting a slow client failed")
+
+    spawn(run())
+
+
+class BroadcastLimiter:
+    """Fire-and-forget emits, at most ``max_in_flight`` at once."""
+
+    def __init__(self, sio, max_in_flight: int):
+        self.sio = sio
+        self.max_in_flight = max_in_flight
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    async def emit(self, event: str, data, **kwargs):
+        await self._slots.acquire()
+        spawn(self._run(event, data, kwargs), self._tasks)
+
+    async def _run(self, event, data, kwargs):
+        try:
+            await self.sio.emit(event, data, **kwargs)
+        except Exception:
+            logger.exception("Broadcasting %s failed", event)
+        finally:
+            self._slots.release()
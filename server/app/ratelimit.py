@@ -0,0 +1,252 @@
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional
+from urllib.parse import urlparse
+import aiosqlite
+from fastapi import Depends, HTTPException, Request
+from sqlalchemy.engine import make_url
+from .auth import get_current_user
+from .config import settings
+from .metrics import registry
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # optional, only needed for redis:// stores
+    aioredis = None
+
+
+logger = logging.getLogger(__name__)
+
+rate_limited = registry.counter(
+    "chat_rate_limited_total", "Requests and events refused by a rate limit", labels=("limit",)
+)
+
+
+class Limit(NamedTuple):
+    """``count`` calls per ``per`` seconds, refilled continuously; up to
+    ``count`` may come in one burst."""
+
+    count: int
+    per: float
+
+    @classmethod
+    def parse(cls, spec: str) -> Optional["Limit"]:
+        # "20/10" = 20 per 10 seconds; "" or "0/..." = unlimited
+        if not spec:
+            return None
+        count, _, per = spec.partition("/")
+        limit = cls(int(count), float(per or 1))
+        return limit if limit.count > 0 else None
+
+    @property
+    def rate(self) -> float:
+        return self.count / self.per
+
+
+class MemoryBucketStore:
+    """Token buckets for a single process; full ones are dropped as the dict cycles."""
+
+    def __init__(self):
+        # key -> [tokens, updated, full_at]
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+
+    async def take(self, key: str, limit: Limit) -> float:
+        now = time.monotonic()
+        for _ in range(min(2, len(self._buckets))):
+            front, bucket = next(iter(self._buckets.items()))
+            if bucket[2] <= now:
+                del self._buckets[front]
+            else:
+                self._buckets.move_to_end(front)
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            tokens = float(limit.count)
+        else:
+            tokens = min(limit.count, bucket[0] + (now - bucket[1]) * limit.rate)
+
+        if tokens < 1:
+            retry_after = (1 - tokens) / limit.rate
+        else:
+            tokens -= 1
+            retry_after = 0.0
+        self._buckets[key] = [tokens, now, now + (limit.count - tokens) / limit.rate]
+        return retry_after
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+# Refill and take in one round trip; the key expires once it would be full
+_REDIS_TAKE = """
+local tokens = tonumber(redis.call('HGET', KEYS[1], 't') or ARGV[1])
+local updated = tonumber(redis.call('HGET', KEYS[1], 'u') or ARGV[3])
+local count, rate, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+tokens = math.min(count, tokens + math.max(0, now - updated) * rate)
+local retry = 0
+if tokens < 1 then
+  retry = (1 - tokens) / rate
+else
+  tokens = tokens - 1
+end
+redis.call('HSET', KEYS[1], 't', tokens, 'u', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil((count - tokens) / rate * 1000) + 1000)
+return tostring(retry)
+"""
+
+
+class RedisBucketStore:
+    """Token buckets shared by all workers through Redis; idle buckets
+    expire on their own."""
+
+    def __init__(self, url: str, prefix: str = "impact"):
+        if aioredis is None:
+            raise RuntimeError("redis package is required for a redis:// rate limit store")
+        self.redis = aioredis.Redis.from_url(url)
+        self.prefix = prefix
+        self._take = self.redis.register_script(_REDIS_TAKE)
+
+    async def take(self, key: str, limit: Limit) -> float:
+        retry = await self._take(
+            keys=[f"{self.prefix}:rl:{key}"], args=[limit.count, limit.rate, time.time()]
+        )
+        return float(retry)
+
+
+class SqliteBucketStore:
+    """Token buckets shared by workers on one host via a SQLite file; a
+    stand-in for Redis in development and tests."""
+
+    _SWEEP_INTERVAL = 60.0
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = None
+        self._swept = 0.0
+
+    async def _conn(self):
+        if self._db is None:
+            self._db = await aiosqlite.connect(self.path, isolation_level=None)
+            await self._db.execute("PRAGMA journal_mode=WAL")
+            await self._db.execute(
+                "CREATE TABLE IF NOT EXISTS rate_buckets "
+                "(key TEXT PRIMARY KEY, tokens REAL, updated REAL, full_at REAL)"
+            )
+        return self._db
+
+    async def take(self, key: str, limit: Limit) -> float:
+        db = await self._conn()
+        now = time.time()
+        if now - self._swept > self._SWEEP_INTERVAL:
+            self._swept = now
+            await db.execute("DELETE FROM rate_buckets WHERE full_at < ?", (now,))
+
+        params = {"key": key, "count": limit.count, "rate": limit.rate, "now": now}
+        # Refill and take in one statement so workers can't both spend the
+        # last token; no row back means the bucket was short
+        async with db.execute(
+            "INSERT INTO rate_buckets (key, tokens, updated, full_at) "
+            "VALUES (:key, :count - 1, :now, :now + 1 / :rate) "
+            "ON CONFLICT(key) DO UPDATE SET "
+            "tokens = MIN(:count, tokens + (:now - updated) * :rate) - 1, updated = :now, "
+            "full_at = :now + (:count - MIN(:count, tokens + (:now - updated) * :rate) + 1) / :rate "
+            "WHERE MIN(:count, tokens + (:now - updated) * :rate) >= 1 "
+            "RETURNING tokens",
+            params,
+        ) as cur:
+            if await cur.fetchone():
+                return 0.0
+        async with db.execute(
+            "SELECT MIN(:count, tokens + (:now - updated) * :rate) FROM rate_buckets WHERE key = :key",
+            params,
+        ) as cur:
+            row = await cur.fetchone()
+        return max(0.0, (1 - row[0]) / limit.rate) if row else 0.0
+
+
+def make_bucket_store(url: str):
+    scheme = urlparse(url).scheme if url else "memory"
+    if scheme == "memory":
+        return MemoryBucketStore()
+    if scheme in ("redis", "rediss"):
+        return RedisBucketStore(url)
+    if scheme == "sqlite":
+        return SqliteBucketStore(make_url(url).database)
+    raise ValueError(f"Unsupported RATE_LIMIT_STORE_URL scheme: {scheme}")
+
+
+class RateLimiter:
+    """Named limits (``message``, ``typing``, ...) from settings over a
+    bucket store. A store error lets the call through rather than taking
+    the endpoint down with it."""
+
+    def __init__(self, store, limits: Dict[str, Optional[Limit]]):
+        self.store = store
+        self.limits = limits
+
+    async def hit(self, name: str, key) -> float:
+        """Spend one token of ``name`` for ``key``; 0 if allowed, else the
+        seconds until a token is available."""
+        limit = self.limits.get(name)
+        if limit is None:
+            return 0.0
+        try:
+            retry_after = await self.store.take(f"{name}:{key}", limit)
+        except Exception:
+            logger.exception("Rate limit store failed; allowing %s", name)
+            return 0.0
+        if retry_after:
+            rate_limited.inc(name)
+        return retry_after
+
+
+rate_limiter = RateLimiter(
+    make_bucket_store(settings.rate_limit_store_url),
+    {
+        name: Limit.parse(spec) if settings.rate_limit_enabled else None
+        for name, spec in {
+            "login": settings.rate_limit_login,
+            "register": settings.rate_limit_register,
+            "message": settings.rate_limit_message,
+            "upload": settings.rate_limit_upload,
+            "typing": settings.rate_limit_typing,
+            "join_room": settings.rate_limit_join_room,
+        }.items()
+    },
+)
+
+
+def _too_many(retry_after: float):
+    raise HTTPException(
+        status_code=429,
+        detail="Too many requests, slow down",
+        headers={"Retry-After": str(math.ceil(retry_after))},
+    )
+
+
+def limit_per_user(name: str):
+    """Route dependency spending one ``name`` token per call for the
+    authenticated user; 429 with Retry-After when the bucket is empty."""
+
+    async def check(user=Depends(get_current_user)):
+        retry_after = await rate_limiter.hit(name, f"u{user.id}")
+        if retry_after:
+            _too_many(retry_after)
+
+    return check
+
+
+def limit_per_ip(name: str):
+    """Like :func:`limit_per_user`, keyed by client address for routes
+    called before there is a user. Behind a proxy, run uvicorn with
+    --proxy-headers and the proxy in FORWARDED_ALLOW_IPS."""
+
+    async def check(request: Request):
+        host = request.client.host if request.client else "unknown"
+        retry_after = await rate_limiter.hit(name, f"ip{host}")
+        if retry_after:
+            _too_many(retry_after)
+
+    return check
@@ -1,28 +1,40 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from .db import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .db import get_async_db
 from . import models
-from .auth import RegisterIn, LoginIn, hash_password, verify_password, create_token, get_current_user
+from .auth import (
+    USER_CHANGED_EVENT,
+    LoginIn,
+    ProfileIn,
+    RegisterIn,
+    create_token,
+    get_current_user,
+    password_hasher,
+    user_cache,
+)
+from .socketio_app import rename_user_sessions, sio
+from .ratelimit import limit_per_ip
 
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
 
-@router.post("/register")
-def register(payload: RegisterIn, db: Session = Depends(get_db)):
-    if db.query(models.User).filter(models.User.email == payload.email).first():
+@router.post("/register", dependencies=[Depends(limit_per_ip("register"))])
+async def register(payload: RegisterIn, db: AsyncSession = Depends(get_async_db)):
+    if await db.scalar(select(models.User).where(models.User.email == payload.email)):
         raise HTTPException(status_code=400, detail="Email already registered")
 
     user = models.User(
         email=payload.email,
         name=payload.name,
         gender=payload.gender or "unspecified",
-        password_hash=hash_password(payload.password),
+        password_hash=await password_hasher.hash(payload.password),
     )
 
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
 
     return {
         "token": create_token(user.id),
@@ -35,10 +47,10 @@ def register(payload: RegisterIn, db: Session = Depends(get_db)):
     }
 
 
-@router.post("/login")
-def login(payload: LoginIn, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.email == payload.email).first()
-    if not user or not verify_password(payload.password, user.password_hash):
+@router.post("/login", dependencies=[Depends(limit_per_ip("login"))])
+async def login(payload: LoginIn, db: AsyncSession = Depends(get_async_db)):
+    user = await db.scalar(select(models.User).where(models.User.email == payload.email))
+    if not user or not await password_hasher.verify(payload.password, user.password_hash):
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
     return {
@@ -53,7 +65,47 @@ def login(payload: LoginIn, db: Session = Depends(get_db)):
 
 
 @router.get("/me")
-def me(user: models.User = Depends(get_current_user)):
+async def me(
+    current=Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    user = await db.get(models.User, current.id)
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+
+    return {
+        "id": user.id,
+        "email": user.email,
+        "name": user.name,
+        "gender": user.gender,
+    }
+
+
+@router.patch("/me")
+async def update_me(
+    payload: ProfileIn,
+    current=Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    user = await db.get(models.User, current.id)
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+
+    if payload.name is not None:
+        name = payload.name.strip()
+        if not name:
+            raise HTTPException(status_code=400, detail="Name required")
+        user.name = name
+    if payload.gender is not None:
+        user.gender = payload.gender
+    await db.commit()
+
+    # Cached tokens and open sockets carry the old name, here and on the
+    # other workers
+    user_cache.invalidate_user(user.id)
+    rename_user_sessions({"id": user.id, "name": user.name})
+    await sio.manager.publish_internal(USER_CHANGED_EVENT, {"id": user.id, "name": user.name})
+
     return {
         "id": user.id,
         "email": user.email,
@@ -1,176 +1,260 @@
-from fastapi import APIRouter, Depends, Query, UploadFile, File, Form, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Query, UploadFile, File, Form
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-import os
-import uuid
-import aiofiles
 import asyncio
 from datetime import datetime, timedelta, timezone
-from .db import get_db
+from .db import get_async_db
 from . import models
+from .archive import message_archive
 from .auth import get_current_user
 from .config import settings
-from .socketio_app import sio
+from .history_cache import history_cache
+from .messaging import attachment_payload, message_payload, store_message
+from .ratelimit import limit_per_user
+from .search import search_messages
+from .socketio_app import broadcasts
+from .storage import ReceivedFile, discard, receive_upload, store_attachments
 
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
 
+async def _keyset_page(
+    db: AsyncSession, q, id_col, limit: int, before_id: int | None, after_id: int | None
+):
+    """One page of rows by id cursor, oldest first."""
+    if before_id is not None:
+        q = q.where(id_col < before_id)
+    if after_id is not None:
+        q = q.where(id_col > after_id)
+
+    forward = after_id is not None and before_id is None
+    q = q.order_by(id_col.asc() if forward else id_col.desc()).limit(limit + 1)
+    rows = list(await db.scalars(q))
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not forward:
+        rows.reverse()
+    return rows, has_more
+
+
+def _page_body(items: List[dict], has_more: bool, before_id: int | None, after_id: int | None):
+    forward = after_id is not None and before_id is None
+    if items:
+        next_before_id = items[0]["id"] if has_more and not forward else None
+        next_after_id = items[-1]["id"]
+    else:
+        next_before_id = None
+        next_after_id = after_id
+
+    # Returned as a response so FastAPI skips jsonable_encoder on the
+    # already JSON-ready payloads
+    return ORJSONResponse(
+        {
+            "items": items,
+            "next_before_id": next_before_id,
+            "next_after_id": next_after_id,
+            "has_more": has_more,
+        }
+    )
+
+
+def _merge(items: List[dict], archived: List[dict]) -> List[dict]:
+    # A row archived by a run that crashed before deleting it is in both
+    by_id = {p["id"]: p for p in archived}
+    by_id.update((p["id"], p) for p in items)
+    return [by_id[i] for i in sorted(by_id)]
+
+
+async def _with_archive(
+    room_id: str, items: List[dict], has_more: bool, limit: int,
+    before_id: int | None, after_id: int | None,
+):
+    """Merge archived history into a page read from the database. Both
+    sides are read by id, so rows committed after a newer archive run
+    still land in order."""
+    last = await asyncio.to_thread(message_archive.last_id, room_id)
+    if not last or (after_id is not None and after_id >= last):
+        return items, has_more
+
+    forward = after_id is not None and before_id is None
+    if forward:
+        archived, more = await asyncio.to_thread(message_archive.after, room_id, after_id, limit)
+        merged = _merge(items, archived)
+        return merged[:limit], has_more or more or len(merged) > limit
+
+    if len(items) == limit and items[0]["id"] > last:
+        # A full page above everything archived; older rows remain there
+        return items, True
+    archived, more = await asyncio.to_thread(
+        message_archive.before, room_id, before_id, limit, after_id
+    )
+    merged = _merge(items, archived)
+    return merged[-limit:], has_more or more or len(merged) > limit
+
+
+async def _message_items(
+    db: AsyncSession, room_id: str, limit: int, before_id: int | None, after_id: int | None
+):
+    """One page of message payloads: recent-message cache first, then the
+    database, then the archive."""
+    q = select(models.Message).where(models.Message.room_id == room_id)
+
+    if before_id is None:
+        cached = history_cache.page(room_id, limit, after_id)
+        if cached is None and after_id is None and history_cache.enabled:
+            # Warm the room's ring buffer with its newest window, then serve
+            # the page from it so join storms only hit the DB once per room
+            rows, has_more = await _keyset_page(
+                db, q, models.Message.id, history_cache.room_size, None, None
+            )
+            complete = not has_more
+            if complete and message_archive.enabled:
+                # Older history lives in the archive, not in this window
+                complete = not await asyncio.to_thread(message_archive.last_id, room_id)
+            history_cache.fill(room_id, [message_payload(m) for m in rows], complete)
+            cached = history_cache.page(room_id, limit)
+        if cached is not None:
+            return cached
+
+    rows, has_more = await _keyset_page(db, q, models.Message.id, limit, before_id, after_id)
+    items = [message_payload(m) for m in rows]
+    if message_archive.enabled:
+        items, has_more = await _with_archive(room_id, items, has_more, limit, before_id, after_id)
+    return items, has_more
+
+
 @router.get("/messages")
-def list_messages(
+async def list_messages(
     room_id: str = Query(...),
     limit: int = Query(default=50, ge=1, le=200),
-    db: Session = Depends(get_db),
+    before_id: int | None = Query(default=None, ge=1),
+    after_id: int | None = Query(default=None, ge=0),
+    db: AsyncSession = Depends(get_async_db),
+):
+    items, has_more = await _message_items(db, room_id, limit, before_id, after_id)
+    return _page_body(items, has_more, before_id, after_id)
+
+
+@router.get("/sync")
+async def sync(
+    room_id: str = Query(...),
+    since_id: int | None = Query(default=None, ge=0),
+    attachments_since_id: int | None = Query(default=None, ge=0),
+    limit: int = Query(default=200, ge=1, le=200),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    q = (
-        db.query(models.Message)
-        .filter(models.Message.room_id == room_id)
-        .order_by(models.Message.id.desc())
-        .limit(limit)
+    """Messages and attachments newer than the client's cursors, oldest first."""
+    messages, messages_more = await _message_items(db, room_id, limit, None, since_id)
+    attachments, attachments_more = await _keyset_page(
+        db,
+        select(models.Attachment).where(models.Attachment.room_id == room_id),
+        models.Attachment.id,
+        limit,
+        None,
+        attachments_since_id,
     )
-    return list(
-        reversed(
-            [
-                {
-                    "id": m.id,
-                    "room_id": m.room_id,
-                    "username": m.username,
-                    "text": m.text,
-                    "created_at": m.created_at,
-                }
-                for m in q.all()
-            ]
-        )
+    attachments_min_id = await db.scalar(
+        select(func.min(models.Attachment.id)).where(models.Attachment.room_id == room_id)
+    )
+
+    return ORJSONResponse(
+        {
+            "messages": messages,
+            "attachments": [attachment_payload(a) for a in attachments],
+            "since_id": messages[-1]["id"] if messages else since_id,
+            "attachments_since_id": attachments[-1].id if attachments else attachments_since_id,
+            "attachments_min_id": attachments_min_id,
+            # A cold start's has_more would be about older rows, not newer
+            "has_more": (since_id is not None and messages_more)
+            or (attachments_since_id is not None and attachments_more),
+        }
     )
 
 
-@router.post("/message")
-def create_message(
+@router.get("/search")
+async def search(
+    room_id: str = Query(...),
+    q: str = Query(..., min_length=1, max_length=256),
+    limit: int = Query(default=20, ge=1, le=100),
+    offset: int = Query(default=0, ge=0, le=10000),
+    db: AsyncSession = Depends(get_async_db),
+):
+    items, has_more = await search_messages(db, room_id, q, limit, offset)
+    return ORJSONResponse(
+        {
+            "items": items,
+            "next_offset": offset + len(items) if has_more else None,
+            "has_more": has_more,
+        }
+    )
+
+
+@router.post("/message", dependencies=[Depends(limit_per_user("message"))])
+async def create_message(
     room_id: str = Form(...),
     text: str = Form(...),
     user=Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    msg = models.Message(room_id=room_id, user_id=user.id, username=user.name, text=text)
-    db.add(msg)
-    db.commit()
-    db.refresh(msg)
-
-    payload = {
-        "id": msg.id,
-        "room_id": room_id,
-        "username": user.name,
-        "text": msg.text,
-        "created_at": msg.created_at.isoformat(),
-    }
-
-    asyncio.create_task(sio.emit("chat_message", payload, to=room_id))
-    return payload
+    payload = await store_message(db, room_id, user.id, user.name, text)
+    await broadcasts.emit("chat_message", payload, to=room_id)
+    return ORJSONResponse(payload)
 
 
-@router.post("/upload")
+@router.post("/upload", dependencies=[Depends(limit_per_user("upload"))])
 async def upload_files(
     room_id: str = Form(...),
     files: List[UploadFile] = File(...),
     user=Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    os.makedirs(settings.upload_dir, exist_ok=True)
-    room_dir = os.path.join(settings.upload_dir, room_id)
-    os.makedirs(room_dir, exist_ok=True)
-
+    """Store every file of the request in one transaction and announce
+    them with a single ``files_uploaded`` event."""
     max_bytes = settings.max_upload_mb * 1024 * 1024
-    outs = []
-
-    for f in files:
-        ext = os.path.splitext(f.filename)[1]
-        name = f"{uuid.uuid4().hex}{ext}"
-        rel_path = os.path.join(room_id, name).replace("\\", "/")
-        abs_path = os.path.join(settings.upload_dir, rel_path)
-        size = 0
-
-        try:
-            async with aiofiles.open(abs_path, "wb") as out:
-                while True:
-                    chunk = await f.read(1024 * 1024)
-                    if not chunk:
-                        break
-                    size += len(chunk)
-                    if size > max_bytes:
-                        await out.close()
-                        os.remove(abs_path)
-                        raise HTTPException(
-                            status_code=413,
-                            detail=f"File too large (> {settings.max_upload_mb} MB)",
-                        )
-                    await out.write(chunk)
-        finally:
-            await f.close()
-
-        att = models.Attachment(
-            room_id=room_id,
-            user_id=user.id,
-            username=user.name,
-            original_name=f.filename,
-            stored_path=rel_path,
-            mime_type=f.content_type or "application/octet-stream",
-            size_bytes=size,
-        )
-
-        db.add(att)
-        db.commit()
-        db.refresh(att)
-
-        url = f"/files/{rel_path}"
-        payload = {
-            "id": att.id,
-            "room_id": room_id,
-            "username": user.name,
-            "original_name": att.original_name,
-            "mime_type": att.mime_type,
-            "size_bytes": att.size_bytes,
-            "url": url,
-            "created_at": att.created_at.isoformat(),
-        }
+    received = []
 
-        outs.append(payload)
-        asyncio.create_task(sio.emit("file_uploaded", payload, to=room_id))
+    try:
+        for f in files:
+            tmp_path, digest, size = await receive_upload(f, max_bytes)
+            received.append(ReceivedFile(tmp_path, digest, size, f.filename, f.content_type))
+    except BaseException:
+        # e.g. a later file over the size limit: drop the ones already read
+        for r in received:
+            discard(r.tmp_path)
+        raise
 
-    return outs
+    atts = await store_attachments(
+        db, received, room_id=room_id, user_id=user.id, username=user.name
+    )
+
+    outs = [attachment_payload(a) for a in atts]
+    await broadcasts.emit("files_uploaded", {"room_id": room_id, "items": outs}, to=room_id)
+    return ORJSONResponse(outs)
 
 
 @router.get("/attachments")
-def list_attachments(
+async def list_attachments(
     room_id: str = Query(...),
     limit: int = Query(default=50, ge=1, le=500),
-    db: Session = Depends(get_db),
+    before_id: int | None = Query(default=None, ge=1),
+    after_id: int | None = Query(default=None, ge=0),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    q = (
-        db.query(models.Attachment)
-        .filter(models.Attachment.room_id == room_id)
-        .order_by(models.Attachment.id.desc())
-        .limit(limit)
+    rows, has_more = await _keyset_page(
+        db,
+        select(models.Attachment).where(models.Attachment.room_id == room_id),
+        models.Attachment.id,
+        limit,
+        before_id,
+        after_id,
     )
-    return list(
-        reversed(
-            [
-                {
-                    "id": a.id,
-                    "room_id": a.room_id,
-                    "username": a.username,
-                    "original_name": a.original_name,
-                    "mime_type": a.mime_type,
-                    "size_bytes": a.size_bytes,
-                    "url": f"/files/{a.stored_path}",
-                    "created_at": a.created_at,
-                }
-                for a in q.all()
-            ]
-        )
+    return _page_body(
+        [attachment_payload(a) for a in rows],
+        has_more,
+        before_id,
+        after_id,
     )
 
-
-@router.delete("/attachments/expired")
-def delete_expired(db: Session = Depends(get_db)):
-    db.commit()
-    return {"removed": removed}
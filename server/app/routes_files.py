@@ -0,0 +1,122 @@
+import asyncio
+import mimetypes
+import os
+import stat
+from email.utils import formatdate, parsedate_to_datetime
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, Response
+from .config import settings
+from .storage import BLOB_DIR, CHUNK_SIZE, VARIANTS, is_compressible
+
+
+router = APIRouter(tags=["files"])
+
+# Stored names never change (blobs are named by their hash), so clients and
+# proxies may keep them forever
+_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class _AttachmentResponse(FileResponse):
+    # Fewer, larger reads; each one is a thread hop
+    chunk_size = CHUNK_SIZE
+
+
+def _stat_file(abs_path: str):
+    try:
+        st = os.stat(abs_path)
+    except OSError:
+        return None
+    return st if stat.S_ISREG(st.st_mode) else None
+
+
+def _resolve(path: str):
+    parts = path.split("/")
+    # Dot segments cover traversal as well as .incoming uploads
+    if not path or any(not p or p.startswith(".") for p in parts):
+        return None, None
+    abs_path = os.path.join(settings.upload_dir, *parts)
+    return abs_path, _stat_file(abs_path)
+
+
+def _etag(path: str, st: os.stat_result, encoding: str | None) -> str:
+    if path.startswith(f"{BLOB_DIR}/"):
+        # The name is the SHA-256 of the content: a true strong validator
+        tag = os.path.splitext(os.path.basename(path))[0]
+    else:
+        tag = f"{st.st_size:x}-{st.st_mtime_ns:x}"
+    return f'"{tag}-{encoding}"' if encoding else f'"{tag}"'
+
+
+def _accepts(request: Request, encoding: str) -> bool:
+    for item in request.headers.get("accept-encoding", "").split(","):
+        name, *params = [p.strip() for p in item.split(";")]
+        if name.lower() != encoding:
+            continue
+        for param in params:
+            if param.lower().startswith("q="):
+                try:
+                    return float(param[2:]) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+def _not_modified(request: Request, etag: str, st: os.stat_result) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+        return "*" in tags or etag in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(st.st_mtime) <= since
+    return False
+
+
+@router.api_route("/files/{path:path}", methods=["GET", "HEAD"])
+async def get_file(path: str, request: Request):
+    """Serve an attachment: strong ETag, immutable caching, Range, precompressed
+    variants, or X-Accel-Redirect."""
+    abs_path, st = await asyncio.to_thread(_resolve, path)
+    if st is None:
+        raise HTTPException(status_code=404, detail="Not found")
+
+    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    headers = {"Cache-Control": _CACHE_CONTROL}
+    serve_path, serve_st, encoding = abs_path, st, None
+
+    if is_compressible(path):
+        headers["Vary"] = "Accept-Encoding"
+        # Ranges refer to the identity bytes; media seeking never gets here
+        # anyway since audio/video aren't compressible
+        if "range" not in request.headers and not settings.files_accel_redirect:
+            for name, suffix in VARIANTS:
+                if _accepts(request, name):
+                    variant_st = await asyncio.to_thread(_stat_file, abs_path + suffix)
+                    if variant_st is not None:
+                        serve_path, serve_st, encoding = abs_path + suffix, variant_st, name
+                        headers["Content-Encoding"] = name
+                        break
+
+    headers["ETag"] = _etag(path, st, encoding)
+    headers["Last-Modified"] = formatdate(st.st_mtime, usegmt=True)
+
+    if _not_modified(request, headers["ETag"], st):
+        headers.pop("Content-Encoding", None)
+        return Response(status_code=304, headers=headers)
+
+    if settings.files_accel_redirect:
+        headers["X-Accel-Redirect"] = settings.files_accel_redirect.rstrip("/") + "/" + path
+        return Response(headers=headers, media_type=media_type)
+
+    return _AttachmentResponse(
+        serve_path,
+        headers=headers,
+        media_type=media_type,
+        stat_result=serve_st,
+    )
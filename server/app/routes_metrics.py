@@ -0,0 +1,202 @@
+import asyncio
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from anyio import to_thread
+from .auth import password_hasher
+from .config import settings
+from .db import async_engine, engine
+from .directory import directory_cache
+from .history_cache import history_cache
+from .metrics import registry
+from .outbound import OutboundQueue
+from .socketio_app import broadcasts, sessions, sio
+from .tasks import _unlink_pool, sweep_stats
+from .write_behind import message_writer
+
+
+router = APIRouter(tags=["metrics"])
+
+
+def _gauge(name, help, samples):
+    return (name, "gauge", help, samples)
+
+
+def _counter(name, help, samples):
+    return (name, "counter", help, samples)
+
+
+@registry.collector
+def _sockets():
+    rooms = sio.manager.rooms.get("/", {})
+    sids = rooms.get(None, {})
+    # Every sid also sits in a room named after itself
+    named = sum(1 for r in rooms if r is not None and r not in sids)
+    # Anonymous sids are cached too, as empty sessions
+    authenticated = sum(1 for sess in list(sessions.values()) if "user_id" in sess)
+    yield _gauge(
+        "chat_sio_connected_sids", "Authenticated sockets on this worker", [({}, authenticated)]
+    )
+    yield _gauge("chat_sio_rooms", "Chat rooms with sockets on this worker", [({}, named)])
+
+    queues = [s.queue for s in sio.eio.sockets.values() if isinstance(s.queue, OutboundQueue)]
+    yield _gauge(
+        "chat_sio_outbound_queued_bytes",
+        "Bytes waiting in socket send queues",
+        [({}, sum(q.bytes for q in queues))],
+    )
+    yield _gauge(
+        "chat_sio_outbound_max_queue_packets",
+        "Longest socket send queue",
+        [({}, max((q.qsize() for q in queues), default=0))],
+    )
+    yield _gauge(
+        "chat_sio_broadcasts_in_flight",
+        "Handler broadcasts not yet sent",
+        [({}, broadcasts.in_flight)],
+    )
+
+
+@registry.collector
+def _db_pools():
+    samples = {"size": [], "checked_out": [], "overflow": []}
+    for name, pool in (("sync", engine.pool), ("async", async_engine.sync_engine.pool)):
+        # StaticPool / NullPool (in-memory SQLite) don't track these
+        if not hasattr(pool, "checkedout"):
+            continue
+        labels = {"engine": name}
+        samples["size"].append((labels, pool.size()))
+        samples["checked_out"].append((labels, pool.checkedout()))
+        # Negative while the pool is still filling up
+        samples["overflow"].append((labels, max(pool.overflow(), 0)))
+    yield _gauge("chat_db_pool_size", "Connections the pool keeps open", samples["size"])
+    yield _gauge("chat_db_pool_checked_out", "Connections in use", samples["checked_out"])
+    yield _gauge(
+        "chat_db_pool_overflow", "Connections opened beyond the pool size", samples["overflow"]
+    )
+
+
+def _executor_samples(name: str, pool: ThreadPoolExecutor):
+    # No public API for these; the attributes have been stable since 3.8
+    labels = {"pool": name}
+    return (
+        (labels, pool._max_workers),
+        (labels, len(pool._threads)),
+        (labels, pool._work_queue.qsize()),
+    )
+
+
+@registry.collector
+def _threadpools():
+    # Starlette runs sync dependencies and file I/O on anyio's limiter,
+    # asyncio.to_thread uses the loop's default executor
+    limiter = to_thread.current_default_thread_limiter()
+    anyio_labels = {"pool": "anyio"}
+    rows = [
+        (
+            (anyio_labels, limiter.total_tokens),
+            (anyio_labels, limiter.borrowed_tokens),
+            (anyio_labels, limiter.statistics().tasks_waiting),
+        ),
+        _executor_samples("sweep-unlink", _unlink_pool),
+    ]
+    default = getattr(asyncio.get_running_loop(), "_default_executor", None)
+    if isinstance(default, ThreadPoolExecutor):
+        rows.append(_executor_samples("asyncio", default))
+
+    yield _gauge("chat_threadpool_max_workers", "Thread pool capacity", [r[0] for r in rows])
+    yield _gauge(
+        "chat_threadpool_busy",
+        "Threads started (asyncio) or borrowed (anyio)",
+        [r[1] for r in rows],
+    )
+    yield _gauge("chat_threadpool_queued", "Jobs waiting for a thread", [r[2] for r in rows])
+
+
+@registry.collector
+def _password_hasher():
+    yield _gauge(
+        "chat_password_hash_workers", "bcrypt pool processes", [({}, password_hasher.workers)]
+    )
+    yield _gauge(
+        "chat_password_hash_pending",
+        "bcrypt jobs queued or running",
+        [({}, password_hasher.pending)],
+    )
+    yield _counter(
+        "chat_password_hash_rejected_total",
+        "bcrypt jobs refused with 503",
+        [({}, password_hasher.rejected)],
+    )
+
+
+@registry.collector
+def _sweeps():
+    yield _counter(
+        "chat_cleanup_sweeps_total", "Attachment expiry sweeps run", [({}, sweep_stats["sweeps"])]
+    )
+    yield _counter(
+        "chat_cleanup_rows_total", "Expired attachments deleted", [({}, sweep_stats["rows_total"])]
+    )
+    yield _counter(
+        "chat_cleanup_files_total", "Files unlinked by sweeps", [({}, sweep_stats["files_total"])]
+    )
+    yield _counter(
+        "chat_cleanup_stale_uploads_total",
+        "Abandoned resumable uploads dropped",
+        [({}, sweep_stats["stale_uploads_total"])],
+    )
+    yield _gauge(
+        "chat_cleanup_last_duration_seconds",
+        "Duration of the latest sweep",
+        [({}, sweep_stats["last_duration_s"])],
+    )
+
+
+@registry.collector
+def _caches():
+    stats = history_cache.stats()
+    yield _gauge("chat_history_cache_bytes", "Recent-message cache size", [({}, stats["bytes"])])
+    yield _counter(
+        "chat_cache_hits_total",
+        "Cache hits",
+        [({"cache": "history"}, stats["hits"]), ({"cache": "directory"}, directory_cache.hits)],
+    )
+    yield _counter(
+        "chat_cache_misses_total",
+        "Cache misses",
+        [
+            ({"cache": "history"}, stats["misses"]),
+            ({"cache": "directory"}, directory_cache.misses),
+        ],
+    )
+
+
+@registry.collector
+def _write_behind():
+    if not message_writer.enabled:
+        return
+    yield _gauge(
+        "chat_write_behind_queued",
+        "Messages waiting to be persisted",
+        [({}, message_writer.queued)],
+    )
+    yield _counter(
+        "chat_write_behind_persisted_total", "Messages persisted", [({}, message_writer.persisted)]
+    )
+    yield _counter(
+        "chat_write_behind_failures_total", "Failed batch inserts", [({}, message_writer.failures)]
+    )
+
+
+def _check_token(creds: HTTPAuthorizationCredentials = Depends(HTTPBearer(auto_error=False))):
+    token = settings.metrics_token
+    if token and (creds is None or not secrets.compare_digest(creds.credentials, token)):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+
+
+@router.get("/metrics", include_in_schema=False, dependencies=[Depends(_check_token)])
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -1,64 +1,71 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 import uuid
-from .db import get_db
+from .db import get_async_db
 from . import models
 from .auth import get_current_user
+from .directory import directory_cache, rooms_key
+from .socketio_app import broadcasts
 
 
 router = APIRouter(prefix="/rooms", tags=["rooms"])
 
 
+def _cached(request: Request, body: bytes, etag: str) -> Response:
+    # no-cache: clients keep the listing but revalidate it on every launch
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in {t.strip().removeprefix("W/") for t in if_none_match.split(",")}:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
 @router.get("/countries")
-def list_countries(db: Session = Depends(get_db)):
-    if db.query(models.Country).count() == 0:
-        for c in [
-            ("ID", "Indonesia"),
-            ("US", "United States"),
-            ("MY", "Malaysia"),
-            ("SG", "Singapore"),
-        ]:
-            db.add(models.Country(code=c[0], name=c[1]))
-        db.commit()
-
-    return [
-        {"code": r.code, "name": r.name}
-        for r in db.query(models.Country).order_by(models.Country.name).all()
-    ]
+async def list_countries(request: Request, db: AsyncSession = Depends(get_async_db)):
+    async def load():
+        rows = await db.scalars(select(models.Country).order_by(models.Country.name))
+        return [{"code": r.code, "name": r.name} for r in rows]
+
+    return _cached(request, *await directory_cache.get("countries", load))
 
 
 @router.get("")
-def rooms_by_country(
+async def rooms_by_country(
+    request: Request,
     code: str = Query(..., min_length=2, max_length=2),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    rows = (
-        db.query(models.Room)
-        .filter(models.Room.country_code == code.upper())
-        .order_by(models.Room.name)
-        .all()
-    )
-    return [{"id": r.id, "name": r.name} for r in rows]
+    code = code.upper()
+
+    async def load():
+        rows = await db.scalars(
+            select(models.Room)
+            .where(models.Room.country_code == code)
+            .order_by(models.Room.name)
+        )
+        return [{"id": r.id, "name": r.name} for r in rows]
+
+    return _cached(request, *await directory_cache.get(rooms_key(code), load))
 
 
 @router.post("/create")
-def create_room(
+async def create_room(
     code: str,
     name: str,
     user=Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     code = code.upper().strip()
     name_norm = name.strip()
 
     if not name_norm:
         raise HTTPException(status_code=400, detail="Room name required")
-    if not db.get(models.Country, code):
+    if not await db.get(models.Country, code):
         raise HTTPException(status_code=404, detail="Country not found")
-    if (
-        db.query(models.Room)
-        .filter(models.Room.country_code == code, models.Room.name == name_norm)
-        .first()
+    if await db.scalar(
+        select(models.Room)
+        .where(models.Room.country_code == code, models.Room.name == name_norm)
     ):
         raise HTTPException(status_code=409, detail="Room name already exists in this country")
 
@@ -70,7 +77,9 @@ def create_room(
     )
 
     db.add(room)
-    db.commit()
-    db.refresh(room)
+    await db.commit()
 
+    directory_cache.invalidate(rooms_key(code))
+    payload = {"id": room.id, "name": room.name, "country_code": code}
+    await broadcasts.emit("room_created", payload)
     return {"id": room.id, "name": room.name}
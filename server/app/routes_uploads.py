@@ -0,0 +1,216 @@
+import asyncio
+import uuid
+from typing import List
+import aiofiles
+from fastapi import APIRouter, Depends, Form, HTTPException, Query, Request
+from sqlalchemy import func, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.requests import ClientDisconnect
+from .auth import get_current_user
+from .config import settings
+from .db import get_async_db
+from . import models
+from .messaging import attachment_payload
+from .ratelimit import limit_per_user
+from .socketio_app import broadcasts
+from .storage import ReceivedFile, discard, hash_file, incoming_path, store_attachments
+
+
+# Resumable uploads: POST creates a session, PUT ?offset=N appends raw
+# bytes, GET reports the offset to resume from, POST .../complete finalizes
+# one upload and POST /complete several at once
+router = APIRouter(prefix="/chat/uploads", tags=["chat"])
+
+
+def _status(up: models.UploadSession, offset: int | None = None) -> dict:
+    return {
+        "id": up.id,
+        "offset": up.received_bytes if offset is None else offset,
+        "size_bytes": up.size_bytes,
+        "chunk_size": settings.upload_chunk_mb * 1024 * 1024,
+    }
+
+
+# Uploads finalized by one POST /complete
+_MAX_BATCH = 100
+
+
+def _offset_conflict(offset: int, upload_id: str | None = None):
+    detail = {"message": "Offset mismatch, resume from the reported offset", "offset": offset}
+    if upload_id is not None:
+        detail["id"] = upload_id
+    return HTTPException(status_code=409, detail=detail)
+
+
+async def _get_session(db: AsyncSession, upload_id: str, user) -> models.UploadSession:
+    up = await db.get(models.UploadSession, upload_id)
+    if up is None or up.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return up
+
+
+@router.post("", dependencies=[Depends(limit_per_user("upload"))])
+async def create_upload(
+    room_id: str = Form(...),
+    filename: str = Form(...),
+    size_bytes: int = Form(..., ge=0),
+    mime_type: str = Form(default="application/octet-stream"),
+    user=Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    if size_bytes > settings.max_upload_mb * 1024 * 1024:
+        raise HTTPException(
+            status_code=413, detail=f"File too large (> {settings.max_upload_mb} MB)"
+        )
+    if await db.get(models.Room, room_id) is None:
+        raise HTTPException(status_code=404, detail="Room not found")
+
+    up = models.UploadSession(
+        id=str(uuid.uuid4()),
+        room_id=room_id,
+        user_id=user.id,
+        filename=filename,
+        mime_type=mime_type,
+        size_bytes=size_bytes,
+        received_bytes=0,
+    )
+    # Chunks are written in place at their offset
+    async with aiofiles.open(incoming_path(up.id), "wb"):
+        pass
+    db.add(up)
+    await db.commit()
+    return _status(up)
+
+
+@router.get("/{upload_id}")
+async def get_upload(
+    upload_id: str,
+    user=Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    return _status(await _get_session(db, upload_id, user))
+
+
+@router.put("/{upload_id}")
+async def put_chunk(
+    upload_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0),
+    user=Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Stream the body to ``offset``; bytes of a dropped connection are kept."""
+    up = await _get_session(db, upload_id, user)
+    if offset != up.received_bytes:
+        raise _offset_conflict(up.received_bytes)
+    remaining = up.size_bytes - offset
+    # Release the connection while the body streams in
+    await db.commit()
+
+    written = 0
+    try:
+        async with aiofiles.open(incoming_path(up.id), "r+b") as out:
+            await out.seek(offset)
+            async for chunk in request.stream():
+                if written + len(chunk) > remaining:
+                    raise HTTPException(status_code=413, detail="Chunk runs past the declared size")
+                await out.write(chunk)
+                written += len(chunk)
+    except ClientDisconnect:
+        pass
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+
+    if written:
+        # Conditional on the old offset: a concurrent PUT for the same
+        # range makes one of the two fail instead of double-counting
+        result = await db.execute(
+            update(models.UploadSession)
+            .where(
+                models.UploadSession.id == up.id,
+                models.UploadSession.received_bytes == offset,
+            )
+            .values(received_bytes=offset + written, updated_at=func.now())
+        )
+        await db.commit()
+        if result.rowcount == 0:
+            await db.refresh(up)
+            raise _offset_conflict(up.received_bytes)
+
+    return _status(up, offset + written)
+
+
+async def _finalize(db: AsyncSession, ups: List[models.UploadSession], user):
+    """Turn finished sessions into attachments in one transaction. On an
+    error the sessions and their data stay, so the client can retry."""
+    for up in ups:
+        if up.received_bytes != up.size_bytes:
+            raise _offset_conflict(up.received_bytes, up.id if len(ups) > 1 else None)
+
+    paths = [incoming_path(up.id) for up in ups]
+    try:
+        digests = await asyncio.gather(*(asyncio.to_thread(hash_file, p) for p in paths))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+
+    received = [
+        ReceivedFile(path, digest, up.size_bytes, up.filename, up.mime_type)
+        for path, digest, up in zip(paths, digests, ups)
+    ]
+    # Dropping the sessions commits together with the attachments
+    for up in ups:
+        await db.delete(up)
+    return await store_attachments(
+        db,
+        received,
+        room_id=ups[0].room_id,
+        user_id=user.id,
+        username=user.name,
+        keep_on_error=True,
+    )
+
+
+@router.post("/complete")
+async def complete_uploads(
+    ids: List[str] = Form(...),
+    user=Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Finalize several uploads of one room together, e.g. a drop of
+    files: one transaction and a single ``files_uploaded`` event."""
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > _MAX_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {_MAX_BATCH} uploads at once")
+    ups = [await _get_session(db, upload_id, user) for upload_id in ids]
+    room_id = ups[0].room_id
+    if any(up.room_id != room_id for up in ups):
+        raise HTTPException(status_code=400, detail="Uploads belong to different rooms")
+
+    outs = [attachment_payload(a) for a in await _finalize(db, ups, user)]
+    await broadcasts.emit("files_uploaded", {"room_id": room_id, "items": outs}, to=room_id)
+    return outs
+
+
+@router.post("/{upload_id}/complete")
+async def complete_upload(
+    upload_id: str,
+    user=Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    (att,) = await _finalize(db, [await _get_session(db, upload_id, user)], user)
+    payload = attachment_payload(att)
+    await broadcasts.emit("file_uploaded", payload, to=att.room_id)
+    return payload
+
+
+@router.delete("/{upload_id}")
+async def abort_upload(
+    upload_id: str,
+    user=Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    up = await _get_session(db, upload_id, user)
+    await db.delete(up)
+    await db.commit()
+    discard(incoming_path(upload_id))
+    return {"ok": True}
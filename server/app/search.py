@@ -0,0 +1,212 @@
+import argparse
+import html
+import logging
+from typing import List
+from sqlalchemy import DateTime, inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+from .config import settings
+from . import models
+
+
+logger = logging.getLogger(__name__)
+
+# Highlight markers that can't occur in chat text; swapped for <mark> after
+# the snippet has been HTML-escaped
+_HL_START, _HL_END = "\x02", "\x03"
+
+_SQLITE_DDL = [
+    # External-content FTS5 table: the text lives in messages only once.
+    # room_id is indexed too so a query only walks its own room's postings
+    "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+    "text, room_id, content='messages', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN "
+    "INSERT INTO messages_fts(rowid, text, room_id) VALUES (new.id, new.text, new.room_id); END",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN "
+    "INSERT INTO messages_fts(messages_fts, rowid, text, room_id) "
+    "VALUES ('delete', old.id, old.text, old.room_id); END",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF text, room_id ON messages BEGIN "
+    "INSERT INTO messages_fts(messages_fts, rowid, text, room_id) "
+    "VALUES ('delete', old.id, old.text, old.room_id); "
+    "INSERT INTO messages_fts(rowid, text, room_id) VALUES (new.id, new.text, new.room_id); END",
+]
+_SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS messages_fts_ai",
+    "DROP TRIGGER IF EXISTS messages_fts_ad",
+    "DROP TRIGGER IF EXISTS messages_fts_au",
+    "DROP TABLE IF EXISTS messages_fts",
+]
+
+_POSTGRES_DDL = [
+    "ALTER TABLE messages ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    "CREATE OR REPLACE FUNCTION messages_search_vector_update() RETURNS trigger AS $$ "
+    "BEGIN NEW.search_vector := to_tsvector(CAST(:cfg AS regconfig), NEW.text); RETURN NEW; END "
+    "$$ LANGUAGE plpgsql",
+    # CREATE OR REPLACE TRIGGER needs Postgres 14
+    "DROP TRIGGER IF EXISTS messages_search_vector ON messages",
+    "CREATE TRIGGER messages_search_vector BEFORE INSERT OR UPDATE OF text ON messages "
+    "FOR EACH ROW EXECUTE FUNCTION messages_search_vector_update()",
+]
+# One index over (room_id, search_vector) so a search only reads its room's
+# entries; btree_gin provides the GIN opclass for the text column
+_POSTGRES_ROOM_INDEX = [
+    "CREATE EXTENSION IF NOT EXISTS btree_gin",
+    "CREATE INDEX IF NOT EXISTS ix_messages_room_search ON messages "
+    "USING gin (room_id, search_vector)",
+    "DROP INDEX IF EXISTS ix_messages_search_vector",
+]
+_POSTGRES_GLOBAL_INDEX = (
+    "CREATE INDEX IF NOT EXISTS ix_messages_search_vector ON messages USING gin (search_vector)"
+)
+
+
+def _fts_has_room(engine: Engine) -> bool:
+    with engine.connect() as conn:
+        cols = conn.execute(text("PRAGMA table_info(messages_fts)")).all()
+    return any(c[1] == "room_id" for c in cols)
+
+
+def setup_search_index(engine: Engine):
+    """Create the full-text index and the triggers that keep it current."""
+    dialect = engine.dialect.name
+    if dialect == "sqlite":
+        existed = inspect(engine).has_table("messages_fts")
+        ddl = _SQLITE_DDL
+        if existed and not _fts_has_room(engine):
+            # Index from before room_id was indexed: recreate and refill it
+            with engine.begin() as conn:
+                for stmt in _SQLITE_DROP + _SQLITE_DDL:
+                    conn.execute(text(stmt))
+                conn.execute(text("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')"))
+            logger.info("Rebuilt the search index with per-room entries")
+            return
+    elif dialect == "postgresql":
+        existed = any(c["name"] == "search_vector" for c in inspect(engine).get_columns("messages"))
+        # Plain SQL function body: bind the config in as a literal
+        cfg = settings.search_ts_config.replace("'", "''")
+        ddl = [s.replace(":cfg", f"'{cfg}'") for s in _POSTGRES_DDL]
+    else:
+        logger.warning("Full-text search is not supported on %s", dialect)
+        return
+
+    with engine.begin() as conn:
+        for stmt in ddl:
+            conn.execute(text(stmt))
+        if not existed and conn.execute(text("SELECT 1 FROM messages LIMIT 1")).first():
+            logger.warning(
+                "Search index created on a non-empty messages table; "
+                "run `python -m app.search backfill` to index existing messages"
+            )
+
+    if dialect == "postgresql":
+        try:
+            with engine.begin() as conn:
+                for stmt in _POSTGRES_ROOM_INDEX:
+                    conn.execute(text(stmt))
+        except DBAPIError as e:
+            logger.warning(
+                "btree_gin unavailable (%s); searches scan the whole-table index", e.orig
+            )
+            with engine.begin() as conn:
+                conn.execute(text(_POSTGRES_GLOBAL_INDEX))
+
+
+def backfill(engine: Engine, batch_size: int = 5000) -> int:
+    """Index messages written before the search index existed."""
+    if engine.dialect.name == "sqlite":
+        # External-content tables rebuild from messages in one pass
+        with engine.begin() as conn:
+            conn.execute(text("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')"))
+            return conn.execute(text("SELECT COUNT(*) FROM messages")).scalar()
+
+    # Postgres: short batches so the table is never locked for long
+    stmt = text(
+        "UPDATE messages SET search_vector = to_tsvector(CAST(:cfg AS regconfig), text) "
+        "WHERE id IN (SELECT id FROM messages WHERE search_vector IS NULL LIMIT :n)"
+    )
+    total = 0
+    while True:
+        with engine.begin() as conn:
+            n = conn.execute(stmt, {"cfg": settings.search_ts_config, "n": batch_size}).rowcount
+        total += n
+        if n < batch_size:
+            return total
+
+
+def _fts5_query(room_id: str, q: str) -> str:
+    # Quote every term so user input can't hit FTS5 query syntax errors;
+    # the last term is a prefix so results follow as the user types
+    terms = [t.replace('"', "") for t in q.split()]
+    terms = [f'"{t}"' for t in terms if t]
+    if not terms:
+        return ""
+    terms[-1] += "*"
+    room = room_id.replace('"', "")
+    return f'room_id : "{room}" AND text : ({" ".join(terms)})'
+
+
+def _highlight(snippet: str) -> str:
+    return html.escape(snippet).replace(_HL_START, "<mark>").replace(_HL_END, "</mark>")
+
+
+async def search_messages(
+    db: AsyncSession, room_id: str, q: str, limit: int, offset: int
+) -> tuple[List[dict], bool]:
+    """Best matches for ``q`` in a room, ``limit + 1`` fetched to tell
+    whether another page exists. Snippets are HTML-escaped with matches
+    wrapped in ``<mark>``."""
+    params = {"room_id": room_id, "limit": limit + 1, "offset": offset}
+
+    if db.bind.dialect.name == "sqlite":
+        params["q"] = _fts5_query(room_id, q)
+        if not params["q"]:
+            return [], False
+        stmt = text(
+            "SELECT m.id, m.room_id, m.username, m.text, m.created_at, "
+            f"snippet(messages_fts, 0, '{_HL_START}', '{_HL_END}', '…', 16) AS snippet "
+            "FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid "
+            "WHERE messages_fts MATCH :q AND m.room_id = :room_id "
+            "ORDER BY bm25(messages_fts, 1.0, 0.0), m.id DESC LIMIT :limit OFFSET :offset"
+        )
+    else:
+        params["q"] = q
+        params["cfg"] = settings.search_ts_config
+        stmt = text(
+            "SELECT m.id, m.room_id, m.username, m.text, m.created_at, "
+            "ts_headline(CAST(:cfg AS regconfig), m.text, query, "
+            f"'StartSel={_HL_START}, StopSel={_HL_END}, MaxFragments=2, MaxWords=24') AS snippet "
+            "FROM messages m, websearch_to_tsquery(CAST(:cfg AS regconfig), :q) query "
+            "WHERE m.room_id = :room_id AND m.search_vector @@ query "
+            "ORDER BY ts_rank_cd(m.search_vector, query) DESC, m.id DESC "
+            "LIMIT :limit OFFSET :offset"
+        )
+
+    stmt = stmt.columns(created_at=DateTime(timezone=True))
+    rows = (await db.execute(stmt, params)).mappings().all()
+    items = [
+        {
+            "id": r["id"],
+            "room_id": r["room_id"],
+            "username": r["username"],
+            "text": r["text"],
+            "snippet": _highlight(r["snippet"]),
+            "created_at": models.utc_isoformat(r["created_at"]),
+        }
+        for r in rows[:limit]
+    ]
+    return items, len(rows) > limit
+
+
+if __name__ == "__main__":
+    from .db import engine
+
+    parser = argparse.ArgumentParser(description="Maintain the message search index")
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    setup_search_index(engine)
+    print(f"Indexed {backfill(engine, args.batch_size)} messages")
@@ -0,0 +1,15 @@
+import orjson
+
+
+class SocketIOJSON:
+    """orjson-backed ``json`` stand-in for python-socketio."""
+
+    @staticmethod
+    def dumps(obj, **kwargs) -> str:
+        # socketio passes stdlib-only options (separators=...); orjson's
+        # output is already compact
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    @staticmethod
+    def loads(s, **kwargs):
+        return orjson.loads(s)
@@ -0,0 +1,210 @@
+import json
+import time
+import aiosqlite
+from collections import defaultdict
+from typing import Dict, List, Optional, Set
+from urllib.parse import urlparse
+from sqlalchemy.engine import make_url
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # optional, only needed for redis:// stores
+    aioredis = None
+
+
+class MemorySessionStore:
+    """Socket session and room presence state for a single process."""
+
+    def __init__(self):
+        self._sessions: Dict[str, dict] = {}
+        self._rooms: Dict[str, Set[str]] = defaultdict(set)
+
+    async def save(self, sid: str, data: dict):
+        self._sessions[sid] = data
+
+    async def load(self, sid: str) -> Optional[dict]:
+        return self._sessions.get(sid)
+
+    async def delete(self, sid: str):
+        self._sessions.pop(sid, None)
+
+    async def join(self, room_id: str, sid: str) -> int:
+        self._rooms[room_id].add(sid)
+        return len(self._rooms[room_id])
+
+    async def leave(self, room_id: str, sid: str) -> int:
+        members = self._rooms.get(room_id)
+        if members is None:
+            return 0
+        members.discard(sid)
+        if not members:
+            del self._rooms[room_id]
+        return len(members)
+
+    async def count(self, room_id: str) -> int:
+        return len(self._rooms.get(room_id, ()))
+
+    async def touch(self, sids: Dict[str, List[str]]):
+        # Dies with its process, so nothing here can outlive the worker
+        pass
+
+
+class RedisSessionStore:
+    """Session and presence state in Redis, expiring ``ttl`` after the last touch."""
+
+    def __init__(self, url: str, ttl: int, prefix: str = "impact"):
+        if aioredis is None:
+            raise RuntimeError("redis package is required for a redis:// session store")
+        self.redis = aioredis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _room_key(self, room_id: str) -> str:
+        # Sorted set of sid -> expiry time
+        return f"{self.prefix}:presence:{room_id}"
+
+    async def save(self, sid: str, data: dict):
+        await self.redis.set(f"{self.prefix}:sess:{sid}", json.dumps(data), ex=self.ttl)
+
+    async def load(self, sid: str) -> Optional[dict]:
+        raw = await self.redis.get(f"{self.prefix}:sess:{sid}")
+        return json.loads(raw) if raw else None
+
+    async def delete(self, sid: str):
+        await self.redis.delete(f"{self.prefix}:sess:{sid}")
+
+    async def join(self, room_id: str, sid: str) -> int:
+        key = self._room_key(room_id)
+        now = time.time()
+        async with self.redis.pipeline() as p:
+            p.zadd(key, {sid: now + self.ttl}).expire(key, self.ttl)
+            *_, n = await p.zremrangebyscore(key, "-inf", now).zcard(key).execute()
+        return n
+
+    async def leave(self, room_id: str, sid: str) -> int:
+        key = self._room_key(room_id)
+        async with self.redis.pipeline() as p:
+            p.zrem(key, sid).zremrangebyscore(key, "-inf", time.time())
+            *_, n = await p.zcard(key).execute()
+        return n
+
+    async def count(self, room_id: str) -> int:
+        return await self.redis.zcount(self._room_key(room_id), time.time(), "+inf")
+
+    async def touch(self, sids: Dict[str, List[str]]):
+        expires = time.time() + self.ttl
+        async with self.redis.pipeline(transaction=False) as p:
+            for sid, rooms in sids.items():
+                p.expire(f"{self.prefix}:sess:{sid}", self.ttl)
+                for room_id in rooms:
+                    key = self._room_key(room_id)
+                    p.zadd(key, {sid: expires}).expire(key, self.ttl)
+            await p.execute()
+
+
+class SqliteSessionStore:
+    """Session and presence state shared by workers on one host via a
+    SQLite file; a stand-in for Redis in development and tests. Rows expire
+    like the Redis store's keys."""
+
+    def __init__(self, path: str, ttl: int):
+        self.path = path
+        self.ttl = ttl
+        self._db = None
+
+    async def _conn(self):
+        if self._db is None:
+            self._db = await aiosqlite.connect(self.path, isolation_level=None)
+            await self._db.execute("PRAGMA journal_mode=WAL")
+            await self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sio_sessions "
+                "(sid TEXT PRIMARY KEY, data TEXT, expires REAL NOT NULL DEFAULT 0)"
+            )
+            await self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sio_presence "
+                "(room_id TEXT, sid TEXT, expires REAL NOT NULL DEFAULT 0, "
+                "PRIMARY KEY (room_id, sid))"
+            )
+            for table in ("sio_sessions", "sio_presence"):
+                async with self._db.execute(f"PRAGMA table_info({table})") as cur:
+                    if "expires" not in [r[1] for r in await cur.fetchall()]:
+                        # Created before entries expired
+                        await self._db.execute(
+                            f"ALTER TABLE {table} ADD COLUMN expires REAL NOT NULL DEFAULT 0"
+                        )
+        return self._db
+
+    async def save(self, sid: str, data: dict):
+        db = await self._conn()
+        await db.execute(
+            "INSERT OR REPLACE INTO sio_sessions (sid, data, expires) VALUES (?, ?, ?)",
+            (sid, json.dumps(data), time.time() + self.ttl),
+        )
+
+    async def load(self, sid: str) -> Optional[dict]:
+        db = await self._conn()
+        async with db.execute(
+            "SELECT data FROM sio_sessions WHERE sid = ? AND expires > ?", (sid, time.time())
+        ) as cur:
+            row = await cur.fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def delete(self, sid: str):
+        db = await self._conn()
+        await db.execute("DELETE FROM sio_sessions WHERE sid = ?", (sid,))
+
+    async def join(self, room_id: str, sid: str) -> int:
+        db = await self._conn()
+        await db.execute(
+            "INSERT OR REPLACE INTO sio_presence (room_id, sid, expires) VALUES (?, ?, ?)",
+            (room_id, sid, time.time() + self.ttl),
+        )
+        return await self.count(room_id)
+
+    async def leave(self, room_id: str, sid: str) -> int:
+        db = await self._conn()
+        await db.execute(
+            "DELETE FROM sio_presence WHERE room_id = ? AND sid = ?", (room_id, sid)
+        )
+        return await self.count(room_id)
+
+    async def count(self, room_id: str) -> int:
+        db = await self._conn()
+        async with db.execute(
+            "SELECT COUNT(*) FROM sio_presence WHERE room_id = ? AND expires > ?",
+            (room_id, time.time()),
+        ) as cur:
+            return (await cur.fetchone())[0]
+
+    async def touch(self, sids: Dict[str, List[str]]):
+        db = await self._conn()
+        now = time.time()
+        expires = now + self.ttl
+        await db.execute("BEGIN")
+        try:
+            await db.executemany(
+                "UPDATE sio_sessions SET expires = ? WHERE sid = ?",
+                [(expires, sid) for sid in sids],
+            )
+            await db.executemany(
+                "INSERT OR REPLACE INTO sio_presence (room_id, sid, expires) VALUES (?, ?, ?)",
+                [(room_id, sid, expires) for sid, rooms in sids.items() for room_id in rooms],
+            )
+            await db.execute("DELETE FROM sio_sessions WHERE expires <= ?", (now,))
+            await db.execute("DELETE FROM sio_presence WHERE expires <= ?", (now,))
+            await db.execute("COMMIT")
+        except BaseException:
+            await db.execute("ROLLBACK")
+            raise
+
+
+def make_session_store(url: str, ttl: int):
+    scheme = urlparse(url).scheme if url else "memory"
+    if scheme == "memory":
+        return MemorySessionStore()
+    if scheme in ("redis", "rediss"):
+        return RedisSessionStore(url, ttl)
+    if scheme == "sqlite":
+        # Same path convention as DATABASE_URL: sqlite:///relative, sqlite:////absolute
+        return SqliteSessionStore(make_url(url).database, ttl)
+    raise ValueError(f"Unsupported SESSION_STORE_URL scheme: {scheme}")
@@ -1,32 +1,124 @@
-import socketio
-import jwt
+import asyncio
+import logging
 from typing import Dict
 from .config import settings
+from .db import AsyncSessionLocal
+from .auth import USER_CHANGED_EVENT, user_from_token
+from .messaging import store_message
+from .coalescer import RoomEventCoalescer
+from .broker import make_client_manager, on_remote_emit
+from .serialization import SocketIOJSON
+from .metrics import InstrumentedAsyncServer
+from .outbound import BoundedEngineIOServer, BroadcastLimiter
+from .ratelimit import rate_limiter
+from .session_store import make_session_store
 
 
-sio = socketio.AsyncServer(
+class ChatServer(InstrumentedAsyncServer):
+    def _engineio_server_class(self):
+        # Engine.IO sockets with capped send queues (app.outbound)
+        return BoundedEngineIOServer
+
+
+sio = ChatServer(
     async_mode="asgi",
     cors_allowed_origins=settings.sio_cors_origins or "*",
+    client_manager=make_client_manager(settings.sio_message_queue),
+    json=SocketIOJSON,
 )
 
+# Fire-and-forget broadcasts from request handlers, capped in flight
+broadcasts = BroadcastLimiter(sio, settings.sio_max_inflight_broadcasts)
+
+# Shared across workers; `sessions` below is this worker's copy for the
+# sids connected to it, so hot handlers don't round-trip to the store
+store = make_session_store(settings.session_store_url, settings.session_ttl_seconds)
 sessions: Dict[str, dict] = {}
 
+logger = logging.getLogger(__name__)
+
+coalescer = RoomEventCoalescer(
+    sio,
+    store,
+    typing_window_ms=settings.typing_window_ms,
+    typing_ttl_ms=settings.typing_ttl_ms,
+    presence_window_ms=settings.presence_window_ms,
+)
+
+
+async def _save_session(sid, sess):
+    sessions[sid] = sess
+    await store.save(sid, sess)
+
+
+async def _session(sid) -> dict:
+    sess = sessions.get(sid)
+    if sess is None:
+        # Not cached here (e.g. an anonymous sid); remember the answer either way
+        sess = sessions[sid] = await store.load(sid) or {}
+    return sess
+
+
+@on_remote_emit(USER_CHANGED_EVENT)
+def rename_user_sessions(payload: dict):
+    """Give this worker's sockets of a renamed account the new name; a
+    display name set with set_profile is kept."""
+    if "name" not in payload:
+        return
+    for sess in list(sessions.values()):
+        if sess.get("user_id") == payload["id"]:
+            if sess.get("name") == sess["user_name"]:
+                sess["name"] = payload["name"]
+            sess["user_name"] = payload["name"]
+
+
+def _user_key(sid, sess) -> str:
+    # Display names aren't unique; accounts (or anonymous sockets) are
+    return f"u{sess['user_id']}" if "user_id" in sess else f"s{sid}"
+
+
+async def session_refresh_loop():
+    """Keep the store's entries for this worker's sockets from expiring;
+    if the worker dies they lapse after SESSION_TTL_SECONDS."""
+    while True:
+        await asyncio.sleep(settings.session_ttl_seconds / 3)
+        try:
+            connected = sio.manager.rooms.get("/", {}).get(None, {})
+            await store.touch(
+                {sid: [r for r in sio.rooms(sid) if r != sid] for sid in list(connected)}
+            )
+        except Exception:
+            logger.exception("Refreshing socket sessions failed")
+
+
+async def _rate_limited(name: str, key) -> dict | None:
+    """The error ack for an event over its rate limit, else None."""
+    retry_after = await rate_limiter.hit(name, key)
+    if retry_after:
+        return {"ok": False, "error": "Rate limited", "retry_after": round(retry_after, 3)}
+    return None
+
 
 @sio.event
-def connect(sid, environ, auth):
+async def connect(sid, environ, auth):
     if auth and auth.get("token"):
         try:
-            data = jwt.decode(auth["token"], settings.jwt_secret, algorithms=["HS256"])
-            sessions[sid] = {"user_id": int(data["sub"]), "name": ""}
+            async with AsyncSessionLocal() as db:
+                user = await user_from_token(auth["token"], db)
+            # user_name is the account name used for messages; name is the
+            # display name set_profile may change
+            await _save_session(
+                sid, {"user_id": user.id, "user_name": user.name, "name": user.name}
+            )
         except Exception:
             pass
 
 
 @sio.event
 async def set_profile(sid, data):
-    sess = sessions.get(sid, {})
+    sess = await _session(sid)
     sess["name"] = (data or {}).get("name", "anon")
-    sessions[sid] = sess
+    await _save_session(sid, sess)
 
 
 @sio.event
@@ -34,42 +126,70 @@ async def join_room(sid, data):
     room_id = (data or {}).get("room_id")
     if not room_id:
         return
+    if limited := await _rate_limited("join_room", sid):
+        return limited
 
-    for room in list(await sio.rooms(sid)):
+    sess = await _session(sid)
+    key, name = _user_key(sid, sess), sess.get("name", "anon")
+    for room in list(sio.rooms(sid)):
         if room != sid:
             await sio.leave_room(sid, room)
+            online = await store.leave(room, sid)
+            await coalescer.presence(room, key, name, False, online)
 
     await sio.enter_room(sid, room_id)
-    await sio.emit(
-        "user_joined",
-        {"username": sessions.get(sid, {}).get("name", "anon"), "room": room_id},
-        to=room_id,
-    )
+    online = await store.join(room_id, sid)
+    await coalescer.presence(room_id, key, name, True, online)
+
+
+@sio.event
+async def send_message(sid, data):
+    """Post a chat message over the socket; the ack carries the stored
+    message (``{"ok": true, "id": ..., "message": {...}}``)."""
+    sess = await _session(sid)
+    if "user_id" not in sess:
+        return {"ok": False, "error": "Not authenticated"}
+
+    room_id = (data or {}).get("room_id")
+    text = (data or {}).get("text")
+    if not room_id or not text:
+        return {"ok": False, "error": "room_id and text are required"}
+    # Same bucket as POST /chat/message
+    if limited := await _rate_limited("message", f"u{sess['user_id']}"):
+        return limited
+
+    try:
+        async with AsyncSessionLocal() as db:
+            payload = await store_message(db, room_id, sess["user_id"], sess["user_name"], text)
+    except Exception as ex:
+        return {"ok": False, "error": getattr(ex, "detail", None) or "Could not store message"}
+
+    await broadcasts.emit("chat_message", payload, to=room_id)
+    return {"ok": True, "id": payload["id"], "message": payload}
 
 
 @sio.event
 async def typing(sid, data):
     room_id = (data or {}).get("room_id")
-    await sio.emit(
-        "typing",
-        {"username": sessions.get(sid, {}).get("name", "anon")},
-        to=room_id,
-        skip_sid=sid,
-    )
+    if not room_id:
+        return
+    if limited := await _rate_limited("typing", sid):
+        return limited
+    sess = await _session(sid)
+    await coalescer.typing(sid, room_id, _user_key(sid, sess), sess.get("name", "anon"))
 
 
 @sio.event
 async def disconnect(sid):
-    name = sessions.get(sid, {}).get("name", "anon")
+    sess = await _session(sid)
+    key, name = _user_key(sid, sess), sess.get("name", "anon")
     try:
-        for room in list(await sio.rooms(sid)):
+        for room in list(sio.rooms(sid)):
             if room != sid:
-                await sio.emit(
-                    "user_left",
-                    {"username": name, "room": room},
-                    to=room,
-                )
+                online = await store.leave(room, sid)
+                await coalescer.presence(room, key, name, False, online)
     except Exception:
         pass
 
     sessions.pop(sid, None)
+    await store.delete(sid)
@@ -0,0 +1,261 @@
+import asyncio
+import gzip
+import hashlib
+import mimetypes
+import os
+import shutil
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from typing import List, NamedTuple, Optional, Tuple
+import aiofiles
+from fastapi import HTTPException, UploadFile
+from sqlalchemy import bindparam, delete, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from .background import spawn
+from .config import settings
+from . import models
+
+try:
+    import brotli
+except ImportError:  # optional, gzip variants are always written
+    brotli = None
+
+
+# Uploads land here first; same filesystem as the blobs so moving one into
+# place is a rename, not a copy
+INCOMING_DIR = ".incoming"
+BLOB_DIR = "blobs"
+CHUNK_SIZE = 1024 * 1024
+
+
+# Pre-compressed siblings of a blob, in order of preference when serving
+VARIANTS = (("br", ".br"), ("gzip", ".gz"))
+_COMPRESSIBLE = {
+    "application/javascript",
+    "application/json",
+    "application/xml",
+    "application/x-ndjson",
+    "image/svg+xml",
+}
+_PRECOMPRESS_MIN_BYTES = 1024
+
+
+def blob_rel_path(digest: str, ext: str) -> str:
+    return f"{BLOB_DIR}/{digest[:2]}/{digest}{ext.lower()}"
+
+
+def incoming_path(name: str) -> str:
+    incoming = os.path.join(settings.upload_dir, INCOMING_DIR)
+    os.makedirs(incoming, exist_ok=True)
+    return os.path.join(incoming, name)
+
+
+def hash_file(path: str) -> str:
+    """SHA-256 of a file on disk. Blocking; run it in a thread."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def receive_upload(f: UploadFile, max_bytes: int) -> Tuple[str, str, int]:
+    """Stream an upload to a temp file; ``(tmp_path, sha256_hex, size)``."""
+    tmp_path = incoming_path(uuid.uuid4().hex)
+    digest = hashlib.sha256()
+    size = 0
+
+    try:
+        async with aiofiles.open(tmp_path, "wb") as out:
+            while True:
+                chunk = await f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"File too large (> {settings.max_upload_mb} MB)",
+                    )
+                digest.update(chunk)
+                await out.write(chunk)
+    except BaseException:
+        discard(tmp_path)
+        raise
+    finally:
+        await f.close()
+
+    return tmp_path, digest.hexdigest(), size
+
+
+def is_compressible(path: str) -> bool:
+    mime = mimetypes.guess_type(path)[0] or ""
+    return mime.startswith("text/") or mime in _COMPRESSIBLE
+
+
+def write_precompressed(abs_path: str):
+    """Write ``.br``/``.gz`` siblings of a compressible blob so downloads
+    don't compress on every request. Blocking; run it in a thread.
+    Variants that don't save at least 10% are skipped."""
+    size = os.path.getsize(abs_path)
+    if size < _PRECOMPRESS_MIN_BYTES or not is_compressible(abs_path):
+        return
+
+    for encoding, suffix in VARIANTS:
+        if encoding == "br" and brotli is None:
+            continue
+        tmp_path = f"{abs_path}{suffix}.{uuid.uuid4().hex}"
+        try:
+            with open(abs_path, "rb") as src:
+                if encoding == "br":
+                    compressor = brotli.Compressor(quality=9)
+                    with open(tmp_path, "wb") as out:
+                        for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                            out.write(compressor.process(chunk))
+                        out.write(compressor.finish())
+                else:
+                    with gzip.open(tmp_path, "wb", compresslevel=9) as out:
+                        shutil.copyfileobj(src, out, CHUNK_SIZE)
+            if os.path.getsize(tmp_path) > size * 0.9:
+                discard(tmp_path)
+                continue
+            os.replace(tmp_path, abs_path + suffix)
+        except OSError:
+            discard(tmp_path)
+
+
+def discard(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+async def add_blob_ref(
+    db: AsyncSession, tmp_path: str, rel_path: str, size: int
+) -> Optional[str]:
+    """Count one more reference to ``rel_path``, linking the upload in if the
+    file is missing: ``"created"``, ``"restored"`` or None. The caller commits."""
+    dialect = db.bind.dialect.name
+    insert = pg_insert if dialect == "postgresql" else sqlite_insert
+    stmt = (
+        insert(models.Blob)
+        .values(path=rel_path, size_bytes=size, refcount=1)
+        .on_conflict_do_update(
+            index_elements=[models.Blob.path],
+            set_={"refcount": models.Blob.refcount + 1},
+        )
+        .returning(models.Blob.refcount)
+    )
+    refcount = await db.scalar(stmt)
+
+    abs_path = os.path.join(settings.upload_dir, rel_path)
+    if os.path.exists(abs_path):
+        # Same name, same content
+        return None
+    os.makedirs(os.path.dirname(abs_path), exist_ok=True)
+    # A link, not a move: the upload stays until the caller has committed
+    try:
+        os.link(tmp_path, abs_path)
+    except FileExistsError:
+        return None
+    except OSError:
+        # No hard links on this filesystem
+        copy_path = f"{abs_path}.{uuid.uuid4().hex}"
+        try:
+            shutil.copyfile(tmp_path, copy_path)
+            os.replace(copy_path, abs_path)
+        except BaseException:
+            discard(copy_path)
+            raise
+    return "created" if refcount == 1 else "restored"
+
+
+class ReceivedFile(NamedTuple):
+    tmp_path: str
+    digest: str
+    size: int
+    filename: str
+    mime_type: str
+
+
+async def store_attachments(
+    db: AsyncSession,
+    received: List[ReceivedFile],
+    *,
+    room_id: str,
+    user_id: int,
+    username: str,
+    keep_on_error: bool = False,
+) -> List[models.Attachment]:
+    """Store received files as blobs and attachment rows, all or none. The
+    temp files go once committed, or on failure unless ``keep_on_error``."""
+    now = datetime.now(timezone.utc)
+    created: List[str] = []
+    written: List[str] = []
+    atts = []
+
+    try:
+        for r in received:
+            rel_path = blob_rel_path(r.digest, os.path.splitext(r.filename)[1])
+            outcome = await add_blob_ref(db, r.tmp_path, rel_path, r.size)
+            if outcome:
+                written.append(rel_path)
+            if outcome == "created":
+                created.append(rel_path)
+            atts.append(
+                models.Attachment(
+                    room_id=room_id,
+                    user_id=user_id,
+                    username=username,
+                    original_name=r.filename,
+                    stored_path=rel_path,
+                    mime_type=r.mime_type or "application/octet-stream",
+                    size_bytes=r.size,
+                    # Set here rather than by the server default so the
+                    # rows don't need a refresh round trip after commit
+                    created_at=now,
+                )
+            )
+        db.add_all(atts)
+        await db.commit()
+    except BaseException:
+        # Unlink while the new blob rows are still locked: another upload of
+        # the same content waits on them and must find the file gone
+        for rel_path in created:
+            discard(os.path.join(settings.upload_dir, rel_path))
+        await db.rollback()
+        if not keep_on_error:
+            for r in received:
+                discard(r.tmp_path)
+        raise
+
+    for r in received:
+        discard(r.tmp_path)
+    for rel_path in written:
+        spawn(asyncio.to_thread(write_precompressed, os.path.join(settings.upload_dir, rel_path)))
+    return atts
+
+
+def release_blob_refs(db: Session, paths: List[str]) -> List[str]:
+    """Drop one reference per path; return the files that may now be unlinked."""
+    counts = Counter(paths)
+    known = set(db.scalars(select(models.Blob.path).where(models.Blob.path.in_(counts))))
+    if known:
+        blobs = models.Blob.__table__
+        db.execute(
+            update(blobs)
+            .where(blobs.c.path == bindparam("b_path"))
+            .values(refcount=blobs.c.refcount - bindparam("b_count")),
+            [{"b_path": p, "b_count": counts[p]} for p in known],
+        )
+    dead = db.scalars(
+        delete(models.Blob)
+        .where(models.Blob.path.in_(known), models.Blob.refcount <= 0)
+        .returning(models.Blob.path)
+    ).all() if known else []
+    return [p for p in counts if p not in known] + list(dead)
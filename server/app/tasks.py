@@ -1,32 +1,135 @@
 import asyncio
+import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, select
 from .db import SessionLocal
 from .config import settings
 from . import models
+from .storage import VARIANTS, discard, incoming_path, release_blob_refs
 
 
-async def cleanup_loop():
+logger = logging.getLogger(__name__)
+
+_unlink_pool = ThreadPoolExecutor(
+    max_workers=settings.cleanup_file_workers, thread_name_prefix="sweep-unlink"
+)
+
+# Totals since start plus the most recent sweep, for monitoring
+sweep_stats = {
+    "sweeps": 0,
+    "rows_total": 0,
+    "files_total": 0,
+    "last_rows": 0,
+    "last_files": 0,
+    "last_duration_s": 0.0,
+    "last_finished_at": None,
+    "stale_uploads_total": 0,
+}
+
+
+def _unlink(rel_path: str) -> bool:
+    abs_path = os.path.join(settings.upload_dir, rel_path)
+    for _, suffix in VARIANTS:
+        try:
+            os.remove(abs_path + suffix)
+        except OSError:
+            pass
+    try:
+        os.remove(abs_path)
+        return True
+    except OSError:
+        return False
+
+
+def sweep_expired() -> dict:
+    """Delete expired attachments in batches, unlinking a blob's file with its
+    last reference. Blocking; run it in a worker thread."""
+    started = time.perf_counter()
+    cutoff = datetime.now(timezone.utc) - timedelta(minutes=settings.attachment_ttl_minutes)
+    batch = settings.cleanup_batch_size
+    rows = files = 0
+
     while True:
-        await asyncio.sleep(60)
-        cutoff = datetime.now(timezone.utc) - timedelta(minutes=30)
+        expired = (
+            select(models.Attachment.id)
+            .where(models.Attachment.created_at < cutoff)
+            .order_by(models.Attachment.id)
+            .limit(batch)
+        )
+        stmt = (
+            delete(models.Attachment)
+            .where(models.Attachment.id.in_(expired))
+            .returning(models.Attachment.stored_path)
+        )
 
-        db: Session = SessionLocal()
+        db = SessionLocal()
         try:
-            for a in (
-                db.query(models.Attachment)
-                .filter(models.Attachment.created_at < cutoff)
-                .all()
-            ):
-                f = os.path.join(settings.upload_dir, a.stored_path)
-                try:
-                    if os.path.exists(f):
-                        os.remove(f)
-                except Exception:
-                    pass
-
-                db.delete(a)
+            paths = db.scalars(stmt).all()
+            unreferenced = release_blob_refs(db, paths) if paths else []
+            # Unlink only once the rows are gone for good: a failed commit
+            # must not leave rows pointing at deleted files
             db.commit()
+            if unreferenced:
+                # An upload of the same content may have brought one back since
+                revived = set(
+                    db.scalars(select(models.Blob.path).where(models.Blob.path.in_(unreferenced)))
+                )
+                unreferenced = [p for p in unreferenced if p not in revived]
+                db.commit()
         finally:
             db.close()
+        files += sum(_unlink_pool.map(_unlink, unreferenced))
+
+        rows += len(paths)
+        if len(paths) < batch:
+            break
+
+    duration = time.perf_counter() - started
+    sweep_stats["sweeps"] += 1
+    sweep_stats["rows_total"] += rows
+    sweep_stats["files_total"] += files
+    sweep_stats["last_rows"] = rows
+    sweep_stats["last_files"] = files
+    sweep_stats["last_duration_s"] = round(duration, 4)
+    sweep_stats["last_finished_at"] = datetime.now(timezone.utc).isoformat()
+    if rows:
+        logger.info("Swept %d expired attachments (%d files) in %.3fs", rows, files, duration)
+    return {"rows": rows, "files": files, "duration_s": round(duration, 4)}
+
+
+def sweep_stale_uploads() -> int:
+    """Drop resumable uploads nobody has touched within the session TTL."""
+    cutoff = datetime.now(timezone.utc) - timedelta(minutes=settings.upload_session_ttl_minutes)
+    stmt = (
+        delete(models.UploadSession)
+        .where(models.UploadSession.updated_at < cutoff)
+        .returning(models.UploadSession.id)
+    )
+
+    db = SessionLocal()
+    try:
+        ids = db.scalars(stmt).all()
+        db.commit()
+    finally:
+        db.close()
+
+    for upload_id in ids:
+        discard(incoming_path(upload_id))
+    sweep_stats["stale_uploads_total"] += len(ids)
+    if ids:
+        logger.info("Dropped %d stale upload sessions", len(ids))
+    return len(ids)
+
+
+async def cleanup_loop():
+    while True:
+        await asyncio.sleep(settings.cleanup_interval_seconds)
+        try:
+            # Keep DB and filesystem work off the event loop
+            await asyncio.to_thread(sweep_expired)
+            await asyncio.to_thread(sweep_stale_uploads)
+        except Exception:
+            logger.exception("Attachment sweep failed")
@@ -0,0 +1,207 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+from fastapi import HTTPException
+from typing import List
+from sqlalchemy import insert, text
+from sqlalchemy.exc import DataError, IntegrityError
+from .config import settings
+from .db import AsyncSessionLocal
+from . import models
+
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class _IdAllocator:
+    """Message ids from the table's own counter, one round trip per burst."""
+
+    def __init__(self):
+        self._waiting: List[asyncio.Future] = []
+        self._task: asyncio.Task | None = None
+
+    async def _reserve(self, n: int) -> List[int]:
+        async with AsyncSessionLocal() as db:
+            if db.bind.dialect.name == "postgresql":
+                ids = await db.scalars(
+                    text(
+                        "SELECT nextval(pg_get_serial_sequence('messages', 'id')) "
+                        "FROM generate_series(1, :n)"
+                    ),
+                    {"n": n},
+                )
+                return sorted(ids)
+
+            hi = await db.scalar(
+                text("UPDATE sqlite_sequence SET seq = seq + :n WHERE name = 'messages' RETURNING seq"),
+                {"n": n},
+            )
+            if hi is None:
+                # No row until the table's first insert; the UPDATE above
+                # already holds the write lock, so no other worker races us
+                hi = await db.scalar(text("SELECT COALESCE(MAX(id), 0) FROM messages")) + n
+                await db.execute(
+                    text("INSERT INTO sqlite_sequence (name, seq) VALUES ('messages', :seq)"),
+                    {"seq": hi},
+                )
+            await db.commit()
+            return list(range(hi - n + 1, hi + 1))
+
+    async def _run(self):
+        try:
+            while self._waiting:
+                waiting, self._waiting = self._waiting, []
+                try:
+                    ids = await self._reserve(len(waiting))
+                except Exception as ex:
+                    for fut in waiting:
+                        if not fut.done():
+                            fut.set_exception(ex)
+                    continue
+                for fut, n in zip(waiting, ids):
+                    if not fut.done():
+                        fut.set_result(n)
+        finally:
+            self._task = None
+
+    async def next(self) -> int:
+        fut = asyncio.get_running_loop().create_future()
+        self._waiting.append(fut)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return await fut
+
+
+class MessageWriter:
+    """Group-commit pipeline: ``submit`` returns the id, a task batch-inserts."""
+
+    def __init__(
+        self,
+        batch_size: int,
+        flush_ms: int,
+        queue_size: int,
+        enqueue_timeout_ms: int,
+    ):
+        self.batch_size = batch_size
+        self.flush_s = flush_ms / 1000
+        self.queue_size = queue_size
+        self.enqueue_timeout_s = enqueue_timeout_ms / 1000
+        self.enabled = False
+        self._ids = _IdAllocator()
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self.persisted = 0
+        self.batches = 0
+        self.failures = 0
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._task = asyncio.create_task(self._run())
+        self.enabled = True
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self.enabled = False
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    async def submit(self, room_id: str, user_id: int, username: str, text: str) -> models.Message:
+        row = {
+            "id": await self._ids.next(),
+            "room_id": room_id,
+            "user_id": user_id,
+            "username": username,
+            "text": text,
+            "created_at": datetime.now(timezone.utc),
+        }
+
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(self._queue.put(row), self.enqueue_timeout_s)
+            except asyncio.TimeoutError:
+                raise HTTPException(status_code=503, detail="Server busy, retry shortly")
+
+        return models.Message(**row)
+
+    def _drain(self, batch: list) -> bool:
+        while len(batch) < self.batch_size:
+            try:
+                row = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return False
+            if row is _STOP:
+                return True
+            batch.append(row)
+        return False
+
+    async def _run(self):
+        while True:
+            row = await self._queue.get()
+            if row is _STOP:
+                return
+
+            batch = [row]
+            stop = self._drain(batch)
+            if not stop and len(batch) < self.batch_size:
+                # Give the burst a moment to accumulate into one commit
+                await asyncio.sleep(self.flush_s)
+                stop = self._drain(batch)
+
+            await self._flush(batch)
+            if stop:
+                return
+
+    async def _flush(self, batch: list):
+        delay = 0.05
+        while True:
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(insert(models.Message), batch)
+                    await db.commit()
+                self.persisted += len(batch)
+                self.batches += 1
+                return
+            except (IntegrityError, DataError):
+                # store_message validates rows before they are acked, but one
+                # the DB still rejects must not sink the whole batch
+                await self._flush_rows(batch)
+                return
+            except Exception:
+                # DB unavailable: keep the batch and retry; the bounded queue
+                # pushes back on new submissions meanwhile
+                self.failures += 1
+                logger.exception("Message batch insert failed, retrying")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 5.0)
+
+    async def _flush_rows(self, batch: list):
+        for row in batch:
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(insert(models.Message), [row])
+                    await db.commit()
+                self.persisted += 1
+            except (IntegrityError, DataError):
+                self.failures += 1
+                logger.error(
+                    "Dropping message %s for room %s: rejected by DB", row["id"], row["room_id"]
+                )
+        self.batches += 1
+
+
+message_writer = MessageWriter(
+    batch_size=settings.write_behind_batch_size,
+    flush_ms=settings.write_behind_flush_ms,
+    queue_size=settings.write_behind_queue_size,
+    enqueue_timeout_ms=settings.write_behind_enqueue_timeout_ms,
+)
@@ -0,0 +1,431 @@
+"""Load test: concurrent Socket.IO clients, throughput and delivery latency.
+
+Needs ``pip install aiohttp``.
+
+    python bench/bench_load.py --clients 200 --rooms 10 --seconds 10 --out load.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+_tmp = tempfile.mkdtemp(prefix="impact-load-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmp}/load.db")
+os.environ.setdefault("UPLOAD_DIR", os.path.join(_tmp, "uploads"))
+# Measuring throughput, not the per-user limits
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, _root)
+
+SCENARIOS = ("message_http", "message_socket", "upload", "typing", "join_leave", "mixed")
+PASSWORD = "bench-password"
+
+
+def _pct(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(int(len(values) * q), len(values) - 1)] / 1e6, 2)
+
+
+def _summary(values):
+    return {
+        "count": len(values),
+        "p50": _pct(values, 0.50),
+        "p95": _pct(values, 0.95),
+        "p99": _pct(values, 0.99),
+        "max": round(max(values) / 1e6, 2) if values else None,
+    }
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port):
+    """Serve the app on its own thread and event loop, as uvicorn would."""
+    import uvicorn
+
+    server = uvicorn.Server(
+        uvicorn.Config("app.main:app", host="127.0.0.1", port=port, log_level="warning", lifespan="on")
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("Server failed to start")
+        time.sleep(0.05)
+    return server, thread
+
+
+class Stats:
+    """Counters for one scenario run."""
+
+    def __init__(self):
+        self.sent = 0
+        self.expected = 0
+        self.delivered = 0
+        self.errors = 0
+        self.latency = {}  # event -> ns, send -> receipt on another client
+        self.request = []  # ns, HTTP request / ack round trip
+        self.typing_started = {}  # client name -> burst start (ns)
+
+    def received(self, event, ns):
+        self.delivered += 1
+        self.latency.setdefault(event, []).append(ns)
+
+
+class Client:
+    def __init__(self, idx, token, room_id, base_url, http):
+        import socketio
+
+        self.idx = idx
+        self.name = f"c{idx}"
+        self.token = token
+        self.room_id = room_id
+        self.base_url = base_url
+        self.http = http
+        self.stats = None
+        self.typists = set()
+        self.joined = room_id
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self.sio.on("chat_message", self._on_message)
+        self.sio.on("files_uploaded", self._on_files)
+        self.sio.on("typing_batch", self._on_typing)
+
+    async def connect(self):
+        await self.sio.connect(
+            self.base_url, auth={"token": self.token}, transports=["websocket"], wait_timeout=30
+        )
+        await self.sio.emit("set_profile", {"name": self.name})
+        await self.sio.call("join_room", {"room_id": self.room_id}, timeout=30)
+
+    def _receipt(self, event, tag):
+        # Tags look like "lt-<sender>-<t0 ns>" (safe in filenames too)
+        parts = tag.split("-")
+        if self.stats is None or len(parts) != 3 or parts[0] != "lt" or parts[1] == self.name:
+            return
+        self.stats.received(event, time.perf_counter_ns() - int(parts[2]))
+
+    async def _on_message(self, data):
+        self._receipt("chat_message", data.get("text", ""))
+
+    async def _on_files(self, data):
+        for item in data.get("items", []):
+            self._receipt("files_uploaded", item.get("original_name", "").rsplit(".", 1)[0])
+
+    async def _on_typing(self, data):
+        users = set(data.get("users", []))
+        if self.stats is not None:
+            for name in users - self.typists - {self.name}:
+                started = self.stats.typing_started.get(name)
+                if started:
+                    self.stats.received("typing_batch", time.perf_counter_ns() - started)
+        self.typists = users
+
+    # Actions; each returns after one unit of work
+
+    def _tag(self):
+        return f"lt-{self.name}-{time.perf_counter_ns()}"
+
+    async def _post(self, path, data, stats, fanout):
+        t0 = time.perf_counter_ns()
+        async with self.http.post(
+            self.base_url + path, data=data, headers={"Authorization": f"Bearer {self.token}"}
+        ) as r:
+            await r.read()
+            ok = r.status == 200
+        stats.request.append(time.perf_counter_ns() - t0)
+        if ok:
+            stats.sent += 1
+            stats.expected += fanout
+        else:
+            stats.errors += 1
+
+    async def message_http(self, stats, fanout):
+        await self._post("/chat/message", {"room_id": self.room_id, "text": self._tag()}, stats, fanout)
+
+    async def message_socket(self, stats, fanout):
+        t0 = time.perf_counter_ns()
+        ack = await self.sio.call(
+            "send_message", {"room_id": self.room_id, "text": self._tag()}, timeout=30
+        )
+        stats.request.append(time.perf_counter_ns() - t0)
+        if ack and ack.get("ok"):
+            stats.sent += 1
+            stats.expected += fanout
+        else:
+            stats.errors += 1
+
+    async def upload(self, stats, fanout, size=64 * 1024):
+        import aiohttp
+
+        tag = self._tag()
+        form = aiohttp.FormData()
+        form.add_field("room_id", self.room_id)
+        # Unique content: every upload is a new blob
+        form.add_field(
+            "files", tag.encode().ljust(size, b"."), filename=f"{tag}.txt", content_type="text/plain"
+        )
+        await self._post("/chat/upload", form, stats, fanout)
+
+    async def typing(self, stats, fanout, keys=5):
+        # One burst of keystrokes; the caller's pacing lets it expire
+        if self.name not in stats.typing_started:
+            stats.typing_started[self.name] = time.perf_counter_ns()
+            stats.expected += fanout
+        for _ in range(keys):
+            await self.sio.emit("typing", {"room_id": self.room_id})
+            stats.sent += 1
+            await asyncio.sleep(0.1)
+
+    async def join_leave(self, stats, fanout, spare_room=None):
+        target = spare_room if self.joined == self.room_id else self.room_id
+        t0 = time.perf_counter_ns()
+        try:
+            await self.sio.call("join_room", {"room_id": target}, timeout=30)
+        except Exception:
+            stats.errors += 1
+            return
+        stats.request.append(time.perf_counter_ns() - t0)
+        stats.received("join_room", time.perf_counter_ns() - t0)
+        stats.sent += 1
+        stats.expected += 1
+        self.joined = target
+
+
+async def _drive(client, action, stats, fanout, rate, deadline, **kwargs):
+    from app.config import settings
+
+    interval = 1 / rate
+    typing_pause = (settings.typing_ttl_ms + settings.typing_window_ms) / 1000 + 0.2
+    # Spread clients over the first interval rather than firing in lockstep
+    await asyncio.sleep(interval * (client.idx % 97) / 97)
+    next_at = time.perf_counter()
+    while time.perf_counter() < deadline:
+        try:
+            await getattr(client, action)(stats, fanout, **kwargs)
+        except Exception:
+            stats.errors += 1
+        if action == "typing":
+            # Stop long enough for the typist to drop out of the batch
+            await asyncio.sleep(max(interval, typing_pause))
+            stats.typing_started.pop(client.name, None)
+            continue
+        next_at += interval
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            next_at = time.perf_counter()
+
+
+async def run_scenario(name, clients, room_sizes, spare_room, args):
+    stats = Stats()
+    for c in clients:
+        c.stats = stats
+        c.typists = set()
+        c.joined = c.room_id
+
+    roles = ("message_http", "message_socket", "upload", "typing")
+    deadline = time.perf_counter() + args.seconds
+    started = time.perf_counter()
+    tasks = []
+    for c in clients:
+        action = roles[c.idx % len(roles)] if name == "mixed" else name
+        fanout = room_sizes[c.room_id] - 1
+        kwargs = {"spare_room": spare_room} if action == "join_leave" else {}
+        if action == "upload":
+            kwargs["size"] = args.upload_kb * 1024
+        tasks.append(_drive(c, action, stats, fanout, args.rate, deadline, **kwargs))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    # Let in-flight deliveries land before counting
+    drain_until = time.perf_counter() + args.drain
+    while stats.delivered < stats.expected and time.perf_counter() < drain_until:
+        await asyncio.sleep(0.05)
+
+    if name == "join_leave":
+        await asyncio.gather(
+            *(c.sio.call("join_room", {"room_id": c.room_id}, timeout=30) for c in clients)
+        )
+    for c in clients:
+        c.stats = None
+
+    result = {
+        "scenario": name,
+        "clients": len(clients),
+        "rooms": len(room_sizes),
+        "seconds": round(elapsed, 2),
+        "sent": stats.sent,
+        "sent_per_s": round(stats.sent / elapsed, 1),
+        "errors": stats.errors,
+        "expected_deliveries": stats.expected,
+        "delivered": stats.delivered,
+        "deliveries_per_s": round(stats.delivered / elapsed, 1),
+        "delivery_ratio": round(stats.delivered / stats.expected, 4) if stats.expected else None,
+        "latency_ms": _summary([ns for values in stats.latency.values() for ns in values]),
+        "request_ms": _summary(stats.request),
+    }
+    if len(stats.latency) > 1:
+        result["latency_by_event_ms"] = {e: _summary(v) for e, v in sorted(stats.latency.items())}
+    return result
+
+
+async def _setup(base_url, args):
+    import aiohttp
+
+    http = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=args.http_connections))
+    run = uuid.uuid4().hex[:8]
+
+    async def register(i):
+        async with http.post(
+            f"{base_url}/auth/register",
+            json={"email": f"load{i}-{run}@example.com", "name": f"load{i}", "password": PASSWORD},
+        ) as r:
+            r.raise_for_status()
+            return (await r.json())["token"]
+
+    # Accounts are shared between clients: registration is bcrypt-bound
+    tokens = await asyncio.gather(*(register(i) for i in range(min(args.accounts, args.clients))))
+    auth = {"Authorization": f"Bearer {tokens[0]}"}
+
+    async def create_room(i):
+        async with http.post(
+            f"{base_url}/rooms/create", params={"code": "ID", "name": f"load-{run}-{i}"}, headers=auth
+        ) as r:
+            r.raise_for_status()
+            return (await r.json())["id"]
+
+    rooms = await asyncio.gather(*(create_room(i) for i in range(args.rooms + 1)))
+    rooms, spare_room = rooms[:-1], rooms[-1]
+
+    clients = [
+        Client(i, tokens[i % len(tokens)], rooms[i % len(rooms)], base_url, http)
+        for i in range(args.clients)
+    ]
+    gate = asyncio.Semaphore(50)
+
+    async def connect(c):
+        async with gate:
+            await c.connect()
+
+    await asyncio.gather(*(connect(c) for c in clients))
+    room_sizes = {r: 0 for r in rooms}
+    for c in clients:
+        room_sizes[c.room_id] += 1
+    return http, clients, room_sizes, spare_room
+
+
+def _meta(args):
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=_root, capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "database": "sqlite",
+        "args": vars(args),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Per-scenario ratios against a baseline report; a scenario regresses
+    when throughput drops or p99 latency grows by more than ``tolerance``."""
+    base = {r["scenario"]: r for r in baseline["results"]}
+    out, regressed = [], False
+    for r in results:
+        b = base.get(r["scenario"])
+        if b is None:
+            continue
+        row = {"scenario": r["scenario"], "regressed": False}
+        if b["sent_per_s"]:
+            row["throughput_ratio"] = round(r["sent_per_s"] / b["sent_per_s"], 3)
+            row["regressed"] |= row["throughput_ratio"] < 1 - tolerance
+        if b["latency_ms"]["p99"] and r["latency_ms"]["p99"] is not None:
+            row["p99_ratio"] = round(r["latency_ms"]["p99"] / b["latency_ms"]["p99"], 3)
+            row["regressed"] |= row["p99_ratio"] > 1 + tolerance
+        regressed |= row["regressed"]
+        out.append(row)
+    return out, regressed
+
+
+async def run(args):
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server, thread = start_server(port)
+    http = None
+    clients = []
+    try:
+        http, clients, room_sizes, spare_room = await _setup(base_url, args)
+        results = []
+        for name in args.scenarios.split(","):
+            result = await run_scenario(name, clients, room_sizes, spare_room, args)
+            print(json.dumps(result), flush=True)
+            results.append(result)
+        return results
+    finally:
+        await asyncio.gather(*(c.sio.disconnect() for c in clients), return_exceptions=True)
+        if http is not None:
+            await http.close()
+        server.should_exit = True
+        thread.join(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--rooms", type=int, default=10)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--rate", type=float, default=1.0, help="actions per second per client")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--accounts", type=int, default=16)
+    parser.add_argument("--upload-kb", type=int, default=64)
+    parser.add_argument("--http-connections", type=int, default=100)
+    parser.add_argument("--drain", type=float, default=5.0, help="seconds to wait for late deliveries")
+    parser.add_argument("--out", help="write the full JSON report here")
+    parser.add_argument("--baseline", help="earlier --out report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    unknown = set(args.scenarios.split(",")) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    meta = _meta(args)
+    results = asyncio.run(run(args))
+    report = {"meta": meta, "results": results}
+
+    regressed = False
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["comparison"], regressed = compare(results, json.load(f), args.tolerance)
+        for row in report["comparison"]:
+            print(json.dumps({"compare": row}), flush=True)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Logins/sec through /auth/login at different bcrypt pool sizes.
+
+    python bench/bench_login.py --pools 1,2,4,8 --concurrency 64
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+_tmp = tempfile.mkdtemp(prefix="impact-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp}/bench.db"
+os.environ["UPLOAD_DIR"] = os.path.join(_tmp, "uploads")
+# Measuring throughput, not the per-user limits
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import httpx  # noqa: E402
+from app.main import fastapi_app  # noqa: E402
+from app.auth import password_hasher  # noqa: E402
+
+
+def _pct(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(int(len(values) * q), len(values) - 1)] * 1000, 2)
+
+
+async def _run(client, workers, concurrency, seconds, max_pending):
+    password_hasher.resize(workers, max_pending)
+    password_hasher.start()
+    creds = {"email": "bench@example.com", "password": "bench-password"}
+
+    ok, rejected, latencies, probe = 0, 0, [], []
+    deadline = time.perf_counter() + seconds
+
+    async def login_loop():
+        nonlocal ok, rejected
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            r = await client.post("/auth/login", json=creds)
+            if r.status_code == 200:
+                ok += 1
+                latencies.append(time.perf_counter() - t0)
+            elif r.status_code == 503:
+                rejected += 1
+                await asyncio.sleep(0.05)
+            else:
+                r.raise_for_status()
+
+    async def probe_loop():
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            await client.get("/rooms/countries")
+            probe.append(time.perf_counter() - t0)
+            await asyncio.sleep(0.05)
+
+    started = time.perf_counter()
+    await asyncio.gather(probe_loop(), *(login_loop() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "pool_size": workers,
+        "concurrency": concurrency,
+        "logins_per_sec": round(ok / elapsed, 1),
+        "rejected_503": rejected,
+        "login_p50_ms": _pct(latencies, 0.50),
+        "login_p99_ms": _pct(latencies, 0.99),
+        "other_route_p50_ms": _pct(probe, 0.50),
+        "other_route_p99_ms": _pct(probe, 0.99),
+        "other_route_mean_ms": round(statistics.mean(probe) * 1000, 2) if probe else None,
+    }
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pools", default="1,2,4,8")
+    ap.add_argument("--concurrency", type=int, default=64)
+    ap.add_argument("--seconds", type=float, default=5.0)
+    ap.add_argument("--max-pending", type=int, default=64)
+    args = ap.parse_args()
+
+    transport = httpx.ASGITransport(app=fastapi_app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        r = await client.post(
+            "/auth/register",
+            json={"email": "bench@example.com", "password": "bench-password", "name": "bench"},
+        )
+        r.raise_for_status()
+        await client.get("/rooms/countries")
+
+        for workers in (int(p) for p in args.pools.split(",")):
+            result = await _run(client, workers, args.concurrency, args.seconds, args.max_pending)
+            print(json.dumps(result), flush=True)
+
+    password_hasher.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,137 @@
+"""Encoding throughput of chat payloads, stock path vs. the fast path.
+
+    python bench/bench_serialization.py --members 1000 --seconds 2
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import socketio  # noqa: E402
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse, ORJSONResponse  # noqa: E402
+from socketio import packet  # noqa: E402
+from app.broker import InProcessManager  # noqa: E402
+from app.serialization import SocketIOJSON  # noqa: E402
+
+ROOM = "5d0f0c1e-7d3c-4c39-9b8e-2f1f3c1b8a77"
+NOW = datetime.now(timezone.utc).isoformat()
+
+
+def _messages(n):
+    return [
+        {
+            "id": 100000 + i,
+            "room_id": ROOM,
+            "username": f"user{i % 37}",
+            "text": "Lorem ipsum dolor sit amet, consectetur adipiscing elit " * (1 + i % 3),
+            "created_at": NOW,
+        }
+        for i in range(n)
+    ]
+
+
+def _attachments(n):
+    return [
+        {
+            "id": 5000 + i,
+            "room_id": ROOM,
+            "username": f"user{i % 37}",
+            "original_name": f"IMG_{i:04d}.jpg",
+            "mime_type": "image/jpeg",
+            "size_bytes": 2_345_678 + i,
+            "url": f"/files/blobs/ab/{i:064x}.jpg",
+            "created_at": NOW,
+        }
+        for i in range(n)
+    ]
+
+
+def _page(items):
+    return {
+        "items": items,
+        "next_before_id": items[0]["id"],
+        "next_after_id": items[-1]["id"],
+        "has_more": True,
+    }
+
+
+def _rate(fn, seconds):
+    n, start = 0, time.perf_counter()
+    while (elapsed := time.perf_counter() - start) < seconds:
+        for _ in range(20):
+            fn()
+        n += 20
+    return n / elapsed
+
+
+def bench_http(seconds):
+    cases = (
+        ("messages_page_200", _page(_messages(200))),
+        ("attachments_page_100", _page(_attachments(100))),
+    )
+    for name, body in cases:
+        stock = _rate(lambda: JSONResponse(jsonable_encoder(body)), seconds)
+        fast = _rate(lambda: ORJSONResponse(body), seconds)
+        size = len(ORJSONResponse(body).body)
+        print(json.dumps({
+            "case": f"http/{name}",
+            "bytes": size,
+            "stock_per_s": round(stock),
+            "fast_per_s": round(fast),
+            "speedup": round(fast / stock, 2),
+        }))
+
+
+async def _emits_per_s(manager, json_module, members, seconds):
+    packet.Packet.json = json_module
+    sio = socketio.AsyncServer(async_mode="asgi", client_manager=manager)
+    sent = 0
+
+    async def send_packet(eio_sid, pkt):
+        nonlocal sent
+        pkt.encode()  # what the Engine.IO socket does before writing
+        sent += 1
+
+    sio.eio.send_packet = send_packet
+    for i in range(members):
+        sid = await manager.connect(f"eio{i}", "/")
+        await manager.enter_room(sid, "/", ROOM)
+
+    payload = _messages(1)[0]
+    n, start = 0, time.perf_counter()
+    while (elapsed := time.perf_counter() - start) < seconds:
+        await sio.emit("chat_message", payload, to=ROOM)
+        n += 1
+    assert sent == n * members
+    return n / elapsed
+
+
+async def bench_socketio(members, seconds):
+    stock = await _emits_per_s(socketio.AsyncManager(), json, members, seconds)
+    fast = await _emits_per_s(InProcessManager(), SocketIOJSON, members, seconds)
+    print(json.dumps({
+        "case": f"socketio/broadcast_{members}",
+        "stock_emits_per_s": round(stock, 1),
+        "fast_emits_per_s": round(fast, 1),
+        "speedup": round(fast / stock, 2),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--members", type=int, default=1000)
+    parser.add_argument("--seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    bench_http(args.seconds)
+    asyncio.run(bench_socketio(args.members, args.seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import asyncio
+import os
+import sys
+import tempfile
+import uuid
+import pytest
+
+# Settings are read at import time, so point them at a scratch directory
+# before anything imports the app
+_tmp = tempfile.mkdtemp(prefix="chat-tests-")
+os.environ.update(
+    {
+        "DATABASE_URL": f"sqlite:///{_tmp}/chat.db",
+        "UPLOAD_DIR": os.path.join(_tmp, "uploads"),
+        "ARCHIVE_DIR": os.path.join(_tmp, "archive"),
+        "SESSION_STORE_URL": "memory://",
+        "SIO_MESSAGE_QUEUE": "",
+        "RATE_LIMIT_ENABLED": "false",
+        "PASSWORD_HASH_WORKERS": "1",
+        "ARCHIVE_BLOCK_MESSAGES": "4",
+        "METRICS_ENABLED": "true",
+    }
+)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient  # noqa: E402
+from app import main, models  # noqa: E402
+from app.auth import create_token  # noqa: E402
+from app.db import SessionLocal, async_engine  # noqa: E402
+
+
+def run(coro):
+    """Run a coroutine on a fresh loop, closing the async pool it used."""
+
+    async def main_():
+        try:
+            return await coro
+        finally:
+            await async_engine.dispose()
+
+    return asyncio.run(main_())
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def user(db):
+    u = models.User(email=f"{uuid.uuid4().hex}@example.com", name="alice", password_hash="x")
+    db.add(u)
+    db.commit()
+    return u
+
+
+@pytest.fixture
+def token(user):
+    return create_token(user.id)
+
+
+@pytest.fixture
+def room(db, user):
+    r = models.Room(id=str(uuid.uuid4()), name=uuid.uuid4().hex[:12], country_code="US", created_by=user.id)
+    db.add(r)
+    db.commit()
+    return r
+
+
+@pytest.fixture
+def client():
+    # No context manager: startup would launch the background loops
+    return TestClient(main.app)
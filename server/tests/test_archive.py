@@ -0,0 +1,115 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from sqlalchemy import func
+from app import models
+from app.archive import _archive_room, message_archive
+from app.history_cache import history_cache
+
+
+@pytest.fixture(autouse=True)
+def no_history_cache():
+    size = history_cache.room_size
+    history_cache.room_size = 0
+    yield
+    history_cache.room_size = size
+
+
+def _add(db, room, user, ids, days_old=10):
+    created = datetime.now(timezone.utc) - timedelta(days=days_old)
+    db.add_all(
+        models.Message(
+            id=i, room_id=room.id, user_id=user.id, username=user.name, text=f"m{i}", created_at=created
+        )
+        for i in ids
+    )
+    db.commit()
+    return list(ids)
+
+
+def _base(db):
+    # Explicit ids with gaps, above anything earlier tests wrote
+    return (db.scalar(func.max(models.Message.id).select()) or 0) + 100
+
+
+def _archive(room):
+    return _archive_room(room.id, datetime.now(timezone.utc) - timedelta(days=1), 1000)
+
+
+def _all_pages(client, room, limit=3):
+    ids, before = [], None
+    while True:
+        params = {"room_id": room.id, "limit": limit}
+        if before:
+            params["before_id"] = before
+        body = client.get("/chat/messages", params=params).json()
+        ids[:0] = [p["id"] for p in body["items"]]
+        if not body["has_more"]:
+            return ids
+        before = body["next_before_id"]
+
+
+def _db_ids(db, room):
+    db.expire_all()
+    return sorted(m.id for m in db.query(models.Message).filter_by(room_id=room.id))
+
+
+def test_archived_history_reads_back(client, db, room, user):
+    base = _base(db)
+    old = _add(db, room, user, range(base, base + 20, 2))
+    new = _add(db, room, user, [base + 30, base + 31], days_old=0)
+
+    assert _archive(room) == 10
+    assert _db_ids(db, room) == new
+    assert message_archive.last_id(room.id) == old[-1]
+    assert _all_pages(client, room) == old + new
+
+    body = client.get(
+        "/chat/messages", params={"room_id": room.id, "after_id": old[3], "limit": 4}
+    ).json()
+    assert [p["id"] for p in body["items"]] == old[4:8]
+    assert body["has_more"]
+
+
+def test_late_row_below_last_id_is_kept_and_merged(client, db, room, user):
+    base = _base(db)
+    old = _add(db, room, user, range(base, base + 20, 2))
+    _archive(room)
+    # Committed after the run had already archived past its id (e.g. an id
+    # handed out before the run, inserted after it)
+    late = _add(db, room, user, [base + 7])
+
+    assert _all_pages(client, room) == sorted(old + late)
+    body = client.get(
+        "/chat/messages", params={"room_id": room.id, "after_id": base + 4, "limit": 3}
+    ).json()
+    assert [p["id"] for p in body["items"]] == [base + 6, base + 7, base + 8]
+
+    _archive(room)
+    assert _db_ids(db, room) == late
+    assert _all_pages(client, room, limit=4) == sorted(old + late)
+
+
+def test_crashed_run_deletes_only_archived_ids(db, room, user):
+    base = _base(db)
+    old = _add(db, room, user, range(base, base + 5))
+    # Archived, but the process died before the DELETE
+    rows = db.query(models.Message).filter(models.Message.id.in_(old[:3])).order_by(models.Message.id)
+    message_archive.append(room.id, rows.all())
+    assert message_archive.archived_ids(room.id, old) == set(old[:3])
+
+    assert _archive(room) == 2
+    assert _db_ids(db, room) == []
+    assert message_archive.last_id(room.id) == old[-1]
+
+
+def test_ids_are_not_reused_after_archiving(db, room, user):
+    base = _base(db)
+    old = _add(db, room, user, range(base, base + 3))
+    _archive(room)
+    assert _db_ids(db, room) == []
+    assert message_archive.max_last_id() >= old[-1]
+
+    fresh = models.Message(room_id=room.id, user_id=user.id, username=user.name, text="new")
+    db.add(fresh)
+    db.commit()
+    assert fresh.id > old[-1]
@@ -0,0 +1,60 @@
+import os
+import pytest
+from fastapi import HTTPException
+from conftest import run
+from app.auth import PasswordHasher, user_cache, user_from_token
+from app.broker import _remote_emit_hooks
+from app.db import AsyncSessionLocal
+
+
+def _resolve(token):
+    async def go():
+        async with AsyncSessionLocal() as db:
+            return await user_from_token(token, db)
+
+    return run(go())
+
+
+def test_profile_update_drops_cached_tokens(client, token, user):
+    assert _resolve(token).name == "alice"
+    assert user_cache.get(token) is not None
+
+    r = client.patch("/auth/me", json={"name": "  bob "}, headers={"Authorization": f"Bearer {token}"})
+    assert r.status_code == 200 and r.json()["name"] == "bob"
+    assert user_cache.get(token) is None
+    assert _resolve(token).name == "bob"
+
+
+def test_blank_name_is_rejected(client, token):
+    r = client.patch("/auth/me", json={"name": " "}, headers={"Authorization": f"Bearer {token}"})
+    assert r.status_code == 400
+
+
+def test_other_workers_changes_invalidate_too(token, user):
+    _resolve(token)
+    for hook in _remote_emit_hooks["user_changed"]:
+        hook({"id": user.id})
+    assert user_cache.get(token) is None
+
+
+def test_hasher_rejects_past_max_pending():
+    hasher = PasswordHasher(workers=1, max_pending=0)
+    with pytest.raises(HTTPException) as e:
+        run(hasher.hash("pw"))
+    assert e.value.status_code == 503 and e.value.headers["Retry-After"] == "1"
+    assert hasher.rejected == 1 and hasher.pending == 0
+
+
+def test_hasher_replaces_a_broken_pool():
+    hasher = PasswordHasher(workers=1, max_pending=4)
+    try:
+        # A worker exiting mid-job breaks the whole pool
+        with pytest.raises(HTTPException) as e:
+            run(hasher._run(os._exit, 1))
+        assert e.value.status_code == 503
+        assert hasher._pool is None and hasher.pending == 0
+
+        h = run(hasher.hash("pw"))
+        assert run(hasher.verify("pw", h))
+    finally:
+        hasher.shutdown()
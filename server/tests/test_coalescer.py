@@ -0,0 +1,77 @@
+import asyncio
+from app.coalescer import RoomEventCoalescer
+from app.session_store import MemorySessionStore
+from conftest import run
+
+
+class _Manager:
+    """Records what a worker sends to its own sockets and to its peers."""
+
+    def __init__(self):
+        self.local = []
+        self.published = []
+        self.peers = []
+
+    async def emit_local(self, event, data, room):
+        self.local.append((event, data))
+
+    async def publish_internal(self, event, data):
+        self.published.append(data)
+        for peer in self.peers:
+            peer._remote(data)
+
+
+class _Sio:
+    def __init__(self):
+        self.manager = _Manager()
+
+
+def _worker(store):
+    return RoomEventCoalescer(_Sio(), store, typing_window_ms=20, typing_ttl_ms=200, presence_window_ms=20)
+
+
+def test_typing_is_keyed_by_user_and_merged_across_workers():
+    async def go():
+        store = MemorySessionStore()
+        a, b = _worker(store), _worker(store)
+        a.sio.manager.peers, b.sio.manager.peers = [b], [a]
+
+        # Two different users who both call themselves bob, on two workers
+        await a.typing("s1", "r", "u1", "bob")
+        await b.typing("s2", "r", "u2", "bob")
+        for _ in range(5):
+            await a.typing("s1", "r", "u1", "bob")
+        await asyncio.sleep(0.05)
+        tasks = len(a._tasks)
+        await asyncio.sleep(0.3)
+        return a, b, tasks
+
+    a, b, tasks = run(go())
+    assert tasks == 1
+    for worker in (a, b):
+        frames = [d["users"] for e, d in worker.sio.manager.local if e == "typing_batch"]
+        assert frames == [["bob", "bob"], []]
+    # Repeat keystrokes inside the TTL aren't re-shared
+    assert len(a.sio.manager.published) == 1
+    assert not a._tasks
+
+
+def test_presence_batches_merge_remote_deltas():
+    async def go():
+        store = MemorySessionStore()
+        a, b = _worker(store), _worker(store)
+        a.sio.manager.peers, b.sio.manager.peers = [b], [a]
+
+        await a.presence("r", "u1", "alice", True, await store.join("r", "s1"))
+        await b.presence("r", "u2", "bob", True, await store.join("r", "s2"))
+        # Joins and leaves by one account within the window cancel out
+        await b.presence("r", "u3", "carol", True, await store.join("r", "s3"))
+        await b.presence("r", "u3", "carol", False, await store.leave("r", "s3"))
+        await asyncio.sleep(0.1)
+        return a, b
+
+    a, b = run(go())
+    for worker in (a, b):
+        assert worker.sio.manager.local == [
+            ("presence_batch", {"room": "r", "joined": ["alice", "bob"], "left": [], "online": 2})
+        ]
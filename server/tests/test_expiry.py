@@ -0,0 +1,70 @@
+import os
+from datetime import datetime, timedelta, timezone
+import pytest
+from sqlalchemy.orm import Session
+from app import models
+from app.config import settings
+from app.tasks import sweep_expired
+
+
+def _attachment(db, room, user, path, minutes_old):
+    created = datetime.now(timezone.utc) - timedelta(minutes=minutes_old)
+    a = models.Attachment(
+        room_id=room.id, user_id=user.id, username=user.name, original_name="f.txt",
+        stored_path=path, mime_type="text/plain", size_bytes=3, created_at=created,
+    )
+    db.add(a)
+    db.commit()
+    return a.id
+
+
+def test_no_http_route_runs_the_sweep(client):
+    assert client.delete("/chat/attachments/expired").status_code in (404, 405)
+
+
+def test_sweep_unlinks_blob_with_its_last_reference(db, room, user):
+    path = "blobs/ee/expiry-test.txt"
+    abs_path = os.path.join(settings.upload_dir, path)
+    os.makedirs(os.path.dirname(abs_path), exist_ok=True)
+    with open(abs_path, "wb") as f:
+        f.write(b"abc")
+    db.add(models.Blob(path=path, size_bytes=3, refcount=2))
+    db.commit()
+
+    expired = _attachment(db, room, user, path, settings.attachment_ttl_minutes + 5)
+    fresh = _attachment(db, room, user, path, 0)
+    sweep_expired()
+    db.expire_all()
+    assert db.get(models.Attachment, expired) is None
+    assert db.get(models.Blob, path).refcount == 1 and os.path.exists(abs_path)
+
+    db.query(models.Attachment).filter_by(id=fresh).update(
+        {"created_at": datetime.now(timezone.utc) - timedelta(days=1)}
+    )
+    db.commit()
+    sweep_expired()
+    db.expire_all()
+    assert db.get(models.Blob, path) is None and not os.path.exists(abs_path)
+
+
+def test_failed_commit_leaves_files_in_place(db, room, user, monkeypatch):
+    path = "blobs/ef/expiry-commit.txt"
+    abs_path = os.path.join(settings.upload_dir, path)
+    os.makedirs(os.path.dirname(abs_path), exist_ok=True)
+    with open(abs_path, "wb") as f:
+        f.write(b"abc")
+    db.add(models.Blob(path=path, size_bytes=3, refcount=1))
+    db.commit()
+    expired = _attachment(db, room, user, path, settings.attachment_ttl_minutes + 5)
+
+    def fail(self):
+        raise ConnectionError("commit failed")
+
+    monkeypatch.setattr(Session, "commit", fail)
+    with pytest.raises(ConnectionError):
+        sweep_expired()
+    monkeypatch.undo()
+
+    db.expire_all()
+    assert db.get(models.Attachment, expired) is not None
+    assert db.get(models.Blob, path).refcount == 1 and os.path.exists(abs_path)
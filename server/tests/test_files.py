@@ -0,0 +1,58 @@
+import hashlib
+import os
+from app.config import settings
+from app.storage import blob_rel_path, write_precompressed
+
+
+def _blob(content: bytes, ext: str) -> str:
+    digest = hashlib.sha256(content).hexdigest()
+    rel = blob_rel_path(digest, ext)
+    abs_path = os.path.join(settings.upload_dir, rel)
+    os.makedirs(os.path.dirname(abs_path), exist_ok=True)
+    with open(abs_path, "wb") as f:
+        f.write(content)
+    return rel
+
+
+def test_blob_etag_and_conditional_get(client):
+    content = os.urandom(100)
+    rel = _blob(content, ".bin")
+
+    r = client.get(f"/files/{rel}")
+    assert r.status_code == 200 and r.content == content
+    assert r.headers["etag"] == f'"{hashlib.sha256(content).hexdigest()}"'
+    assert "immutable" in r.headers["cache-control"]
+
+    r = client.get(f"/files/{rel}", headers={"If-None-Match": r.headers["etag"]})
+    assert r.status_code == 304 and r.content == b""
+
+
+def test_range_request_gets_partial_content(client):
+    content = bytes(range(100))
+    rel = _blob(content, ".bin")
+
+    r = client.get(f"/files/{rel}", headers={"Range": "bytes=10-19"})
+    assert r.status_code == 206
+    assert r.content == content[10:20]
+    assert r.headers["content-range"] == "bytes 10-19/100"
+
+
+def test_precompressed_variant_is_served_when_accepted(client):
+    content = b"hello world\n" * 200
+    rel = _blob(content, ".txt")
+    write_precompressed(os.path.join(settings.upload_dir, rel))
+
+    r = client.get(f"/files/{rel}", headers={"Accept-Encoding": "gzip"})
+    assert r.headers["content-encoding"] == "gzip"
+    assert r.headers["etag"].endswith('-gzip"')
+    assert r.headers["vary"] == "Accept-Encoding"
+    assert r.content == content  # decoded by the client
+
+    r = client.get(f"/files/{rel}", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in r.headers
+    assert r.content == content
+
+
+def test_hidden_and_traversal_paths_are_not_served(client):
+    assert client.get("/files/.incoming/x").status_code == 404
+    assert client.get("/files/blobs/../../etc/passwd").status_code == 404
@@ -0,0 +1,64 @@
+from app.history_cache import RoomHistoryCache
+
+
+def _msg(room_id, i, text="hi"):
+    return {"id": i, "room_id": room_id, "username": "u", "text": text, "created_at": ""}
+
+
+def _cache(**kw):
+    return RoomHistoryCache(**{"room_size": 5, "max_bytes": 1 << 20, "max_rooms": 100, **kw})
+
+
+def test_ring_keeps_newest_in_id_order():
+    c = _cache()
+    c.fill("r", [_msg("r", i) for i in (1, 2, 3)], complete=True)
+    for i in (6, 4, 5, 7):
+        c.append("r", _msg("r", i))
+
+    items, has_more = c.page("r", 5)
+    assert c.page("r", 10) is None
+    assert [p["id"] for p in items] == [3, 4, 5, 6, 7]
+    # 1 and 2 fell off the ring, so the buffer no longer holds everything
+    assert has_more
+    assert c.page("r", 10, after_id=2) is None
+    assert [p["id"] for p in c.page("r", 2, after_id=4)[0]] == [5, 6]
+
+
+def test_miss_creates_no_buffer():
+    c = _cache()
+    for n in range(1000):
+        assert c.page(f"room-{n}", 50) is None
+    assert c.stats()["rooms"] == 0 and c.stats()["bytes"] == 0
+
+
+def test_write_racing_a_fill_is_kept():
+    c = _cache()
+    assert c.page("r", 10) is None
+    c.append("r", _msg("r", 9))
+    c.fill("r", [_msg("r", i) for i in (7, 8)], complete=False)
+    assert [p["id"] for p in c.page("r", 3)[0]] == [7, 8, 9]
+
+
+def test_rooms_are_capped_lru():
+    c = _cache(max_rooms=3)
+    for room in "abc":
+        c.fill(room, [_msg(room, 1)], complete=True)
+    c.page("a", 1)
+    c.fill("d", [], complete=True)
+
+    assert c.stats()["rooms"] == 3
+    assert c.page("b", 1) is None
+    assert c.page("a", 1) is not None and c.page("d", 1) == ([], False)
+
+
+def test_bytes_are_capped_and_released():
+    c = _cache(max_bytes=5000)
+    for n in range(10):
+        room = f"r{n}"
+        c.fill(room, [_msg(room, 1, "x" * 1000)], complete=True)
+    stats = c.stats()
+    assert stats["bytes"] <= 5000 and stats["evictions"] > 0
+    assert c.page("r9", 1) is not None
+
+    c.fill("r9", [], complete=True)
+    assert c.stats()["bytes"] == sum(b.size for b in c._rooms.values())
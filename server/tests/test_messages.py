@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from app import models
+from app.history_cache import history_cache
+
+
+@pytest.fixture(autouse=True)
+def no_history_cache():
+    size = history_cache.room_size
+    history_cache.room_size = 0
+    yield
+    history_cache.room_size = size
+
+
+def _add(db, room, user, n, created_at=None):
+    msgs = [
+        models.Message(room_id=room.id, user_id=user.id, username=user.name, text=f"m{i}", created_at=created_at)
+        for i in range(n)
+    ]
+    db.add_all(msgs)
+    db.commit()
+    return [m.id for m in msgs]
+
+
+def _page(client, room, **params):
+    r = client.get("/chat/messages", params={"room_id": room.id, **params})
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def test_walks_back_through_history(client, db, room, user):
+    ids = _add(db, room, user, 7)
+
+    body = _page(client, room, limit=3)
+    assert [p["id"] for p in body["items"]] == ids[-3:]
+    assert body["has_more"] and body["next_before_id"] == ids[-3]
+
+    body = _page(client, room, limit=3, before_id=body["next_before_id"])
+    assert [p["id"] for p in body["items"]] == ids[1:4]
+
+    body = _page(client, room, limit=3, before_id=body["next_before_id"])
+    assert [p["id"] for p in body["items"]] == ids[:1]
+    assert not body["has_more"] and body["next_before_id"] is None
+
+
+def test_catches_up_after_a_cursor(client, db, room, user):
+    ids = _add(db, room, user, 5)
+
+    body = _page(client, room, limit=2, after_id=ids[0])
+    assert [p["id"] for p in body["items"]] == ids[1:3]
+    assert body["has_more"] and body["next_after_id"] == ids[2]
+
+    body = _page(client, room, limit=2, after_id=ids[2])
+    assert [p["id"] for p in body["items"]] == ids[3:]
+    assert not body["has_more"]
+
+    # Nothing newer: the cursor stays put
+    body = _page(client, room, limit=2, after_id=ids[-1])
+    assert body["items"] == [] and body["next_after_id"] == ids[-1]
+
+
+def test_timestamps_are_one_utc_format(client, db, room, user):
+    # SQLite hands the row back naive
+    _add(db, room, user, 1, created_at=datetime(2024, 5, 1, 12, 0))
+    [item] = _page(client, room, limit=1)["items"]
+    assert item["created_at"] == "2024-05-01T12:00:00.000000+00:00"
+
+    # Postgres hands it back in the session's zone
+    ts = datetime(2024, 5, 1, 14, 0, 0, 5, tzinfo=timezone(timedelta(hours=2)))
+    assert models.utc_isoformat(ts) == "2024-05-01T12:00:00.000005+00:00"
@@ -0,0 +1,27 @@
+from app.config import settings
+from app.socketio_app import sessions
+
+
+def test_requests_are_labelled_by_route_template(client):
+    client.get("/files/no/such/file.txt")
+    client.get("/not-a-route")
+    body = client.get("/metrics").text
+    assert 'route="/files/{path:path}"' in body
+    assert 'route="unmatched"' in body
+    assert "/files/no/such/file.txt" not in body
+
+
+def test_connected_sids_counts_only_authenticated_sessions(client, monkeypatch):
+    monkeypatch.setitem(sessions, "anon-sid", {})
+    monkeypatch.setitem(sessions, "user-sid", {"user_id": 1, "user_name": "alice"})
+    body = client.get("/metrics").text
+    assert "chat_sio_connected_sids 1\n" in body
+
+
+def test_token_is_required_when_configured(client, monkeypatch):
+    monkeypatch.setattr(settings, "metrics_token", "s3cret")
+    assert client.get("/metrics").status_code == 401
+    wrong = {"Authorization": "Bearer nope"}
+    assert client.get("/metrics", headers=wrong).status_code == 401
+    ok = client.get("/metrics", headers={"Authorization": "Bearer s3cret"})
+    assert ok.status_code == 200 and "chat_http_request_seconds" in ok.text
@@ -0,0 +1,66 @@
+import asyncio
+import pytest
+from engineio import packet as eio_packet
+from socketio import packet
+from app.config import settings
+from app.outbound import BoundedEngineIOServer
+
+
+class FakeSocket:
+    def __init__(self, server):
+        self.queue = server.create_queue()
+        self.closed = False
+
+    async def send(self, pkt):
+        await self.queue.put(pkt)
+
+    async def close(self, wait=True):
+        self.closed = True
+
+
+def _event(name):
+    encoded = packet.Packet(packet.EVENT, namespace="/", data=[name, {"x": 1}]).encode()
+    return eio_packet.Packet(eio_packet.MESSAGE, encoded)
+
+
+def _queued(queue):
+    return [p.data for p in queue._queue]
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(settings, "sio_outbound_max_packets", 4)
+    return BoundedEngineIOServer(async_mode="asgi")
+
+
+def test_direct_sends_drop_ephemeral_events_past_half(server):
+    async def go():
+        sock = FakeSocket(server)
+        for name in ("chat_message", "chat_message", "typing_batch", "chat_message"):
+            await sock.send(_event(name))
+        # Control packets always get through
+        await sock.send(eio_packet.Packet(eio_packet.PING))
+        return sock
+
+    sock = asyncio.run(go())
+    names = [d for d in _queued(sock.queue) if d]
+    assert len(names) == 3 and not any("typing_batch" in d for d in names)
+    assert not sock.closed
+
+
+def test_full_queue_evicts_with_resync_hint(server):
+    async def go():
+        sock = FakeSocket(server)
+        server.sockets["eio1"] = sock
+        for _ in range(5):
+            await sock.send(_event("chat_message"))
+        # Let the tracked eviction task run
+        for _ in range(3):
+            await asyncio.sleep(0)
+        return sock
+
+    sock = asyncio.run(go())
+    assert sock.closed and "eio1" not in server.sockets
+    assert [d for d in _queued(sock.queue)] == [
+        packet.Packet(packet.EVENT, namespace="/", data=["resync", {"reason": "slow_consumer"}]).encode()
+    ]
@@ -0,0 +1,88 @@
+import asyncio
+import pytest
+from app import ratelimit
+from app.ratelimit import Limit, MemoryBucketStore, SqliteBucketStore, rate_limiter
+
+
+class Clock:
+    # Stands in for the time module inside app.ratelimit only; asyncio
+    # needs the real one
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    time = monotonic
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = Clock()
+    monkeypatch.setattr(ratelimit, "time", c)
+    return c
+
+
+def test_parse():
+    assert Limit.parse("20/10") == Limit(20, 10.0)
+    assert Limit.parse("5") == Limit(5, 1.0)
+    assert Limit.parse("") is None and Limit.parse("0/60") is None
+
+
+@pytest.mark.parametrize("kind", ["memory", "sqlite"])
+def test_bucket_bursts_then_refills(kind, clock, tmp_path):
+    limit = Limit(3, 6)  # one token every 2 s
+
+    async def go():
+        store = MemoryBucketStore() if kind == "memory" else SqliteBucketStore(str(tmp_path / "rl.db"))
+        burst = [await store.take("k", limit) for _ in range(3)]
+        refused = await store.take("k", limit)
+        other = await store.take("other", limit)
+        clock.now += 2
+        refilled = await store.take("k", limit)
+        again = await store.take("k", limit)
+        if kind == "sqlite":
+            # Its connection thread would keep the process alive
+            await store._db.close()
+        return burst, refused, other, refilled, again
+
+    burst, refused, other, refilled, again = asyncio.run(go())
+    assert burst == [0.0, 0.0, 0.0]
+    assert refused == pytest.approx(2.0)
+    assert other == 0.0
+    assert refilled == 0.0
+    assert again == pytest.approx(2.0)
+
+
+def test_full_buckets_are_forgotten(clock):
+    store = MemoryBucketStore()
+    limit = Limit(2, 2)
+
+    async def go():
+        for key in ("a", "b"):
+            await store.take(key, limit)
+        clock.now += 10
+        await store.take("c", limit)
+
+    asyncio.run(go())
+    assert len(store) == 1
+
+
+def test_route_answers_429_with_retry_after(client, monkeypatch, clock):
+    monkeypatch.setitem(rate_limiter.limits, "login", Limit(1, 60))
+    monkeypatch.setattr(rate_limiter, "store", MemoryBucketStore())
+
+    body = {"email": "nobody@example.com", "password": "x"}
+    assert client.post("/auth/login", json=body).status_code == 401
+    r = client.post("/auth/login", json=body)
+    assert r.status_code == 429 and r.headers["retry-after"] == "60"
+
+
+def test_store_errors_let_calls_through(monkeypatch):
+    class Broken:
+        async def take(self, key, limit):
+            raise ConnectionError
+
+    monkeypatch.setitem(rate_limiter.limits, "typing", Limit(1, 1))
+    monkeypatch.setattr(rate_limiter, "store", Broken())
+    assert asyncio.run(rate_limiter.hit("typing", "sid")) == 0.0
@@ -0,0 +1,71 @@
+import uuid
+import pytest
+from app import models
+from app.broker import _remote_emit_hooks
+from app.directory import directory_cache
+from app.socketio_app import broadcasts
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    directory_cache.invalidate()
+
+
+@pytest.fixture
+def emitted(monkeypatch):
+    sent = []
+
+    async def emit(event, data, **kwargs):
+        sent.append((event, data))
+
+    monkeypatch.setattr(broadcasts, "emit", emit)
+    return sent
+
+
+def _names(client, code="SG"):
+    r = client.get("/rooms", params={"code": code})
+    assert r.status_code == 200
+    return [room["name"] for room in r.json()], r.headers["ETag"]
+
+
+def test_unchanged_listing_answers_304(client):
+    r = client.get("/rooms/countries")
+    assert r.status_code == 200 and {"code": "SG", "name": "Singapore"} in r.json()
+    etag = r.headers["ETag"]
+    assert r.headers["Cache-Control"] == "no-cache"
+
+    for sent in (etag, f"W/{etag}", f'"other", {etag}'):
+        r = client.get("/rooms/countries", headers={"If-None-Match": sent})
+        assert r.status_code == 304 and r.content == b"" and r.headers["ETag"] == etag
+    assert client.get("/rooms/countries", headers={"If-None-Match": '"x"'}).status_code == 200
+
+
+def test_created_room_is_listed_and_broadcast(client, token, emitted):
+    name = uuid.uuid4().hex[:12]
+    before, etag = _names(client)
+    hits = directory_cache.hits
+    assert _names(client) == (before, etag) and directory_cache.hits == hits + 1
+
+    r = client.post(
+        "/rooms/create",
+        params={"code": "sg", "name": f" {name} "},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert r.status_code == 200
+    after, new_etag = _names(client)
+    assert name in after and new_etag != etag
+    assert emitted == [
+        ("room_created", {"id": r.json()["id"], "name": name, "country_code": "SG"})
+    ]
+
+
+def test_room_created_elsewhere_invalidates(client, db, user):
+    before, _ = _names(client)
+    name = uuid.uuid4().hex[:12]
+    db.add(models.Room(id=str(uuid.uuid4()), name=name, country_code="SG", created_by=user.id))
+    db.commit()
+    assert _names(client)[0] == before
+
+    for hook in _remote_emit_hooks["room_created"]:
+        hook({"id": "x", "name": name, "country_code": "SG"})
+    assert name in _names(client)[0]
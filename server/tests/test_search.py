@@ -0,0 +1,67 @@
+import uuid
+import pytest
+from sqlalchemy import create_engine, text
+from app import models
+from app.search import setup_search_index
+
+
+def _say(db, room, user, words):
+    m = models.Message(room_id=room.id, user_id=user.id, username=user.name, text=words)
+    db.add(m)
+    db.commit()
+    return m.id
+
+
+@pytest.fixture
+def other_room(db, user):
+    r = models.Room(id=str(uuid.uuid4()), name=uuid.uuid4().hex[:12], country_code="US", created_by=user.id)
+    db.add(r)
+    db.commit()
+    return r
+
+
+def _search(client, token, room, q):
+    r = client.get(
+        "/chat/search",
+        params={"room_id": room.id, "q": q},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def test_search_stays_in_its_room(client, token, db, user, room, other_room):
+    mine = _say(db, room, user, "walrus sighting at the pier")
+    _say(db, other_room, user, "walrus sighting elsewhere")
+    _say(db, room, user, "nothing to see")
+
+    items = _search(client, token, room, "walrus sigh")["items"]
+    assert [i["id"] for i in items] == [mine]
+    assert "<mark>walrus</mark>" in items[0]["snippet"]
+
+
+def test_search_matches_room_ids_not_text(client, token, db, user, room):
+    # The room id is indexed, but only as a filter
+    _say(db, room, user, "plain words")
+    assert _search(client, token, room, room.id.split("-")[0])["items"] == []
+
+
+def test_old_index_is_rebuilt_with_room_ids(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/old.db")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE messages (id INTEGER PRIMARY KEY, room_id TEXT, text TEXT)"))
+        conn.execute(
+            text(
+                "CREATE VIRTUAL TABLE messages_fts USING fts5("
+                "text, content='messages', content_rowid='id')"
+            )
+        )
+        conn.execute(text("INSERT INTO messages VALUES (1, 'a', 'hello'), (2, 'b', 'hello')"))
+
+    setup_search_index(engine)
+    with engine.connect() as conn:
+        hits = conn.execute(
+            text("SELECT rowid FROM messages_fts WHERE messages_fts MATCH :q"),
+            {"q": 'room_id : "b" AND text : ("hello")'},
+        ).all()
+    assert hits == [(2,)]
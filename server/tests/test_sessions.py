@@ -0,0 +1,80 @@
+import asyncio
+import os
+import pickle
+import socket
+import time
+from app import broker
+from app.broker import LocalSocketManager
+from app.session_store import SqliteSessionStore
+from conftest import run
+
+
+def test_presence_and_sessions_expire_unless_touched(tmp_path, monkeypatch):
+    store = SqliteSessionStore(str(tmp_path / "sessions.db"), ttl=60)
+    now = [1000.0]
+    monkeypatch.setattr("app.session_store.time.time", lambda: now[0])
+
+    async def go():
+        await store.save("a", {"name": "alice"})
+        await store.save("b", {"name": "bob"})
+        await store.join("room", "a")
+        assert await store.join("room", "b") == 2
+
+        now[0] += 45
+        # Only a's worker is still alive to refresh it
+        await store.touch({"a": ["room"]})
+        now[0] += 30
+        result = (await store.count("room"), await store.load("a"), await store.load("b"))
+        await store._db.close()
+        return result
+
+    assert run(go()) == (1, {"name": "alice"}, None)
+
+
+async def _recv(listener):
+    return await asyncio.wait_for(listener.__anext__(), 1)
+
+
+def test_local_broker_speaks_json_only(tmp_path):
+    path = str(tmp_path / "sio")
+
+    async def go():
+        a, b = LocalSocketManager(path), LocalSocketManager(path)
+        listener = b._listen()
+        first = asyncio.ensure_future(_recv(listener))
+        await asyncio.sleep(0.05)
+
+        # A pickle that would run code if anything unpickled it
+        evil = pickle.dumps({"method": "emit", "x": os.system})
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        s.sendto(evil, b._own)
+        s.close()
+        await a._publish({"method": "emit", "event": "e", "data": {"n": 1}, "callback": None})
+        got = await first
+        await listener.aclose()
+        return got
+
+    assert run(go()) == {"method": "emit", "event": "e", "data": {"n": 1}, "callback": None}
+    assert oct(os.stat(path).st_mode & 0o777) == "0o700"
+
+
+def test_hung_peer_does_not_stall_publishes(tmp_path, monkeypatch):
+    monkeypatch.setattr(broker, "_PEER_SEND_TIMEOUT_S", 0.1)
+    path = str(tmp_path / "sio")
+
+    async def go():
+        a = LocalSocketManager(path)
+        # A peer that binds its socket and then never reads
+        hung = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        hung.bind(os.path.join(path, "socketio-hung.sock"))
+        big = {"method": "emit", "data": "x" * 100_000}
+        timings = []
+        for _ in range(6):
+            started = time.monotonic()
+            await a._publish(big)
+            timings.append(time.monotonic() - started)
+        hung.close()
+        return timings, a._stalled
+
+    timings, stalled = run(go())
+    assert stalled and max(timings) < 0.5 and sum(timings) < 0.6
@@ -0,0 +1,68 @@
+import pytest
+from conftest import run
+from app import models, socketio_app
+from app.socketio_app import send_message, sessions
+
+
+@pytest.fixture
+def emitted(monkeypatch):
+    sent = []
+
+    async def emit(event, data, to=None):
+        sent.append((event, data, to))
+
+    monkeypatch.setattr(socketio_app.broadcasts, "emit", emit)
+    return sent
+
+
+@pytest.fixture
+def sid(user, monkeypatch):
+    monkeypatch.setitem(
+        sessions, "sid-1", {"user_id": user.id, "user_name": user.name, "name": user.name}
+    )
+    return "sid-1"
+
+
+def test_ack_carries_the_stored_message(sid, room, emitted):
+    ack = run(send_message(sid, {"room_id": room.id, "text": "hello"}))
+    assert ack["ok"] and ack["message"]["text"] == "hello"
+    assert ack["message"]["username"] == "alice" and ack["id"] == ack["message"]["id"]
+    assert emitted == [("chat_message", ack["message"], room.id)]
+
+
+def test_errors_are_acked(sid, room, emitted, monkeypatch):
+    monkeypatch.setitem(sessions, "anon", {})
+    ack = run(send_message("anon", {"room_id": room.id, "text": "hi"}))
+    assert ack == {"ok": False, "error": "Not authenticated"}
+    assert not run(send_message(sid, {"room_id": room.id}))["ok"]
+    ack = run(send_message(sid, {"room_id": "no-such-room", "text": "hi"}))
+    assert ack == {"ok": False, "error": "Room not found"}
+    assert emitted == []
+
+
+def test_rate_limited_sends_are_refused(sid, room, emitted, monkeypatch):
+    async def hit(name, key):
+        assert (name, key) == ("message", f"u{sessions[sid]['user_id']}")
+        return 2.5
+
+    monkeypatch.setattr(socketio_app.rate_limiter, "hit", hit)
+    ack = run(send_message(sid, {"room_id": room.id, "text": "hi"}))
+    assert ack == {"ok": False, "error": "Rate limited", "retry_after": 2.5}
+    assert emitted == []
+
+
+def test_messages_use_the_name_after_a_profile_change(client, token, sid, room, emitted):
+    r = client.patch("/auth/me", json={"name": "bob"}, headers={"Authorization": f"Bearer {token}"})
+    assert r.status_code == 200
+    ack = run(send_message(sid, {"room_id": room.id, "text": "hi"}))
+    assert ack["message"]["username"] == "bob" and sessions[sid]["name"] == "bob"
+
+
+def test_any_account_name_fits_a_message(sid, room, emitted):
+    assert models.Message.username.type.length == models.User.name.type.length
+    sessions[sid]["user_name"] = "n" * models.User.name.type.length
+    assert run(send_message(sid, {"room_id": room.id, "text": "hi"}))["ok"]
+
+    sessions[sid]["user_name"] += "n"
+    ack = run(send_message(sid, {"room_id": room.id, "text": "hi"}))
+    assert ack == {"ok": False, "error": "Name too long"}
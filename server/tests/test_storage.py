@@ -0,0 +1,74 @@
+import hashlib
+import os
+import pytest
+from app import models
+from app.config import settings
+from app.db import AsyncSessionLocal
+from app.storage import ReceivedFile, blob_rel_path, incoming_path, store_attachments
+from conftest import run
+
+
+def _received(content: bytes, name="a.bin"):
+    tmp = incoming_path(hashlib.md5(os.urandom(8)).hexdigest())
+    with open(tmp, "wb") as f:
+        f.write(content)
+    return ReceivedFile(tmp, hashlib.sha256(content).hexdigest(), len(content), name, None)
+
+
+def _store(room, user, received):
+    async def go():
+        async with AsyncSessionLocal() as db:
+            return await store_attachments(
+                db, received, room_id=room.id, user_id=user.id, username=user.name
+            )
+
+    return run(go())
+
+
+def _broken():
+    # Passes the upsert, then fails moving its file into place
+    r = _received(os.urandom(16))
+    os.remove(r.tmp_path)
+    return r
+
+
+def test_identical_uploads_share_one_blob(client, db, room, token):
+    content = os.urandom(64)
+    paths = []
+    for name in ("one.bin", "two.bin"):
+        res = client.post(
+            "/chat/upload",
+            data={"room_id": room.id},
+            files={"files": (name, content)},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        assert res.status_code == 200
+        paths.append(res.json()[0]["url"].removeprefix("/files/"))
+
+    assert paths[0] == paths[1]
+    assert db.get(models.Blob, paths[0]).refcount == 2
+
+
+def test_rollback_removes_blobs_it_created(db, room, user):
+    r = _received(os.urandom(32))
+    rel = blob_rel_path(r.digest, ".bin")
+    with pytest.raises(OSError):
+        _store(room, user, [r, _broken()])
+
+    assert not os.path.exists(os.path.join(settings.upload_dir, rel))
+    assert db.get(models.Blob, rel) is None
+
+
+def test_rollback_keeps_restored_file_of_existing_blob(db, room, user):
+    content = os.urandom(32)
+    (att,) = _store(room, user, [_received(content)])
+    abs_path = os.path.join(settings.upload_dir, att.stored_path)
+    # The file of a blob committed rows use has gone missing
+    os.remove(abs_path)
+
+    with pytest.raises(OSError):
+        _store(room, user, [_received(content), _broken()])
+
+    db.expire_all()
+    assert os.path.exists(abs_path)
+    assert db.get(models.Blob, att.stored_path).refcount == 1
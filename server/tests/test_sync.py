@@ -0,0 +1,100 @@
+import pytest
+from app import models
+from app.history_cache import history_cache
+
+
+@pytest.fixture(autouse=True)
+def no_history_cache():
+    size = history_cache.room_size
+    history_cache.room_size = 0
+    yield
+    history_cache.room_size = size
+
+
+def _messages(db, room, user, n):
+    msgs = [
+        models.Message(room_id=room.id, user_id=user.id, username=user.name, text=f"m{i}")
+        for i in range(n)
+    ]
+    db.add_all(msgs)
+    db.commit()
+    return [m.id for m in msgs]
+
+
+def _attachments(db, room, user, n):
+    atts = [
+        models.Attachment(
+            room_id=room.id, user_id=user.id, username=user.name, original_name=f"f{i}.txt",
+            stored_path=f"blobs/sy/{i}.txt", mime_type="text/plain", size_bytes=1,
+        )
+        for i in range(n)
+    ]
+    db.add_all(atts)
+    db.commit()
+    return [a.id for a in atts]
+
+
+def _sync(client, room, **params):
+    r = client.get("/chat/sync", params={"room_id": room.id, **params})
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def test_cold_start_gets_the_newest_rows(client, db, room, user):
+    ids = _messages(db, room, user, 5)
+    att_ids = _attachments(db, room, user, 3)
+
+    body = _sync(client, room, limit=3)
+    assert [m["id"] for m in body["messages"]] == ids[-3:]
+    assert [a["id"] for a in body["attachments"]] == att_ids
+    assert body["since_id"] == ids[-1] and body["attachments_since_id"] == att_ids[-1]
+    assert body["attachments_min_id"] == att_ids[0]
+    # Older rows are left for /chat/messages; nothing newer is missing
+    assert body["has_more"] is False
+
+
+def test_empty_room(client, room):
+    body = _sync(client, room)
+    assert body["messages"] == [] and body["attachments"] == []
+    assert body["since_id"] is None and body["attachments_since_id"] is None
+    assert body["attachments_min_id"] is None and body["has_more"] is False
+
+
+def test_cursors_return_only_newer_rows(client, db, room, user):
+    ids = _messages(db, room, user, 3)
+    att_ids = _attachments(db, room, user, 2)
+    body = _sync(client, room, since_id=ids[0], attachments_since_id=att_ids[0])
+    assert [m["id"] for m in body["messages"]] == ids[1:]
+    assert [a["id"] for a in body["attachments"]] == att_ids[1:]
+    assert body["attachments_min_id"] == att_ids[0] and body["has_more"] is False
+
+    # Nothing new: the cursors come back unchanged
+    body = _sync(client, room, since_id=ids[-1], attachments_since_id=att_ids[-1])
+    assert body["messages"] == [] and body["attachments"] == []
+    assert (body["since_id"], body["attachments_since_id"]) == (ids[-1], att_ids[-1])
+
+
+def test_truncated_catch_up_sets_has_more(client, db, room, user):
+    ids = _messages(db, room, user, 5)
+    body = _sync(client, room, since_id=0, limit=2)
+    assert [m["id"] for m in body["messages"]] == ids[:2] and body["has_more"]
+
+    seen = [m["id"] for m in body["messages"]]
+    while body["has_more"]:
+        body = _sync(client, room, since_id=body["since_id"], limit=2)
+        seen += [m["id"] for m in body["messages"]]
+    assert seen == ids
+
+    att_ids = _attachments(db, room, user, 3)
+    body = _sync(client, room, since_id=ids[-1], attachments_since_id=0, limit=2)
+    assert [a["id"] for a in body["attachments"]] == att_ids[:2] and body["has_more"]
+
+
+def test_attachments_min_id_shows_expired_rows(client, db, room, user):
+    att_ids = _attachments(db, room, user, 3)
+    db.query(models.Attachment).filter(models.Attachment.id.in_(att_ids[:2])).delete()
+    db.commit()
+    body = _sync(client, room, attachments_since_id=0)
+    # A client drops its cached attachments below this id
+    assert body["attachments_min_id"] == att_ids[2]
+    assert [a["id"] for a in body["attachments"]] == att_ids[2:]
@@ -0,0 +1,121 @@
+import os
+import uuid
+import pytest
+from app import models
+
+
+@pytest.fixture
+def auth(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def emitted(monkeypatch):
+    sent = []
+
+    async def emit(event, data, **kwargs):
+        sent.append((event, data))
+
+    monkeypatch.setattr("app.routes_uploads.broadcasts.emit", emit)
+    return sent
+
+
+def _create(client, auth, room, content, name="f.bin"):
+    res = client.post(
+        "/chat/uploads",
+        data={"room_id": room.id, "filename": name, "size_bytes": len(content)},
+        headers=auth,
+    )
+    assert res.status_code == 200
+    return res.json()["id"]
+
+
+def _put(client, auth, upload_id, offset, chunk):
+    return client.put(f"/chat/uploads/{upload_id}", params={"offset": offset}, content=chunk, headers=auth)
+
+
+def test_chunks_resume_from_the_server_offset(client, auth, room, emitted):
+    content = os.urandom(1000)
+    upload_id = _create(client, auth, room, content)
+
+    assert _put(client, auth, upload_id, 0, content[:400]).json()["offset"] == 400
+    # A resend of an old range is refused with the offset to resume from
+    res = _put(client, auth, upload_id, 0, content[:400])
+    assert res.status_code == 409 and res.json()["detail"]["offset"] == 400
+    assert client.get(f"/chat/uploads/{upload_id}", headers=auth).json()["offset"] == 400
+
+    # Not finished yet
+    assert client.post(f"/chat/uploads/{upload_id}/complete", headers=auth).status_code == 409
+    assert _put(client, auth, upload_id, 400, content[400:]).json()["offset"] == 1000
+    assert _put(client, auth, upload_id, 1000, b"x").status_code == 413
+
+    res = client.post(f"/chat/uploads/{upload_id}/complete", headers=auth)
+    assert res.status_code == 200 and res.json()["size_bytes"] == 1000
+    assert [e for e, _ in emitted] == ["file_uploaded"]
+    assert client.get(res.json()["url"]).content == content
+    assert client.get(f"/chat/uploads/{upload_id}", headers=auth).status_code == 404
+
+
+def test_batch_complete_emits_once(client, auth, room, emitted, db):
+    contents = [os.urandom(10), os.urandom(20), os.urandom(30)]
+    ids = [_create(client, auth, room, c, f"{i}.bin") for i, c in enumerate(contents)]
+    for upload_id, c in zip(ids, contents):
+        _put(client, auth, upload_id, 0, c)
+
+    res = client.post("/chat/uploads/complete", data={"ids": ids}, headers=auth)
+    assert res.status_code == 200
+    assert [a["size_bytes"] for a in res.json()] == [10, 20, 30]
+    assert [(e, len(d["items"])) for e, d in emitted] == [("files_uploaded", 3)]
+    assert all(db.get(models.UploadSession, i) is None for i in ids)
+
+
+def test_batch_rejects_unfinished_or_mixed_uploads(client, auth, room, user, db, emitted):
+    other = models.Room(id=str(uuid.uuid4()), name=uuid.uuid4().hex[:12], country_code="US", created_by=user.id)
+    db.add(other)
+    db.commit()
+    a = _create(client, auth, room, b"abc")
+    b = _create(client, auth, other, b"abc")
+    _put(client, auth, a, 0, b"abc")
+    _put(client, auth, b, 0, b"abc")
+    assert client.post("/chat/uploads/complete", data={"ids": [a, b]}, headers=auth).status_code == 400
+
+    c = _create(client, auth, room, b"abcdef")
+    res = client.post("/chat/uploads/complete", data={"ids": [a, c]}, headers=auth)
+    assert res.status_code == 409 and res.json()["detail"] == {
+        "message": "Offset mismatch, resume from the reported offset", "offset": 0, "id": c
+    }
+    assert emitted == []
+
+
+def test_failed_finalize_keeps_the_data_for_a_retry(client, auth, room, emitted, db, monkeypatch):
+    from app import storage
+
+    contents = [os.urandom(10), os.urandom(20)]
+    ids = [_create(client, auth, room, c, f"{i}.bin") for i, c in enumerate(contents)]
+    for upload_id, c in zip(ids, contents):
+        _put(client, auth, upload_id, 0, c)
+
+    real = storage.add_blob_ref
+    calls = []
+
+    async def flaky(*args):
+        calls.append(args)
+        outcome = await real(*args)
+        if len(calls) == 2:
+            raise ConnectionError("database went away")
+        return outcome
+
+    monkeypatch.setattr(storage, "add_blob_ref", flaky)
+    with pytest.raises(ConnectionError):
+        client.post("/chat/uploads/complete", data={"ids": ids}, headers=auth)
+
+    db.expire_all()
+    assert all(db.get(models.UploadSession, i) is not None for i in ids)
+    assert all(os.path.exists(storage.incoming_path(i)) for i in ids)
+    assert emitted == []
+
+    monkeypatch.setattr(storage, "add_blob_ref", real)
+    res = client.post("/chat/uploads/complete", data={"ids": ids}, headers=auth)
+    assert res.status_code == 200
+    assert [client.get(a["url"]).content for a in res.json()] == contents
+    assert not any(os.path.exists(storage.incoming_path(i)) for i in ids)
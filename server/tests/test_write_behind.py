@@ -0,0 +1,109 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+import pytest
+from fastapi import HTTPException
+from app import models
+from app.archive import _archive_room, message_archive
+from app.db import AsyncSessionLocal
+from app.messaging import store_message
+from app.write_behind import MessageWriter, _IdAllocator
+from conftest import run
+
+
+def test_concurrent_ids_share_a_round_trip():
+    ids = _IdAllocator()
+    calls = []
+    reserve = ids._reserve
+
+    async def counting(n):
+        calls.append(n)
+        return await reserve(n)
+
+    ids._reserve = counting
+
+    async def go():
+        return await asyncio.gather(*(ids.next() for _ in range(50)))
+
+    got = run(go())
+    assert got == list(range(got[0], got[0] + 50))
+    assert calls == [50]
+
+
+def test_workers_allocate_in_arrival_order():
+    # Two allocators stand in for two workers sharing the database
+    a, b = _IdAllocator(), _IdAllocator()
+
+    async def go():
+        return [await a.next(), await b.next(), await a.next(), await b.next()]
+
+    got = run(go())
+    assert got == sorted(got)
+
+
+def test_autoincrement_inserts_follow_allocated_ids(db, room, user):
+    allocated = run(_IdAllocator().next())
+    m = models.Message(room_id=room.id, user_id=user.id, username=user.name, text="direct")
+    db.add(m)
+    db.commit()
+    assert m.id > allocated
+
+
+def _writer():
+    return MessageWriter(batch_size=100, flush_ms=1, queue_size=100, enqueue_timeout_ms=100)
+
+
+def test_rejected_rows_are_refused_before_the_ack(db, room, user, monkeypatch):
+    writer = _writer()
+    monkeypatch.setattr("app.messaging.message_writer", writer)
+
+    async def go():
+        await writer.start()
+        try:
+            async with AsyncSessionLocal() as s:
+                with pytest.raises(HTTPException) as missing:
+                    await store_message(s, "no-such-room", user.id, user.name, "hi")
+                with pytest.raises(HTTPException) as too_long:
+                    await store_message(s, room.id, user.id, user.name, "x" * 5000)
+                ok = await store_message(s, room.id, user.id, user.name, "hi")
+        finally:
+            await writer.stop()
+        return missing.value.status_code, too_long.value.status_code, ok
+
+    missing, too_long, ok = run(go())
+    assert (missing, too_long) == (404, 400)
+    assert writer.persisted == 1 and writer.failures == 0
+    assert db.get(models.Message, ok["id"]).text == "hi"
+
+
+def test_write_behind_ids_stay_above_the_archive(db, room, user, monkeypatch):
+    old = datetime.now(timezone.utc) - timedelta(days=10)
+    rows = [
+        models.Message(room_id=room.id, user_id=user.id, username=user.name, text="old", created_at=old)
+        for _ in range(5)
+    ]
+    db.add_all(rows)
+    db.commit()
+    _archive_room(room.id, datetime.now(timezone.utc) - timedelta(days=1), 100)
+    last = message_archive.last_id(room.id)
+
+    writer = _writer()
+    monkeypatch.setattr("app.messaging.message_writer", writer)
+
+    async def go():
+        await writer.start()
+        try:
+            async with AsyncSessionLocal() as s:
+                return [
+                    (await store_message(s, room.id, user.id, user.name, f"new {i}"))["id"]
+                    for i in range(3)
+                ]
+        finally:
+            await writer.stop()
+
+    ids = run(go())
+    assert min(ids) > last and ids == sorted(ids)
+
+    # A later run leaves the new rows alone
+    _archive_room(room.id, datetime.now(timezone.utc) - timedelta(days=1), 100)
+    db.expire_all()
+    assert sorted(m.id for m in db.query(models.Message).filter_by(room_id=room.id)) == ids